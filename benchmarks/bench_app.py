@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Load benchmark of the App handlers, run against local fakes of DataMall, Groq and Telegram so it
+needs no API keys and can be run offline. For each scenario and each number of chats, every chat
+sends one request at the same time, and the handler latencies (or, for reminders, how late they
+arrive), the throughput and the memory are reported.
+
+    python benchmarks/bench_app.py
+    python benchmarks/bench_app.py --scenarios arrival text_llm --chats 100 1000 --groq_latency 0.5
+"""
+import os
+import sys
+import time
+import uuid
+import random
+import asyncio
+import argparse
+import resource
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "bus_app"))
+from telegram import Bot, Update  # noqa: E402
+from telegram.request import HTTPXRequest  # noqa: E402
+from app_func import App, Outbox, TrackedReminder, get_bus_stop_index  # noqa: E402
+from log_utils import setup_logging  # noqa: E402
+from fake_datamall import FakeDataMall  # noqa: E402
+from fake_groq import FakeGroq  # noqa: E402
+from fake_telegram import BOT_TOKEN, FakeTelegramApi, make_update  # noqa: E402
+
+SCENARIOS = ["arrival", "text_routed", "text_llm", "stop_name", "reminders"]
+FIRST_CHAT_ID = 1000000
+
+
+def percentile(values: list, p: float):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] if values else 0.0
+
+
+def max_rss_mb():
+    # KB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+class Bench:
+    def __init__(self, args):
+        self.args = args
+        self.datamall = FakeDataMall(latency=args.datamall_latency, route_count=0)
+        self.groq = FakeGroq(args.groq_latency, args.groq_token_latency)
+        self.telegram = FakeTelegramApi(latency=args.telegram_latency)
+        rng = random.Random(0)
+        self.bus_stop_codes = rng.sample(list(get_bus_stop_index().codes), args.stops)
+        # Anything fetched from the fake DataMall stays out of data/
+        self.data_dir = tempfile.mkdtemp(prefix="bench_app_")
+
+    async def start(self):
+        self.datamall_url = await self.datamall.start()
+        self.groq_url = await self.groq.start()
+        self.bot = Bot(
+            BOT_TOKEN,
+            base_url=f"{await self.telegram.start()}/bot",
+            request=HTTPXRequest(connection_pool_size=self.args.telegram_pool),
+        )
+        await self.bot.initialize()
+
+    async def stop(self):
+        await self.bot.shutdown()
+        await self.telegram.stop()
+        await self.groq.stop()
+        await self.datamall.stop()
+
+    def make_app(self):
+        outbox = None
+        if not self.args.telegram_limits:
+            # Measure the bot rather than Telegram's flood limits
+            outbox = Outbox(global_rate=1e9, chat_burst=1000)
+        app = App(
+            lta_api_key="bench",
+            bus_stop_code=self.bus_stop_codes[0],
+            bus_service_no="199",
+            groq_api_key="bench",
+            lta_base_url=self.datamall_url,
+            groq_base_url=self.groq_url,
+            outbox=outbox,
+            route_file=os.path.join(self.data_dir, "bus_routes.bin"),
+        )
+        # Normally set in post_init, which also fetches missing routes from DataMall
+        app._bot = self.bot
+        return app
+
+    def request(self, app, scenario: str, i: int):
+        chat_id = FIRST_CHAT_ID + i
+        code = self.bus_stop_codes[i % len(self.bus_stop_codes)]
+        if scenario == "arrival":
+            update = Update.de_json(make_update(i, chat_id, f"/bus 199 {code}"), self.bot)
+            return lambda: app.bus_arrival_async(update, None, args_list=["199", code])
+        if scenario == "text_routed":
+            update = Update.de_json(make_update(i, chat_id, f"when is 199 coming at {code}"), self.bot)
+            return lambda: app.handle_text(update, None)
+        if scenario == "text_llm":
+            # Different in every chat, so the LLM response cache does not answer them
+            update = Update.de_json(make_update(i, chat_id, f"Tell me something about bus stop {code} #{i}"), self.bot)
+            return lambda: app.handle_text(update, None)
+        if scenario == "stop_name":
+            update = Update.de_json(make_update(i, chat_id, f"what is the name of {code}"), self.bot)
+            return lambda: app.bus_stop_code_to_name_async(update, None, args_list=[code])
+        raise ValueError(f"Unknown scenario {scenario}")
+
+    async def run_handlers(self, app, scenario: str, chats: int):
+        requests = [self.request(app, scenario, i) for i in range(chats)]
+        latencies = []
+
+        async def timed(request):
+            start = time.perf_counter()
+            await request()
+            latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*[timed(request) for request in requests], return_exceptions=True)
+        elapsed = time.perf_counter() - start
+        errors = [result for result in results if isinstance(result, BaseException)]
+        return latencies, elapsed, errors
+
+    async def run_reminders(self, app, chats: int):
+        # Every chat gets a reminder due at the same moment, the latency is how late it is delivered
+        lead = self.args.reminder_lead
+        wall_start, perf_start = time.time(), time.perf_counter()
+        est_arrival = wall_start + lead + 60.0
+        app.schedule_reminders(
+            [
+                TrackedReminder(uuid.uuid4().hex, FIRST_CHAT_ID + i, "199", self.bus_stop_codes[0], 1.0, est_arrival)
+                for i in range(chats)
+            ]
+        )
+        scheduled = time.perf_counter() - perf_start
+        if scheduled > lead:
+            print(f"  scheduling took {scheduled:.2f} s, longer than --reminder_lead")
+
+        due = perf_start + lead
+        deadline = due + self.args.max_level_secs
+        chat_ids = range(FIRST_CHAT_ID, FIRST_CHAT_ID + chats)
+        while time.perf_counter() < deadline:
+            if all(chat_id in self.telegram.sent_at for chat_id in chat_ids):
+                break
+            await asyncio.sleep(0.05)
+
+        latencies = [max(self.telegram.sent_at[chat_id][-1] - due, 0.0) for chat_id in chat_ids if chat_id in self.telegram.sent_at]
+        elapsed = max(latencies, default=0.0) + scheduled
+        missing = chats - len(latencies)
+        return latencies, elapsed, [TimeoutError()] * missing
+
+    async def run_level(self, scenario: str, chats: int):
+        self.telegram.sent_at.clear()
+        app = self.make_app()
+        upstream = (dict(self.datamall.requests), self.groq.requests, dict(self.telegram.calls))
+        if self.args.tracemalloc:
+            tracemalloc.start()
+        try:
+            if scenario == "reminders":
+                latencies, elapsed, errors = await self.run_reminders(app, chats)
+            else:
+                latencies, elapsed, errors = await self.run_handlers(app, scenario, chats)
+            await app.shutdown()
+        finally:
+            traced = None
+            if self.args.tracemalloc:
+                traced = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+                tracemalloc.stop()
+
+        datamall_calls = sum(self.datamall.requests.values()) - sum(upstream[0].values())
+        groq_calls = self.groq.requests - upstream[1]
+        telegram_calls = sum(self.telegram.calls.values()) - sum(upstream[2].values())
+        memory = f"max rss {max_rss_mb():.0f} MB" + (f", traced peak {traced:.1f} MB" if traced is not None else "")
+        print(
+            f"{scenario:<12} {chats:>6} chats | {elapsed:6.2f} s {len(latencies) / elapsed if elapsed else 0:8.0f}/s | "
+            f"p50 {percentile(latencies, 0.5) * 1000:8.1f} ms p99 {percentile(latencies, 0.99) * 1000:8.1f} ms "
+            f"max {max(latencies, default=0.0) * 1000:8.1f} ms | errors {len(errors)} | "
+            f"upstream datamall {datamall_calls} groq {groq_calls} telegram {telegram_calls} | {memory}"
+        )
+        if errors and self.args.verbose:
+            print(f"  first error: {errors[0]!r}")
+        return elapsed
+
+
+async def main(args):
+    if args.verbose:
+        setup_logging("DEBUG")
+    bench = Bench(args)
+    await bench.start()
+    try:
+        for scenario in args.scenarios:
+            chat_counts = sorted(args.chats)
+            for i, chats in enumerate(chat_counts):
+                elapsed = await bench.run_level(scenario, chats)
+                # At least linear in the load, so the next run would take this much or longer
+                projected = elapsed * chat_counts[i + 1] / chats if i + 1 < len(chat_counts) else 0.0
+                if projected > args.max_level_secs:
+                    print(f"{scenario:<12} skipping larger loads, {chat_counts[i + 1]} chats would take over {projected:.0f} s")
+                    break
+    finally:
+        await bench.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--chats", type=int, nargs="+", default=[1, 10, 100, 1000, 10000], help="Concurrent chats per run.")
+    parser.add_argument("--stops", type=int, default=200, help="Number of different bus stops the chats ask about.")
+    parser.add_argument("--datamall_latency", type=float, default=0.05, help="Secs added to every DataMall answer.")
+    parser.add_argument("--groq_latency", type=float, default=0.2, help="Secs before Groq's first token.")
+    parser.add_argument("--groq_token_latency", type=float, default=0.005, help="Secs between Groq's tokens.")
+    parser.add_argument("--telegram_latency", type=float, default=0.02, help="Secs added to every Bot API answer.")
+    parser.add_argument("--telegram_pool", type=int, default=256, help="Bot API connections, 256 like Application.builder().")
+    parser.add_argument("--telegram_limits", action="store_true", help="Keep the Outbox's Telegram flood limits.")
+    parser.add_argument("--reminder_lead", type=float, default=2.0, help="Secs from scheduling to the reminders being due.")
+    parser.add_argument("--max_level_secs", type=float, default=120.0, help="Larger loads of a scenario are skipped if they would run longer.")
+    parser.add_argument("--tracemalloc", action="store_true", help="Also report the peak traced memory, slows the run down.")
+    parser.add_argument("--verbose", action="store_true", help="Log what the handlers do, like app.py --log_level DEBUG.")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Webhook ingestion benchmark: a fake Telegram sender posts updates of many chats to the webhook
+server while handlers reply through a fake Bot API, so nothing reaches the real Telegram.
+
+    python benchmarks/bench_webhook.py --updates 2000 --chats 200 --handler_delay 0.05
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "bus_app"))
+from telegram.ext import Application, MessageHandler, filters  # noqa: E402
+from webhook import ChatOrderedUpdateProcessor, WebhookServer  # noqa: E402
+from fake_telegram import BOT_TOKEN, FakeTelegramApi, UpdateSender, make_update  # noqa: E402
+
+
+def percentile(values: list, p: float):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] if values else 0.0
+
+
+async def run(updates: int, chats: int, concurrent_updates: int, sender_concurrency: int, handler_delay: float):
+    api = FakeTelegramApi()
+    api_url = await api.start()
+    application = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .base_url(f"{api_url}/bot")
+        .updater(None)
+        .concurrent_updates(ChatOrderedUpdateProcessor(concurrent_updates))
+        .build()
+    )
+
+    started_at, done_at = {}, {}
+    out_of_order = 0
+    last_seen = {}
+
+    async def handler(update, context):
+        nonlocal out_of_order
+        started_at[update.update_id] = time.perf_counter()
+        chat_id = update.effective_chat.id
+        if last_seen.get(chat_id, -1) > update.update_id:
+            out_of_order += 1
+        last_seen[chat_id] = update.update_id
+        await asyncio.sleep(handler_delay)  # stands in for LTA/LLM round trips
+        await update.message.reply_text("ok")
+        done_at[update.update_id] = time.perf_counter()
+
+    application.add_handler(MessageHandler(filters.TEXT, handler))
+    server = WebhookServer(application, host="127.0.0.1", port=0)
+    async with application:
+        await application.start()
+        port = await server.start()
+        sender = UpdateSender(f"http://127.0.0.1:{port}/telegram", sender_concurrency)
+
+        batch = [make_update(i, 1000 + i % chats, "when is 199 coming") for i in range(updates)]
+        start = time.perf_counter()
+        await sender.send(batch)
+        ingested = time.perf_counter() - start
+        while len(done_at) < updates - sender.failed:
+            await asyncio.sleep(0.01)
+        elapsed = time.perf_counter() - start
+
+        await server.stop()
+        await application.stop()
+    await api.stop()
+
+    ingestion = [(started_at[i] - sender.sent_at[i]) * 1000 for i in started_at]
+    end_to_end = [(done_at[i] - sender.sent_at[i]) * 1000 for i in done_at]
+    print(
+        f"concurrent_updates={concurrent_updates:<4} posted {updates} updates of {chats} chats in {ingested:.2f} s "
+        f"({updates / ingested:.0f}/s), handled in {elapsed:.2f} s ({len(done_at) / elapsed:.0f}/s) | "
+        f"queue->handler p50 {percentile(ingestion, 0.5):.1f} ms p99 {percentile(ingestion, 0.99):.1f} ms | "
+        f"end-to-end p50 {percentile(end_to_end, 0.5):.1f} ms p99 {percentile(end_to_end, 0.99):.1f} ms | "
+        f"failed {sender.failed}, out of order {out_of_order}, replies {api.calls.get('sendMessage', 0)}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--updates", type=int, default=1000)
+    parser.add_argument("--chats", type=int, default=100)
+    parser.add_argument("--sender_concurrency", type=int, default=50)
+    parser.add_argument("--handler_delay", type=float, default=0.02, help="Secs each handler waits, like an upstream call.")
+    parser.add_argument("--concurrent_updates", type=int, nargs="+", default=[1, 32, 256])
+    args = parser.parse_args()
+
+    for concurrent_updates in args.concurrent_updates:
+        asyncio.run(run(args.updates, args.chats, concurrent_updates, args.sender_concurrency, args.handler_delay))
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+import os
+import csv
+import glob
+import random
+import asyncio
+import argparse
+from datetime import datetime, timedelta, timezone
+from aiohttp import web
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
+BUS_STOP_FILE = os.path.join(DATA_DIR, "bus_stop.csv")
+PAGE_SIZE = 500
+SGT = timezone(timedelta(hours=8))
+
+
+class FakeDataMall:
+    """
+    Local stand-in for the LTA DataMall endpoints the bot uses, serving the stops of bus_stop.csv.
+
+    - GET /BusStops?$skip=N: pages of PAGE_SIZE stops
+    - GET /BusRoutes?$skip=N: pages of PAGE_SIZE route stops, the hand-made *_route.csv routes plus
+      route_count made-up services over random stops
+    - GET /v3/BusArrival?BusStopCode=...&ServiceNo=...: made-up arrivals of a few services
+
+    latency (secs) is added to every answer and error_rate of the requests are answered with 503,
+    to exercise the client's retries.
+    """
+
+    def __init__(
+        self,
+        bus_stop_file: str = BUS_STOP_FILE,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        services: tuple = ("199", "179", "179A", "243G"),
+        route_count: int = 300,
+    ):
+        with open(bus_stop_file, "r", newline="") as f:
+            self.bus_stops = [
+                {
+                    "BusStopCode": row["BusStopCode"],
+                    "RoadName": row["RoadName"],
+                    "Description": row["Description"],
+                    "Latitude": float(row["Latitude"]),
+                    "Longitude": float(row["Longitude"]),
+                }
+                for row in csv.DictReader(f)
+            ]
+        self.bus_routes = self._make_bus_routes(route_count)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.services = services
+        self.requests = {}  # path -> count
+        self._runner = None
+
+        self.app = web.Application()
+        self.app.router.add_get("/BusStops", self.bus_stops_handler)
+        self.app.router.add_get("/BusRoutes", self.bus_routes_handler)
+        self.app.router.add_get("/v3/BusArrival", self.bus_arrival_handler)
+
+    def _make_bus_routes(self, route_count: int):
+        routes = {}
+        for file_path in sorted(glob.glob(os.path.join(DATA_DIR, "*_route.csv"))):
+            with open(file_path, "r") as f:
+                routes[os.path.basename(file_path).split("_")[0]] = [line.split(",")[0] for line in f if line.strip()]
+        rng = random.Random(0)
+        codes = [bus_stop["BusStopCode"] for bus_stop in self.bus_stops]
+        for i in range(route_count):
+            routes.setdefault(str(900 + i), rng.sample(codes, rng.randint(20, 60)))
+
+        records = []
+        for service, stops in routes.items():
+            for direction, route in enumerate([stops, stops[::-1]], start=1):
+                for sequence, bus_stop_code in enumerate(route, start=1):
+                    records.append(
+                        {
+                            "ServiceNo": service,
+                            "Operator": "SBST",
+                            "Direction": direction,
+                            "StopSequence": sequence,
+                            "BusStopCode": bus_stop_code,
+                            "Distance": round(0.4 * (sequence - 1), 1),
+                            "WD_FirstBus": "0530",
+                            "WD_LastBus": "2330",
+                            "SAT_FirstBus": "0530",
+                            "SAT_LastBus": "2330",
+                            "SUN_FirstBus": "0530",
+                            "SUN_LastBus": "2330",
+                        }
+                    )
+        return records
+
+    async def _delay(self, request):
+        self.requests[request.path] = self.requests.get(request.path, 0) + 1
+        if self.latency > 0:
+            await asyncio.sleep(self.latency)
+        if self.error_rate > 0 and random.random() < self.error_rate:
+            raise web.HTTPServiceUnavailable()
+
+    async def bus_stops_handler(self, request):
+        await self._delay(request)
+        skip = int(request.query.get("$skip", 0))
+        return web.json_response({"value": self.bus_stops[skip : skip + PAGE_SIZE]})
+
+    async def bus_routes_handler(self, request):
+        await self._delay(request)
+        skip = int(request.query.get("$skip", 0))
+        return web.json_response({"value": self.bus_routes[skip : skip + PAGE_SIZE]})
+
+    async def bus_arrival_handler(self, request):
+        await self._delay(request)
+        bus_stop_code = request.query.get("BusStopCode", "")
+        services = self.services
+        if request.query.get("ServiceNo"):
+            services = [service for service in services if service == request.query["ServiceNo"]]
+
+        now = datetime.now(SGT).replace(microsecond=0)
+        # Stable per stop and service within a minute, so repeated polls see the same buses
+        rng = random.Random(f"{bus_stop_code}{now:%Y%m%d%H%M}")
+        answer = []
+        for service in services:
+            first = rng.randint(1, 15)
+            next_buses = {}
+            for i, key in enumerate(["NextBus", "NextBus2", "NextBus3"]):
+                est_arrival = now + timedelta(minutes=first + 10 * i)
+                next_buses[key] = {
+                    "OriginCode": "22009",
+                    "DestinationCode": "22009",
+                    "EstimatedArrival": est_arrival.isoformat(),
+                    "Monitored": 1,
+                    "Latitude": "0.0",
+                    "Longitude": "0.0",
+                    "VisitNumber": "1",
+                    "Load": rng.choice(["SEA", "SDA", "LSD"]),
+                    "Feature": "WAB",
+                    "Type": rng.choice(["SD", "DD", "BD"]),
+                }
+            answer.append({"ServiceNo": service, "Operator": "SBST", **next_buses})
+        return web.json_response({"BusStopCode": bus_stop_code, "Services": answer})
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0):
+        """Starts serving and returns the base URL to hand to LtaClient."""
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        return f"http://{host}:{port}"
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0, help="Secs added to every answer.")
+    parser.add_argument("--error_rate", type=float, default=0.0, help="Share of requests answered with 503.")
+    args = parser.parse_args()
+
+    async def main():
+        fake = FakeDataMall(latency=args.latency, error_rate=args.error_rate)
+        print(f"Fake DataMall serving {len(fake.bus_stops)} bus stops and {len(fake.bus_routes)} route stops at {await fake.start(args.host, args.port)}")
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await fake.stop()
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+import json
+import time
+import asyncio
+import argparse
+import itertools
+from aiohttp import web
+
+DEFAULT_REPLY = "I am WhenIs199Coming, a bot that tells you when your bus is coming and reminds you before it arrives."
+
+
+class FakeGroq:
+    """
+    Local stand-in for the Groq chat completions endpoint, hand its URL to LLM(base_url=...).
+
+    Streaming requests get the reply word by word as server-sent events, first_token_latency
+    (secs) after the request and token_latency apart, like a real model; others get it at once.
+    replies maps a substring of the last user message to the reply for it, e.g. to answer with a
+    function call; every other message gets default_reply.
+    """
+
+    def __init__(
+        self,
+        first_token_latency: float = 0.0,
+        token_latency: float = 0.0,
+        replies: dict = {},
+        default_reply: str = DEFAULT_REPLY,
+    ):
+        self.first_token_latency = first_token_latency
+        self.token_latency = token_latency
+        self.replies = replies
+        self.default_reply = default_reply
+        self.requests = 0
+        self.disconnects = 0
+        self._ids = itertools.count(1)
+        self._runner = None
+
+        self.app = web.Application()
+        self.app.router.add_post("/openai/v1/chat/completions", self.completions_handler)
+
+    def reply_for(self, messages: list):
+        text = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+        return next((reply for key, reply in self.replies.items() if key in text), self.default_reply)
+
+    def _chunk(self, completion_id: str, model: str, delta: dict, finish_reason: str = None):
+        return {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "logprobs": None, "finish_reason": finish_reason}],
+        }
+
+    async def completions_handler(self, request):
+        self.requests += 1
+        body = await request.json()
+        reply = self.reply_for(body.get("messages", []))
+        completion_id = f"chatcmpl-{next(self._ids)}"
+        model = body.get("model", "fake")
+        if self.first_token_latency > 0:
+            await asyncio.sleep(self.first_token_latency)
+
+        if not body.get("stream"):
+            words = len(reply.split())
+            if self.token_latency > 0:
+                await asyncio.sleep(self.token_latency * words)
+            return web.json_response(
+                {
+                    "id": completion_id,
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {"role": "assistant", "content": reply},
+                            "logprobs": None,
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    "usage": {"prompt_tokens": 0, "completion_tokens": words, "total_tokens": words},
+                }
+            )
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+
+        async def send(data):
+            await response.write(f"data: {json.dumps(data) if isinstance(data, dict) else data}\n\n".encode())
+
+        try:
+            await response.prepare(request)
+            await send(self._chunk(completion_id, model, {"role": "assistant", "content": ""}))
+            for i, word in enumerate(reply.split(" ")):
+                if i > 0 and self.token_latency > 0:
+                    await asyncio.sleep(self.token_latency)
+                await send(self._chunk(completion_id, model, {"content": word if i == 0 else " " + word}))
+            await send(self._chunk(completion_id, model, {}, "stop"))
+            await send("[DONE]")
+            await response.write_eof()
+        except ConnectionResetError:
+            # The client gave up, e.g. timed out
+            self.disconnects += 1
+        return response
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0):
+        """Starts serving and returns the base URL to hand to LLM."""
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        return f"http://{host}:{self._runner.addresses[0][1]}"
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--first_token_latency", type=float, default=0.2, help="Secs before the first token.")
+    parser.add_argument("--token_latency", type=float, default=0.01, help="Secs between tokens.")
+    args = parser.parse_args()
+
+    async def main():
+        fake = FakeGroq(args.first_token_latency, args.token_latency)
+        print(f"Fake Groq serving at {await fake.start(args.host, args.port)}")
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await fake.stop()
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
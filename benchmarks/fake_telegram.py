@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+import time
+import asyncio
+import itertools
+import aiohttp
+from aiohttp import web
+
+BOT_TOKEN = "123456:TEST"
+
+
+class FakeTelegramApi:
+    """
+    Local stand-in for the Telegram Bot API. Answers the methods the bot calls with plausible
+    results and counts them; hand f"{base_url}/bot" to ApplicationBuilder.base_url.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = {}  # method -> count
+        self.sent_at = {}  # chat id -> perf_counter times of the messages sent to it
+        self._message_ids = itertools.count(1)
+        self._file_ids = itertools.count(1)
+        self._runner = None
+
+        self.app = web.Application(client_max_size=32 * 1024 * 1024)
+        self.app.router.add_post("/bot{token}/{method}", self.handle)
+        self.app.router.add_get("/bot{token}/{method}", self.handle)
+
+    def _message(self, chat_id, text: str = None):
+        message = {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id), "type": "private"},
+            "from": {"id": 123456, "is_bot": True, "first_name": "Bus Bot"},
+        }
+        if text is not None:
+            message["text"] = text
+        return message
+
+    async def handle(self, request):
+        method = request.match_info["method"]
+        self.calls[method] = self.calls.get(method, 0) + 1
+        if self.latency > 0:
+            await asyncio.sleep(self.latency)
+        if request.content_type.startswith("multipart/"):
+            data = {}
+            async for part in await request.multipart():
+                data[part.name] = (await part.read()).decode("utf-8", "replace") if part.filename is None else None
+        elif request.can_read_body:
+            data = await request.json() if request.content_type == "application/json" else dict(await request.post())
+        else:
+            data = dict(request.query)
+
+        if method in ("sendMessage", "sendPhoto"):
+            self.sent_at.setdefault(int(data.get("chat_id", 0)), []).append(time.perf_counter())
+
+        if method == "getMe":
+            result = {
+                "id": 123456,
+                "is_bot": True,
+                "first_name": "Bus Bot",
+                "username": "bus_bot",
+                "can_join_groups": True,
+                "can_read_all_group_messages": False,
+                "supports_inline_queries": False,
+            }
+        elif method in ("sendMessage", "editMessageText"):
+            result = self._message(data.get("chat_id", 0), data.get("text", ""))
+        elif method == "sendPhoto":
+            result = self._message(data.get("chat_id", 0))
+            file_id = f"file{next(self._file_ids)}"
+            result["photo"] = [{"file_id": file_id, "file_unique_id": file_id, "width": 640, "height": 640}]
+        elif method == "getUpdates":
+            result = []
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0):
+        """Starts serving and returns the base URL (without /bot)."""
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        return f"http://{host}:{self._runner.addresses[0][1]}"
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+def make_update(update_id: int, chat_id: int, text: str = None, location: tuple = None):
+    """A Telegram Update of a private text (or location) message, as it arrives by webhook."""
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": chat_id, "type": "private", "first_name": "Rider"},
+        "from": {"id": chat_id, "is_bot": False, "first_name": "Rider"},
+    }
+    if location is not None:
+        message["location"] = {"latitude": location[0], "longitude": location[1]}
+    else:
+        message["text"] = text or "hi"
+        if message["text"].startswith("/"):
+            command = message["text"].split()[0]
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(command)}]
+    return {"update_id": update_id, "message": message}
+
+
+class UpdateSender:
+    """Posts updates to a webhook like Telegram does, up to concurrency at a time, recording when each was sent."""
+
+    def __init__(self, webhook_url: str, concurrency: int = 50, secret_token: str = None):
+        self._webhook_url = webhook_url
+        self._concurrency = concurrency
+        self._headers = {"X-Telegram-Bot-Api-Secret-Token": secret_token} if secret_token else {}
+        self.sent_at = {}  # update id -> perf_counter time
+        self.failed = 0
+
+    async def send(self, updates: list):
+        queue = asyncio.Queue()
+        for update in updates:
+            queue.put_nowait(update)
+
+        async with aiohttp.ClientSession(headers=self._headers) as session:
+
+            async def worker():
+                while not queue.empty():
+                    update = queue.get_nowait()
+                    self.sent_at[update["update_id"]] = time.perf_counter()
+                    async with session.post(self._webhook_url, json=update) as response:
+                        if response.status != 200:
+                            self.failed += 1
+
+            await asyncio.gather(*[worker() for _ in range(self._concurrency)])
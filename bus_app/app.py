@@ -1,26 +1,46 @@
 #!/usr/bin/env python3
 import os
+import asyncio
+import logging
 import argparse
+import tempfile
 from telegram.ext import Application, CommandHandler, MessageHandler, filters
 from colorama import Fore
 from app_func import *
+from webhook import ChatOrderedUpdateProcessor, run_webhook
+from log_utils import setup_logging
 
 LTA_API_KEY = os.environ.get("LTA_API_KEY")
 TELEGRAM_TOKEN = os.environ.get("TELEGRAM_TOKEN")
+TELEGRAM_WEBHOOK_SECRET = os.environ.get("TELEGRAM_WEBHOOK_SECRET")
 GROQ_API_KEY = os.environ.get("GROQ_API_KEY")
+# Comma-separated chat ids allowed to use /profile
+ADMIN_CHAT_IDS = [int(chat_id) for chat_id in os.environ.get("BUS_APP_ADMIN_IDS", "").split(",") if chat_id.strip()]
+# Profile the handlers for this many secs from start, e.g. to catch a slow start
+PROFILE_ON_START = float(os.environ.get("BUS_APP_PROFILE", "0"))
+PROFILE_DIR = os.environ.get("BUS_APP_PROFILE_DIR", DEFAULT_PROFILE_DIR)
+
+logger = logging.getLogger("app")
 
 async def error_handler(update, context):
     # Log the error
-    print(f"An error occurred: {context.error}")
+    logger.error("An error occurred: %s", context.error, exc_info=context.error)
 
     if update is not None and update.message:
         await update.message.reply_text("An unexpected error occurred. Please try again later.")
 
 def main(args):
     print(Fore.GREEN + "Welcome to WhenIs199Coming bus app!" + Fore.RESET)
+    log_listener = setup_logging(args.log_level, args.log_file)
 
     # Create the Application and pass it your bot's token
-    application = Application.builder().token(TELEGRAM_TOKEN).build()
+    # Updates of different chats are handled in parallel, those of one chat in order
+    builder = Application.builder().token(TELEGRAM_TOKEN).concurrent_updates(
+        ChatOrderedUpdateProcessor(args.concurrent_updates)
+    )
+    if args.mode == "webhook":
+        builder = builder.updater(None)
+    application = builder.build()
 
     # Create App Object
     bus_app = App(
@@ -28,23 +48,75 @@ def main(args):
         bus_stop_code=args.bus_stop_code,
         bus_service_no=args.bus_service_no,
         groq_api_key=GROQ_API_KEY,
+        session_backend=(
+            SqliteSessionBackend(args.session_db) if args.session_db else None
+        ),
+        arrival_cache_ttl=args.arrival_cache_ttl,
+        reminder_store=ReminderStore(args.reminder_db),
+        watch_store=WatchStore(args.watch_db),
+        watch_bucket_mins=args.watch_bucket_mins,
+        route_file=args.route_file,
+        llm_response_cache=ResponseCache(file_path=args.llm_cache_db),
+        lta_base_url=args.lta_base_url,
+        groq_base_url=args.groq_base_url,
+        file_id_cache=FileIdCache(args.file_id_db),
+        admin_chat_ids=ADMIN_CHAT_IDS,
+        profile_dir=PROFILE_DIR,
+        profile_on_start=PROFILE_ON_START,
     )
 
-    # Add command handlers
-    application.add_handler(CommandHandler("start", bus_app.start))
-    application.add_handler(CommandHandler("bus", bus_app.bus_arrival_async))
-    application.add_handler(CommandHandler("bus_stop", bus_app.bus_stop_async))
-    application.add_handler(CommandHandler("bus_route", bus_app.send_bus_stop_image_async))
+    # Add command handlers, profiled while /profile runs
+    # (handle_text profiles the LLM prompt and the intent it dispatches to itself)
+    application.add_handler(CommandHandler("start", bus_app.profiled("start", bus_app.start)))
+    application.add_handler(CommandHandler("bus", bus_app.profiled("bus", bus_app.bus_arrival_async)))
+    application.add_handler(CommandHandler("bus_stop", bus_app.profiled("bus_stop", bus_app.bus_stop_async)))
+    application.add_handler(
+        CommandHandler("bus_route", bus_app.profiled("bus_route", bus_app.send_bus_stop_image_async))
+    )
+    application.add_handler(CommandHandler("watch", bus_app.profiled("watch", bus_app.watch_async)))
+    application.add_handler(CommandHandler("unwatch", bus_app.profiled("unwatch", bus_app.remove_watch_async)))
+    application.add_handler(CommandHandler("profile", bus_app.profile_async))
     application.add_handler(
         MessageHandler(filters.TEXT & ~filters.COMMAND, bus_app.handle_text)
     )
+    application.add_handler(MessageHandler(filters.LOCATION, bus_app.profiled("location", bus_app.location_async)))
     application.add_error_handler(error_handler)
 
+    # In webhook mode the webhook server serves /metrics as well
+    metrics_server = MetricsServer(port=args.metrics_port) if args.metrics_port else None
+
+    async def post_init(application):
+        await bus_app.post_init(application)
+        if metrics_server is not None:
+            await metrics_server.start()
+
+    async def post_shutdown(application):
+        if metrics_server is not None:
+            await metrics_server.stop()
+        await bus_app.shutdown()
+
+    application.post_init = post_init
+    application.post_shutdown = post_shutdown
+
     # Run the bot
     try:
-        application.run_polling(timeout=None)
-    except Exception as e:
-        print(e)
+        if args.mode == "webhook":
+            asyncio.run(
+                run_webhook(
+                    application,
+                    host=args.webhook_host,
+                    port=args.webhook_port,
+                    path=args.webhook_path,
+                    webhook_url=args.webhook_url,
+                    secret_token=TELEGRAM_WEBHOOK_SECRET,
+                )
+            )
+        else:
+            application.run_polling(timeout=None)
+    except Exception:
+        logger.exception("The bot stopped with an error")
+    finally:
+        log_listener.stop()
 
     print(Fore.YELLOW + "Bye. Hope to see you soon." + Fore.RESET)
 
@@ -60,5 +132,102 @@ if __name__ == "__main__":
         default="199",
         help="Bus service to be tracked.",
     )  # Default bus service is 199
+    parser.add_argument(
+        "--session_db",
+        default=None,
+        help="SQLite file to persist per-chat sessions in. Sessions are kept in memory only if not set.",
+    )
+    parser.add_argument(
+        "--reminder_db",
+        default=os.path.join(os.path.dirname(__file__), "..", "data", "reminders.db"),
+        help="SQLite file pending reminders are kept in, so that they survive restarts.",
+    )
+    parser.add_argument(
+        "--watch_db",
+        default=os.path.join(os.path.dirname(__file__), "..", "data", "watches.db"),
+        help="SQLite file standing watches (/watch) are kept in.",
+    )
+    parser.add_argument(
+        "--watch_bucket_mins",
+        type=int,
+        default=5,
+        help="Mins between the scheduled arrival updates of a watch. Must divide 60.",
+    )
+    parser.add_argument(
+        "--arrival_cache_ttl",
+        type=float,
+        default=20.0,
+        help="Secs a bus stop's arrival info is shared between requests before it is fetched again.",
+    )
+
+    parser.add_argument(
+        "--log_level",
+        default="INFO",
+        choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+        help="Least severe log level written. DEBUG also logs every reply.",
+    )
+    parser.add_argument("--log_file", default=None, help="File to write the log to, in addition to stdout.")
+    parser.add_argument(
+        "--metrics_port",
+        type=int,
+        default=None,
+        help="Serve metrics for Prometheus at 127.0.0.1:<port>/metrics. In webhook mode they are also served by the webhook server.",
+    )
+
+    parser.add_argument(
+        "--mode",
+        choices=["polling", "webhook"],
+        default="polling",
+        help="Fetch updates by long polling, or receive them on a local webhook server.",
+    )
+    parser.add_argument(
+        "--concurrent_updates",
+        type=int,
+        default=32,
+        help="Max number of updates handled at a time. Updates of one chat are always handled in order.",
+    )
+    parser.add_argument("--webhook_host", default="0.0.0.0", help="Address the webhook server listens on.")
+    parser.add_argument("--webhook_port", type=int, default=8443, help="Port the webhook server listens on.")
+    parser.add_argument("--webhook_path", default="/telegram", help="Path Telegram posts updates to.")
+    parser.add_argument(
+        "--webhook_url",
+        default=None,
+        help="Public URL of the webhook server, registered with Telegram on start. Not registered if not set.",
+    )
+    parser.add_argument(
+        "--lta_base_url",
+        default=LTA_BASE_URL,
+        help="LTA DataMall base URL, e.g. of a local fake DataMall server for testing.",
+    )
+    parser.add_argument(
+        "--route_file",
+        default=None,
+        help="File the bus routes fetched from DataMall are kept in. data/bus_routes.bin for the real DataMall, "
+        "a file in the temp dir for any other --lta_base_url.",
+    )
+    parser.add_argument(
+        "--groq_base_url",
+        default=None,
+        help="Groq API base URL, e.g. of a local fake Groq server for testing. The Groq API if not set.",
+    )
+    parser.add_argument(
+        "--file_id_db",
+        default=None,
+        help="SQLite file to remember Telegram file ids of uploaded images in across restarts.",
+    )
+    parser.add_argument(
+        "--llm_cache_db",
+        default=None,
+        help="SQLite file to keep cached LLM replies in across restarts. Replies are cached in memory only if not set.",
+    )
 
-    main(args=parser.parse_args())
+    args = parser.parse_args()
+    if args.watch_bucket_mins <= 0 or 60 % args.watch_bucket_mins != 0:
+        parser.error("--watch_bucket_mins must divide 60, e.g. 1, 5, 10, 15 or 30")
+    if args.route_file is None:
+        # Routes of a fake DataMall must not replace the real ones in data/
+        if args.lta_base_url.rstrip("/") == LTA_BASE_URL.rstrip("/"):
+            args.route_file = DEFAULT_ROUTE_FILE
+        else:
+            args.route_file = os.path.join(tempfile.mkdtemp(prefix="bus_app_"), "bus_routes.bin")
+    main(args=args)
@@ -1,26 +1,39 @@
 #!/usr/bin/env python3
 import os
-import csv
-import requests
+import uuid
+import logging
+import numpy as np
 from telegram import Update
+from telegram.error import Forbidden
 from app_utils import *
 from text_utils import *
 from llm import *
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from bus_stop_index import *
+from bus_stop_matcher import *
+from bus_stop_geo import *
+from bus_stop_refresher import *
+from route_store import *
+from route_image import *
+from session import *
+from lta_client import *
+from arrival_cache import *
+from arrival_model import *
+from arrival_refresher import *
+from reminder_store import *
+from reminder_scheduler import *
+from outbox import *
+from intent_router import *
+from metrics import *
+from profiler import *
+from watch_table import *
+from watch_store import *
+from watch_scheduler import *
 import asyncio
-from asyncio import get_running_loop
 
+logger = logging.getLogger(__name__)
 
-class App:
-    _bus_arrival = {
-        "199": {
-            "bus_stop_0": {
-                "est_arrival_1": "0",  # wall time
-                "est_arrival_2": "0",  # wall time
-            }
-        }
-    }
 
+class App:
     # Constructor
     def __init__(
         self,
@@ -28,6 +41,20 @@ class App:
         bus_stop_code: str = "",
         bus_service_no: str = "",
         groq_api_key: str = "",
+        session_backend: SessionBackend = None,
+        arrival_cache_ttl: float = 20.0,
+        reminder_store: ReminderStore = None,
+        llm_response_cache: ResponseCache = None,
+        lta_base_url: str = LTA_BASE_URL,
+        file_id_cache: FileIdCache = None,
+        groq_base_url: str = None,
+        outbox: Outbox = None,
+        admin_chat_ids: tuple = (),
+        profile_dir: str = DEFAULT_PROFILE_DIR,
+        profile_on_start: float = 0,
+        watch_store: WatchStore = None,
+        watch_bucket_mins: int = 5,
+        route_file: str = DEFAULT_ROUTE_FILE,
     ):
         # Function_map
         self._param_map = {
@@ -36,8 +63,10 @@ class App:
                     Only fill in <bus_service_no> if the user mentions about the specific bus service number. Only fill in <bus_stop_code>\
                     if the user mentions about the specific bus stop code. If user asks question like: when is 199 coming? You should know \
                     that 199 refers to the bus service number, so you should return BUS_ARRIVAL<199>. If the user asks question like: when \
-                    is 199 arriving at 22009, you should return BUS_ARRIVAL<199><22009>.",
+                    is 199 arriving at 22009, you should return BUS_ARRIVAL<199><22009>. If the user asks about several bus services, \
+                    separate them with commas, e.g. BUS_ARRIVAL<199,179><22009>, or use BUS_ARRIVAL<all><22009> for every bus service at the stop.",
                 "request_retry": 3,
+                # Defaults for new sessions, see self._sessions
                 "bus_service_no": bus_service_no,
                 "bus_stop_code": bus_stop_code,
                 "reminder_mins": [15.0],  # in mins
@@ -100,424 +129,963 @@ class App:
                 "function_architype": "SHOW_BUS_ROUTE<bus_service_number>",
                 "function": self.send_bus_stop_image_async,
             },
-            
+            "GET_BUS_SERVICES_AT_STOP": {
+                "description": "Get the bus services that stop at a bus stop. Trigger when user asks questions like: which buses stop at XXX (bus stop code or name)?",
+                "function_architype": "GET_BUS_SERVICES_AT_STOP<bus_stop>",
+                "function": self.bus_services_at_stop_async,
+            },
+            "GET_STOPS_BETWEEN": {
+                "description": "Get the bus stops a bus service passes through between two bus stops. Trigger when user asks questions like: \
+                    what are the stops between XXX and YYY (bus stop codes or names) on 199?",
+                "function_architype": "GET_STOPS_BETWEEN<bus_service_no><from_bus_stop><to_bus_stop>",
+                "function": self.stops_between_async,
+            },
+            "SET_WATCH": {
+                "description": "Send the bus arrival times of a bus service at a bus stop on a schedule. Trigger when user asks questions like: \
+                    notify me about 199 at 27011 every weekday 07:30-08:30. The days are weekdays, weekends, daily or a list such as mon,wed,fri.",
+                "function_architype": "SET_WATCH<bus_service_no><bus_stop><HH:MM-HH:MM><days>",
+                "function": self.set_watch_async,
+            },
+            "GET_WATCHES": {
+                "description": "List the scheduled bus arrival updates (watches) that were already set.",
+                "function_architype": "GET_WATCHES",
+                "function": self.get_watches_async,
+            },
+            "REMOVE_WATCH": {
+                "description": "Stop a scheduled bus arrival update (watch), given its id, or all of them.",
+                "function_architype": "REMOVE_WATCH<watch_id or all>",
+                "function": self.remove_watch_async,
+            },
         }
 
         self._lta_api_key = lta_api_key
+        self._lta_client = LtaClient(
+            api_key=lta_api_key, base_url=lta_base_url, retries=self._param_map["BUS_ARRIVAL"]["request_retry"]
+        )
+        # Whole-stop BusArrival responses shared by every chat
+        self._arrival_cache = ArrivalCache(self._lta_client.bus_arrival, ttl=arrival_cache_ttl)
+        # Refreshes bus_stop.csv and the shared bus stop index from DataMall
+        self._bus_stop_refresher = BusStopRefresher(self._lta_client)
+        # Bus routes of every service, fetched from DataMall when missing, stale or of another DataMall
+        self._route_file = route_file
+        self._route_refresher = RouteRefresher(self._lta_client, route_file)
+        self._route_check_interval = 6 * 3600.0  # in secs
+        self._route_checker = None
+        self._background_tasks = set()
+
+        # Per-chat tracking state
+        self._sessions = SessionStore(
+            bus_service_no=bus_service_no,
+            bus_stop_code=bus_stop_code,
+            reminder_mins=self._param_map["BUS_ARRIVAL"]["reminder_mins"],
+            backend=session_backend,
+        )
+        # Idle sessions are dropped every session_sweep_interval secs, see expire_sessions
+        self._session_sweep_interval = 600.0
+        self._session_sweeper = None
+
+        # Bus stop name matching
+        self._bus_stop_match_threshold = MATCH_CONFIDENCE_THRESHOLD
+        self._bus_stop_match_top_k = 5
+        self._bus_stop_llm_fallback = True
+
+        # Nearby bus stops of a shared location
+        self._nearby_radius = NEARBY_RADIUS
+        self._nearby_max_stops = 3
+        self._nearby_max_distance = NEAREST_MAX_DISTANCE
 
         # LLM
-        self._llm = LLM(api_key=groq_api_key, param_map=self._param_map)
+        self._llm = LLM(
+            api_key=groq_api_key,
+            param_map=self._param_map,
+            response_cache=llm_response_cache,
+            base_url=groq_base_url,
+        )
+        self._intent_router = IntentRouter(self._param_map)
+
+        # Rate-limited outgoing messages
+        self._outbox = outbox if outbox is not None else Outbox(file_ids=file_id_cache)
+        # Route diagrams of services without a prebuilt image
+        self._route_images = RouteImageCache()
 
         # Scheduler
-        self._scheduler = AsyncIOScheduler()
-        self._scheduler.start()
+        self._scheduler = ReminderScheduler(self.send_reminders)
+
+        # Keeps scheduled reminders in line with the latest arrival estimates
+        self._refresher = ArrivalRefresher(self.get_arrivals, self._reschedule_reminder)
+
+        # Pending reminders survive restarts, see restore_reminders
+        self._reminder_store = reminder_store if reminder_store is not None else ReminderStore()
+
+        # Set in post_init, reminders are sent by chat_id through the bot
+        self._bot = None
+
+        # Standing watches, pushed every watch_bucket_mins within their time window
+        self._watches = WatchTable()
+        self._watch_store = watch_store if watch_store is not None else WatchStore()
+        self._watch_scheduler = WatchScheduler(self._watches, self.push_watches, bucket_mins=watch_bucket_mins)
+        self._watch_bucket_mins = watch_bucket_mins
+        self._max_watches_per_chat = 10
+
+        # Profiles handlers on demand, see profile_async
+        self._admin_chat_ids = set(admin_chat_ids)
+        self._profiler = HandlerProfiler(profile_dir, inspect=self.get_state_sizes)
+        self._profile_on_start = profile_on_start
+
+        # Read when the metrics are scraped
+        PENDING_REMINDERS.set_function(self._scheduler.__len__)
+        SESSIONS.set_function(self._sessions.__len__)
+        WATCHES.set_function(self._watches.__len__)
 
     # Destructorr
     def __del__(self):
         pass
 
+    async def post_init(self, application):
+        self._bot = application.bot
+        self.restore_reminders()
+        self.restore_watches()
+        self._route_checker = asyncio.get_running_loop().create_task(self.keep_bus_routes_fresh())
+        self._session_sweeper = asyncio.get_running_loop().create_task(self.expire_sessions())
+        if self._profile_on_start > 0:
+            self._profiler.start(self._profile_on_start)
+
+    async def shutdown(self, *args, **kwargs):
+        self._profiler.stop()
+        await self._profiler.wait_written()
+        await self._scheduler.stop()
+        await self._refresher.stop()
+        await self._watch_scheduler.stop()
+        for task in (self._session_sweeper, self._route_checker):
+            if task is not None:
+                task.cancel()
+        self._session_sweeper = self._route_checker = None
+        await self._lta_client.close()
+        self._sessions.close()
+        self._reminder_store.close()
+        self._watch_store.close()
+        self._llm.close()
+        self._outbox.close()
+
     # ======================================== Get & Set Attributes ========================================
     ## Set
-    def set_bus_service_no(self, bus_service_no: str, *args, **kwargs):
-        self._param_map["BUS_ARRIVAL"]["bus_service_no"] = str(bus_service_no)
+    def set_bus_service_no(self, bus_service_no: str, chat_id=None, *args, **kwargs):
+        session = self._sessions.get(chat_id)
+        if session.bus_service_no != str(bus_service_no):
+            session.bus_service_no = str(bus_service_no)
+            session.est_arrivals = ()
+        self._sessions.save(session)
 
-    def set_bus_stop_code(self, bus_stop_code: str, *args, **kwargs):
-        self._param_map["BUS_ARRIVAL"]["bus_stop_code"] = str(bus_stop_code)
+    def set_bus_stop_code(self, bus_stop_code: str, chat_id=None, *args, **kwargs):
+        session = self._sessions.get(chat_id)
+        if session.bus_stop_code != str(bus_stop_code):
+            session.bus_stop_code = str(bus_stop_code)
+            session.est_arrivals = ()
+        self._sessions.save(session)
 
     def set_reminder(
-        self, min_before_arrival: float, remove_other: bool = False, *args, **kwargs
+        self, min_before_arrival: float, remove_other: bool = False, chat_id=None, *args, **kwargs
     ):
+        session = self._sessions.get(chat_id)
         if remove_other:
-            self.clear_reminder()
-        if min_before_arrival not in self._param_map["BUS_ARRIVAL"]["reminder_mins"]:
-            self._param_map["BUS_ARRIVAL"]["reminder_mins"].append(min_before_arrival)
+            session.reminder_mins.clear()
+        if min_before_arrival not in session.reminder_mins:
+            session.reminder_mins.append(min_before_arrival)
+        self._sessions.save(session)
 
-    def remove_reminder(self, min_before_arrival: float, *args, **kwargs):
-        self._param_map["BUS_ARRIVAL"]["reminder_mins"].remove(min_before_arrival)
+    def remove_reminder(self, min_before_arrival: float, chat_id=None, *args, **kwargs):
+        session = self._sessions.get(chat_id)
+        session.reminder_mins.remove(min_before_arrival)
+        self._sessions.save(session)
 
-    def clear_reminder(self, *args, **kwargs):
-        self._param_map["BUS_ARRIVAL"]["reminder_mins"].clear()
+    def clear_reminder(self, chat_id=None, *args, **kwargs):
+        session = self._sessions.get(chat_id)
+        session.reminder_mins.clear()
+        self._sessions.save(session)
+
+    def reset(self, chat_id=None, *args, **kwargs):
+        self.clear_reminder(chat_id)
 
-    def reset(self, *args, **kwargs):
-        self.clear_reminder()
-        
     ## Get
-    def get_bus_service_no(self, *args, **kwargs):
-        return self._param_map["BUS_ARRIVAL"]["bus_service_no"]
+    def get_session(self, chat_id=None, *args, **kwargs):
+        return self._sessions.get(chat_id)
+
+    def get_bus_service_no(self, chat_id=None, *args, **kwargs):
+        return self._sessions.get(chat_id).bus_service_no
+
+    def get_bus_stop_code(self, chat_id=None, *args, **kwargs):
+        return self._sessions.get(chat_id).bus_stop_code
 
-    def get_bus_stop_code(self, *args, **kwargs):
-        return self._param_map["BUS_ARRIVAL"]["bus_stop_code"]
+    def get_reminder(self, chat_id=None, *args, **kwargs):
+        return self._sessions.get(chat_id).reminder_mins
 
-    def get_reminder(self, *args, **kwargs):
-        return self._param_map["BUS_ARRIVAL"]["reminder_mins"]
+    def get_arrival_cache_stats(self, *args, **kwargs):
+        return self._arrival_cache.stats()
+
+    def get_intent_router_stats(self, *args, **kwargs):
+        return self._intent_router.stats()
+
+    def get_llm_cache_stats(self, *args, **kwargs):
+        return self._llm.get_cache_stats()
+
+    def get_state_sizes(self, *args, **kwargs):
+        # Everything kept in memory that grows with the number of chats or requests
+        history_stats = self._llm.get_history_stats()
+        return {
+            "sessions": len(self._sessions),
+            "llm_history_chats": history_stats["chats"],
+            "llm_history_messages": history_stats["messages"],
+            "llm_cache_entries": self.get_llm_cache_stats()["entries"],
+            "arrival_cache_entries": len(self._arrival_cache),
+            "scheduled_reminders": len(self._scheduler),
+            "tracked_reminders": len(self._refresher),
+            "outbox_chats": self._outbox.stats()["chats"],
+            "watches": len(self._watches),
+        }
 
     def bus_stop_code_to_name(self, bus_stop_code: str, *args, **kwargs):
-        print("-"*10)
-        print(f"[{get_time_now()}] Received bus stop name request.")
-        file_path = os.path.dirname(__file__) + "/../data/bus_stop.csv"
-        if os.path.exists(file_path):
-            bus_stop_dict = bus_stop_raw_to_dict(file_path)
-            return (
-                bus_stop_dict[bus_stop_code] if bus_stop_code in bus_stop_dict else None
-            )
+        logger.info("Received bus stop name request.")
+        bus_stop_index = get_bus_stop_index()
+        if bus_stop_index is not None:
+            return bus_stop_index.name_of(bus_stop_code)
         return None
 
-    def bus_stop_name_to_code(
-        self, bus_stop_name: str, bus_service_no: str = None, *args, **kwargs
+    async def bus_stop_name_to_code(
+        self, bus_stop_name: str, bus_service_no: str = None, chat_id=None, *args, **kwargs
     ):
         if bus_service_no is None:
-            bus_service_no = self.get_bus_service_no()
-
-        file_path = os.path.dirname(__file__) + f"/../data/{bus_service_no}_route.csv"
-        if os.path.exists(file_path):
-            bus_stop_dict = csv_to_dict(file_path)
-            llm_reply = self._llm.prompt(
-                f"Given this map of bus stop code and bus stop name: {str(bus_stop_dict)}, Only return the exact bus stop code which has \
-                    the name that is the most similar to the requested: {bus_stop_name}."
-            )
-            print(f"[{get_time_now()}] [bus_stop_name_to_code] LLM reply: {llm_reply}")
-            func_name, args = extract_function_info(llm_reply)
-            if args is not None and len(args) > 0:
-                return args[0]
-            return llm_reply
-        else:
+            bus_service_no = self.get_bus_service_no(chat_id)
+
+        matcher = get_bus_stop_matcher()
+        if matcher is None:
+            return None
+        matches = matcher.match(bus_stop_name, top_k=self._bus_stop_match_top_k)
+        if len(matches) == 0:
             return None
+        best_match = matches[0]
+        # Among good matches, prefer a stop the tracked bus actually calls at
+        route_store = get_route_store(self._route_file)
+        if bus_service_no and not route_store.serves(bus_service_no, best_match.code):
+            for match in matches[1:]:
+                if match.score >= self._bus_stop_match_threshold and route_store.serves(bus_service_no, match.code):
+                    best_match = match
+                    break
+        logger.debug("[bus_stop_name_to_code] Best match: %s", best_match)
+        if best_match.score >= self._bus_stop_match_threshold or not self._bus_stop_llm_fallback:
+            return best_match.code
+
+        # Low confidence: let the LLM pick among the local candidates only
+        candidates = {match.code: match.name for match in matches}
+        llm_reply = await self.prompt_llm(
+            f"Given this map of bus stop code and bus stop name: {str(candidates)}, Only return the exact bus stop code which has \
+                the name that is the most similar to the requested: {bus_stop_name}. The user is tracking bus {bus_service_no}.",
+            use_history=False,
+            temperature=0.0,  # one right answer, which the response cache can keep
+        )
+        logger.debug("[bus_stop_name_to_code] LLM reply: %s", llm_reply)
+        func_name, args = extract_function_info(llm_reply)
+        code = args[0] if args is not None and len(args) > 0 else llm_reply.strip()
+        return code if code in candidates else best_match.code
 
     # ======================================== App's Functions ========================================
-    def get_bus_arrival_info(self):
-        param = self._param_map["BUS_ARRIVAL"]
-        retry = param["request_retry"]
-        BUS_SERVICE_NO = param["bus_service_no"]
-        BUS_STOP_CODE = param["bus_stop_code"]
-        LTA_API_KEY = self._lta_api_key
-
-        url = f"https://datamall2.mytransport.sg/ltaodataservice/v3/BusArrival?BusStopCode={BUS_STOP_CODE}&ServiceNo={BUS_SERVICE_NO}"
-        payload = {}
-        headers = {"AccountKey": LTA_API_KEY, "accept": "application/json"}
-
-        response = None
-        for _ in range(retry):
-            if response is not None:
-                break
-            try:
-                response = requests.request("GET", url, headers=headers, data=payload)
-            except:
-                response = None
-                continue
-        if response is None:
-            return "No bus services found."
-        data = response.json()
-
-        if "Services" in data.keys() and len(data["Services"]) > 0:
-            service = data["Services"][0]
-            next_bus = service["NextBus"]["EstimatedArrival"]
-            next_bus_2 = service["NextBus2"]["EstimatedArrival"]
-
-            if (BUS_SERVICE_NO not in self._bus_arrival) or (
-                BUS_SERVICE_NO in self._bus_arrival
-                and BUS_STOP_CODE not in self._bus_arrival[BUS_SERVICE_NO]
-            ):
-                new_map = {
-                    BUS_SERVICE_NO: {
-                        BUS_STOP_CODE: {
-                            "est_arrival_1": "0",
-                            "est_arrival_2": "0",
-                        }
-                    }
-                }
-                self._bus_arrival.update(new_map)
-
-            self._bus_arrival[BUS_SERVICE_NO][BUS_STOP_CODE]["est_arrival_1"] = (
-                process_time(next_bus, include_date=True)
-            )
-            self._bus_arrival[BUS_SERVICE_NO][BUS_STOP_CODE]["est_arrival_2"] = (
-                process_time(next_bus_2, include_date=True)
+    async def get_arrivals(self, bus_stop_code: str, bus_services: list = None):
+        # One upstream call answers every service at the stop. Returns None if DataMall is unreachable.
+        try:
+            data = await self._arrival_cache.get(bus_stop_code)
+        except LtaError as e:
+            logger.warning("[get_arrivals] %s", e)
+            return None
+        return parse_bus_arrival(data, bus_services)
+
+    def nearby_bus_stops(self, latitude: float, longitude: float):
+        # Stops within walking distance, or the closest ones within a few km if there are none.
+        # Returns None if there is no bus stop data.
+        geo_index = get_bus_stop_geo_index()
+        if geo_index is None:
+            return None
+        nearby = geo_index.within(latitude, longitude, self._nearby_radius)[: self._nearby_max_stops]
+        if len(nearby) == 0:
+            nearby = geo_index.nearest(
+                latitude, longitude, k=self._nearby_max_stops, max_distance=self._nearby_max_distance
             )
+        return nearby
 
-            # Reply text
-            return f"Next bus {BUS_SERVICE_NO} arriving at station {BUS_STOP_CODE} at {process_time(next_bus)}, followed by {process_time(next_bus_2)}"
-        else:
+    async def get_nearby_arrival_info(self, latitude: float, longitude: float):
+        nearby = self.nearby_bus_stops(latitude, longitude)
+        if nearby is None:
+            return "Bus stop information not found."
+        if len(nearby) == 0:
+            return f"No bus stops nearby, none within {self._nearby_max_distance / 1000:.0f} km."
+
+        all_arrivals = await asyncio.gather(*[self.get_arrivals(bus_stop.code) for bus_stop in nearby])
+        lines = []
+        for bus_stop, arrivals in zip(nearby, all_arrivals):
+            lines.append(f"{bus_stop.name} ({bus_stop.code}), {bus_stop.distance:.0f} m away")
+            if arrivals is None:
+                lines.append("  Bus arrival information is not available right now.")
+                continue
+            if len(arrivals) == 0:
+                lines.append("  No bus in operation.")
+            for bus_service_no, arrival in arrivals.items():
+                times = ", ".join(format_time(next_bus.est_arrival, "%H:%M") for next_bus in arrival.next_buses)
+                lines.append(f"  {bus_service_no}: {times or 'no estimate'}")
+        return "\n".join(lines)
+
+    async def get_bus_arrival_info(self, chat_id=None, bus_services: list = None):
+        # bus_services: None for the tracked service only, [] for every service at the stop
+        session = self._sessions.get(chat_id)
+        BUS_SERVICE_NO = session.bus_service_no
+        BUS_STOP_CODE = session.bus_stop_code
+        if bus_services is None:
+            bus_services = [BUS_SERVICE_NO]
+
+        arrivals = await self.get_arrivals(
+            BUS_STOP_CODE, bus_services if len(bus_services) > 0 else None
+        )
+        if not arrivals:
             return "No bus services found."
 
-    def get_bus_stop_info(self, recreate: bool = False):
-        file_path = os.path.dirname(__file__) + "/../data/bus_stop.csv"
-        if os.path.exists(file_path) and not recreate:
-            return "Bus stop information is already fetched."
-        else:
-            LTA_API_KEY = self._lta_api_key
+        tracked = arrivals.get(BUS_SERVICE_NO)
+        session.est_arrivals = (
+            tuple(next_bus.est_arrival for next_bus in tracked.next_buses[:2])
+            if tracked is not None
+            else ()
+        )
 
-            url = "https://datamall2.mytransport.sg/ltaodataservice/BusStops"
-            payload = {}
-            headers = {"AccountKey": LTA_API_KEY, "accept": "application/json"}
+        # Reply text
+        if len(bus_services) == 0:
+            bus_services = list(arrivals.keys())
+        return "\n".join(
+            format_service_arrival(arrivals[bus_service_no])
+            if bus_service_no in arrivals
+            else f"No bus {bus_service_no} found at station {BUS_STOP_CODE}."
+            for bus_service_no in bus_services
+        )
 
-            bus_stops = []
-            skip = 0
-            while True:
-                # Modify URL to include $skip for pagination
-                paginated_url = f"{url}?$skip={skip}"
-                response = requests.get(paginated_url, headers=headers)
+    def get_remind_time(self, est_arrival, mins_left: float):
+        # Epoch secs, compare with time.time()
+        return est_arrival - mins_left * 60.0
 
-                if response.status_code != 200:
-                    print(f"Error: {response.status_code}")
-                    break
+    def schedule_reminder(self, reminder: TrackedReminder, persist: bool = True):
+        self.schedule_reminders([reminder], persist)
 
-                data = response.json()
+    def schedule_reminders(self, reminders: list, persist: bool = True):
+        self._scheduler.schedule_many(
+            [(reminder.job_id, reminder.fire_timestamp, reminder, reminder.chat_id) for reminder in reminders]
+        )
+        if persist:
+            self._reminder_store.add_many(reminders)
+        self._refresher.track_many(reminders)
 
-                # Check if the response contains results
-                if "value" in data and data["value"]:
-                    bus_stops.extend(data["value"])
+    def restore_reminders(self):
+        # Reload pending reminders in bulk, dropping those whose bus has already arrived
+        self._reminder_store.remove_arrived()
+        reminders = self._reminder_store.load_pending()
+        self.schedule_reminders(reminders, persist=False)
+        logger.info("Restored %s reminders.", len(reminders))
+        return len(reminders)
 
-                    # If we got fewer than 500 records, we've reached the end of the dataset
-                    if len(data["value"]) < 500:
-                        break
-                    # Otherwise, continue to the next page by incrementing the skip value
-                    skip += 500
-                else:
-                    # No more data
-                    break
+    def cancel_reminders(self, chat_id):
+        # Cancel every pending reminder of a chat
+        self._refresher.untrack_chat(chat_id)
+        self._reminder_store.remove_chat(chat_id)
+        return self._scheduler.cancel_chat(chat_id)
 
-            with open(file_path, "w", newline="") as csvfile:
-                writer = csv.DictWriter(csvfile, fieldnames=bus_stops[0].keys())
-                writer.writeheader()
-                writer.writerows(bus_stops)
+    def _reschedule_reminder(self, reminder: TrackedReminder):
+        if not self._scheduler.reschedule(reminder.job_id, reminder.fire_timestamp):
+            self._reminder_store.remove(reminder.job_id)
+            return False
+        self._reminder_store.update(reminder)
+        logger.info("Reminder %s moved to %s", reminder.job_id, format_time(reminder.fire_timestamp))
+        return True
 
-            return "Created bus_stop.csv"
+    def add_watch(self, watch: Watch, persist: bool = True):
+        self._watches.add(watch)
+        if persist:
+            self._watch_store.add(watch)
+        self._watch_scheduler.start()
+
+    def remove_watches(self, chat_id, watch_id: str = None):
+        # Removes one watch of the chat, or all of them if watch_id is None. Returns the removed watches.
+        if watch_id is None:
+            self._watch_store.remove_chat(chat_id)
+            return self._watches.remove_chat(chat_id)
+        watch = self._watches.get(watch_id)
+        if watch is None or watch.chat_id != chat_id:
+            return []
+        self._watch_store.remove(watch_id)
+        return [self._watches.remove(watch_id)]
+
+    async def expire_sessions(self):
+        while True:
+            await asyncio.sleep(self._session_sweep_interval)
+            expired = self._sessions.evict_expired()
+            if expired > 0:
+                logger.info("Dropped %s idle sessions.", expired)
+
+    def restore_watches(self):
+        watches = self._watch_store.load()
+        for watch in watches:
+            self.add_watch(watch, persist=False)
+        logger.info("Restored %s watches.", len(watches))
+        return len(watches)
+
+    async def push_watches(self, bus_stop_code: str, watches: list):
+        # One fetch of the stop answers every subscriber, each chat gets one message
+        services = sorted({watch.bus_service_no for watch in watches})
+        arrivals = await self.get_arrivals(bus_stop_code, services)
+        by_chat = {}
+        for watch in watches:
+            chat_services = by_chat.setdefault(watch.chat_id, [])
+            if watch.bus_service_no not in chat_services:
+                chat_services.append(watch.bus_service_no)
+
+        def text_of(chat_services):
+            if arrivals is None:
+                return f"Bus arrival information at station {bus_stop_code} is not available right now."
+            return "\n".join(
+                format_service_arrival(arrivals[bus_service_no])
+                if bus_service_no in arrivals
+                else f"No bus {bus_service_no} found at station {bus_stop_code}."
+                for bus_service_no in chat_services
+            )
+
+        # Sent through the outbox, which keeps to Telegram's global and per-chat rate limits
+        results = await asyncio.gather(
+            *[
+                self._outbox.send_message(self._bot, chat_id, text_of(chat_services))
+                for chat_id, chat_services in by_chat.items()
+            ],
+            return_exceptions=True,
+        )
+        for chat_id, result in zip(by_chat, results):
+            if not isinstance(result, Exception):
+                WATCH_MESSAGES.inc()
+                continue
+            WATCH_ERRORS.inc()
+            logger.warning("Failed to push watches of %s to chat %s: %r", bus_stop_code, chat_id, result)
+            if isinstance(result, Forbidden):
+                # Blocked or removed from the chat, its watches would keep failing every bucket
+                removed = self.remove_watches(chat_id)
+                logger.info("Removed %s watches of chat %s.", len(removed), chat_id)
+
+    async def keep_bus_routes_fresh(self):
+        while True:
+            if self._route_refresher.is_stale():
+                await self.refresh_bus_routes()
+            await asyncio.sleep(self._route_check_interval)
+
+    async def refresh_bus_routes(self):
+        try:
+            route_store = await self._route_refresher.refresh()
+        except (LtaError, DatasetError) as e:
+            logger.warning("[refresh_bus_routes] %s", e)
+            return None
+        logger.info("Bus routes updated: %s routes", len(route_store))
+        return route_store
+
+    def bus_services_at_stop(self, bus_stop_code: str):
+        return get_route_store(self._route_file).services_at(bus_stop_code)
+
+    def stops_between(self, bus_service_no: str, from_code: str, to_code: str):
+        return get_route_store(self._route_file).stops_between(bus_service_no, from_code, to_code)
+
+    def get_bus_route_info(self, bus_service_no: str):
+        route_store = get_route_store(self._route_file)
+        directions = route_store.directions(bus_service_no)
+        if len(directions) == 0:
+            return f"Bus route of bus {bus_service_no} is not found."
+        lines = [f"Bus route of bus {bus_service_no}:"]
+        for direction in directions:
+            if len(directions) > 1:
+                lines.append(f"Direction {direction}:")
+            lines.extend(
+                f"{code} {self.bus_stop_code_to_name(code) or ''}".rstrip()
+                for code in route_store.route(bus_service_no, direction)
+            )
+        return "\n".join(lines)
+
+    def render_route_image(self, bus_service_no: str):
+        # Returns the path of the rendered route diagram, or None if the route is not known
+        route_store = get_route_store(self._route_file)
+        bus_stop_index = get_bus_stop_index()
+        if bus_stop_index is None:
+            return None
+        routes = [
+            [bus_stop_index.coordinates_of(code) for code in route_store.route(bus_service_no, direction) if code in bus_stop_index]
+            for direction in route_store.directions(bus_service_no)
+        ]
+        routes = [route for route in routes if len(route) > 0]
+        if len(routes) == 0:
+            return None
+        return self._route_images.get(str(bus_service_no).upper(), routes)
+
+    async def get_bus_stop_info(self, recreate: bool = False):
+        if get_bus_stop_index() is not None and not recreate:
+            return "Bus stop information is already fetched."
+        try:
+            diff, route_store = await asyncio.gather(self._bus_stop_refresher.refresh(), self.refresh_bus_routes())
+        except (LtaError, DatasetError) as e:
+            logger.warning("[get_bus_stop_info] %s", e)
+            return "Bus stop information could not be fetched. Please try again later."
+        bus_routes = f" Bus routes of {len(route_store.services())} bus services updated." if route_store is not None else ""
+        return (
+            f"Bus stop information updated: {diff.total} bus stops, {len(diff.added)} added, "
+            f"{len(diff.removed)} removed, {len(diff.changed)} changed.{bus_routes}"
+        )
 
     # ======================================== App's Async Functions ========================================
+    def profiled(self, name: str, handler):
+        """Wraps a handler registered with the application to be profiled as name, see profile_async."""
+        return self._profiler.wrap(name, handler)
+
+    @staticmethod
+    def get_chat_id(update: Update):
+        return update.effective_chat.id if update.effective_chat is not None else None
+
+    async def prompt_llm(
+        self, msg: str, stream: MessageStream = None, chat_id=None, use_history: bool = True, temperature: float = 0.7
+    ):
+        # Plain-text replies are shown progressively through stream, if given
+        on_token = None
+        if stream is not None:
+            async def on_token(reply):
+                if is_plain_reply(reply):
+                    await stream.update(reply)
+
+        try:
+            return await self._llm.prompt_async(
+                msg, temperature=temperature, chat_id=chat_id, use_history=use_history, on_token=on_token
+            )
+        except (asyncio.TimeoutError, GroqError) as e:
+            logger.warning("[prompt_llm] %r", e)
+            return LLM_ERROR_REPLY
+
     async def start(self, update: Update, context):
-        await asyncio.sleep(0.2)
-        await update.message.reply_text(self._llm.prompt("Hi, tell me who you are."))
+        stream = MessageStream(self._outbox, update)
+        await stream.finish(
+            # The same for every chat, so the response cache answers all but the first
+            await self.prompt_llm("Hi, tell me who you are.", stream, use_history=False, temperature=0.0)
+        )
 
-    async def send_reminder(self, update: Update, mins_left, bus_service_no, bus_stop_code, args_list: list = []):
-        print(f"[{get_time_now()}] Sending reminder.")
-        await asyncio.sleep(0.2)
-        await update.message.reply_text(
+    async def send_reminders(self, reminders: list):
+        # Reminders that came due in the same scheduler tick
+        results = await asyncio.gather(
+            *[
+                self.send_reminder(
+                    reminder.chat_id,
+                    reminder.mins_left,
+                    reminder.bus_service_no,
+                    reminder.bus_stop_code,
+                    reminder.job_id,
+                )
+                for reminder in reminders
+            ],
+            return_exceptions=True,
+        )
+        for reminder, result in zip(reminders, results):
+            if isinstance(result, Exception):
+                REMINDER_ERRORS.inc()
+                logger.warning(
+                    "Failed to send reminder %s to chat %s: %r", reminder.job_id, reminder.chat_id, result
+                )
+
+    async def send_reminder(self, chat_id, mins_left, bus_service_no, bus_stop_code, job_id=None, args_list: list = []):
+        logger.info("Sending reminder.")
+        self._refresher.untrack(job_id)
+        self._reminder_store.remove(job_id)
+        await self._outbox.send_message(
+            self._bot,
+            chat_id,
             f"The bus {bus_service_no} is arriving at {bus_stop_code} in <b>{str(mins_left)} min </b>! Get Ready soon!",
             parse_mode="HTML",
         )
 
     async def bus_arrival_async(self, update: Update, context, args_list: list = []):
-        print("-"*10)
-        print(f"[{get_time_now()}] Received bus arrival request.")
+        logger.info("Received bus arrival request.")
+        chat_id = self.get_chat_id(update)
+        if len(args_list) == 0 and context is not None and context.args:
+            # /bus <bus_service_no> <bus_stop_code or name>
+            args_list = context.args[:1] + [" ".join(context.args[1:])] if len(context.args) > 1 else context.args
 
-        if len(args_list) > 0 and args_list[0].isdigit():
-            self.set_bus_service_no(args_list[0])
+        bus_services = None
+        if len(args_list) > 0:
+            if args_list[0].strip().lower() == "all":
+                bus_services = []
+            else:
+                bus_services = split_bus_services(args_list[0]) or None
+        if bus_services:
+            self.set_bus_service_no(bus_services[0], chat_id)
         if len(args_list) > 1:
             if args_list[1].isdigit():
-                self.set_bus_stop_code(args_list[1])
+                self.set_bus_stop_code(args_list[1], chat_id)
             else:
-                code = self.bus_stop_name_to_code(args_list[1])
+                code = await self.bus_stop_name_to_code(args_list[1], chat_id=chat_id)
                 if code is not None:
-                    self.set_bus_stop_code(code)
+                    self.set_bus_stop_code(code, chat_id)
 
-        bus_info = self.get_bus_arrival_info()
-        print(f"[{get_time_now()}] {bus_info}")
+        bus_info = await self.get_bus_arrival_info(chat_id, bus_services)
+        logger.debug("Bus arrival info: %s", bus_info)
 
-        await asyncio.sleep(0.2)
-        await update.message.reply_text(bus_info)
+        # All replies of this request go out as one message
+        async with self._outbox.buffer(update) as reply:
+            reply.add(bus_info)
 
-        # Set reminder
-        if len(self._param_map["BUS_ARRIVAL"]["reminder_mins"]) > 0:
-            # Data Processing
-            reminder_min = sorted(
-                self._param_map["BUS_ARRIVAL"]["reminder_mins"], reverse=True
-            )
-            bus_has_passed = True
-            bus_service_no = self._param_map["BUS_ARRIVAL"]["bus_service_no"]
-            bus_stop_code = self._param_map["BUS_ARRIVAL"]["bus_stop_code"]
-
-            # Add reminder task
-            for key in ["est_arrival_1", "est_arrival_2"]:
-                for each in reminder_min:
-                    remind_time = self._bus_arrival[bus_service_no][bus_stop_code][
-                        key
-                    ].replace(tzinfo=None) - timedelta(minutes=each)
-
-                    if remind_time < get_datetime_now():
-                        continue
-
-                    bus_has_passed = False
-                    current_loop = get_running_loop()
-
-                    self._scheduler.add_job(
-                        lambda each=each: asyncio.run_coroutine_threadsafe(
-                            self.send_reminder(
-                                update,
-                                mins_left=each,
-                                bus_service_no = bus_service_no,
-                                bus_stop_code = bus_stop_code
-                            ),
-                            current_loop,
-                        ),
-                        "date",
-                        run_date=remind_time,
-                    )
-                    await asyncio.sleep(0.2)
-                    await update.message.reply_text(
-                        f"You will receive a reminder at {remind_time}"
-                    )
+            # Set reminder
+            session = self._sessions.get(chat_id)
+            if len(session.reminder_mins) > 0 and len(session.est_arrivals) > 0:
+                reminder_min = sorted(session.reminder_mins, reverse=True)
+                bus_service_no = session.bus_service_no
+                bus_stop_code = session.bus_stop_code
 
-                if bus_has_passed and key == "est_arrival_1":
-                    await asyncio.sleep(0.2)
-                    await update.message.reply_text(
-                        "The 1st bus has already passed. Setting reminder for the 2nd bus."
+                # Fire times of every reminder before every estimated arrival, [bus, reminder]
+                fire_times = reminder_fire_times(session.est_arrivals, reminder_min)
+                upcoming = fire_times > get_timestamp_now()
+                if not upcoming[0].any():
+                    reply.add("The 1st bus has already passed. Setting reminder for the 2nd bus.")
+
+                # Remind of the first bus with any reminder still ahead, at most the 2nd one
+                buses = np.flatnonzero(upcoming.any(axis=1))
+                if len(buses) > 0:
+                    key = buses[0]
+                    reminders = [
+                        TrackedReminder(
+                            uuid.uuid4().hex, chat_id, bus_service_no, bus_stop_code, each, session.est_arrivals[key]
+                        )
+                        for each, is_upcoming in zip(reminder_min, upcoming[key])
+                        if is_upcoming
+                    ]
+                    self.schedule_reminders(reminders)
+                    reply.add(
+                        f"You will receive a reminder at {', '.join(format_time(reminder.fire_timestamp) for reminder in reminders)}"
                     )
                 else:
-                    break
+                    reply.add(
+                        "I'm sorry. I can't set the requested reminder. Please reduce the reminder time or try again later."
+                    )
 
-            if bus_has_passed:
-                await asyncio.sleep(0.2)
-                await update.message.reply_text(
-                    "I'm sorry. I can't set the requested reminder. Please reduce the reminder time or try again later."
-                )
+    async def location_async(self, update: Update, context, args_list: list = []):
+        logger.info("Received location.")
+        location = update.message.location
+        nearby_info = await self.get_nearby_arrival_info(location.latitude, location.longitude)
+        logger.debug("Nearby arrival info: %s", nearby_info)
+        await self._outbox.reply(update, nearby_info)
 
     async def bus_stop_async(self, update: Update, context, args_list: list = []):
-        print("-"*10)
-        print(f"[{get_time_now()}] Received bus stop info request.")
-        bus_stop_info = self.get_bus_stop_info()
-        print(f"[{get_time_now()}] {bus_stop_info}")
-        await asyncio.sleep(0.2)
-        await update.message.reply_text(bus_stop_info)
+        logger.info("Received bus stop info request.")
+        recreate = context is not None and bool(context.args) and context.args[0].lower() == "refresh"
+        bus_stop_info = await self.get_bus_stop_info(recreate)
+        logger.debug("Bus stop info: %s", bus_stop_info)
+        await self._outbox.reply(update, bus_stop_info)
 
     async def get_bus_service_no_async(
         self, update: Update, context, args_list: list = []
     ):
-        print("-"*10)
-        print(f"[{get_time_now()}] Received get bus service number request.")
-        bus_service_no = self.get_bus_service_no()
-        print(f"[{get_time_now()}] {bus_service_no}")
+        logger.info("Received get bus service number request.")
+        bus_service_no = self.get_bus_service_no(self.get_chat_id(update))
+        logger.debug("Bus service no: %s", bus_service_no)
         
-        await asyncio.sleep(0.2)
-        await update.message.reply_text(f"Current bus service no.: {bus_service_no}")
+        await self._outbox.reply(update, f"Current bus service no.: {bus_service_no}")
 
     async def get_bus_stop_code_async(
         self, update: Update, context, args_list: list = []
     ):
-        print("-"*10)
-        print(f"[{get_time_now()}] Received get bus stop code request.")
-        bus_stop_code = self.get_bus_stop_code()
-        print(f"[{get_time_now()}] {bus_stop_code}")
+        logger.info("Received get bus stop code request.")
+        bus_stop_code = self.get_bus_stop_code(self.get_chat_id(update))
+        logger.debug("Bus stop code: %s", bus_stop_code)
         
-        await asyncio.sleep(0.2)
-        await update.message.reply_text(f"Current bus stop code: {bus_stop_code}")
+        await self._outbox.reply(update, f"Current bus stop code: {bus_stop_code}")
 
     async def get_reminder_async(self, update: Update, context, args_list: list = []):
-        print("-"*10)
-        print(f"[{get_time_now()}] Received get reminder request.")
-        reminder_list = self.get_reminder()
-        print(f"[{get_time_now()}] {str(reminder_list)}")
-        llm_reply = self._llm.prompt(
+        logger.info("Received get reminder request.")
+        reminder_list = self.get_reminder(self.get_chat_id(update))
+        logger.debug("Reminders: %s", reminder_list)
+        stream = MessageStream(self._outbox, update)
+        llm_reply = await self.prompt_llm(
             f"Don't output the function architype this time but output an improved sentence of this: Reminder will be sent \
-                x mins before the bus arrives upon the next bus arrival request, where x is {str(reminder_list)}"
+                x mins before the bus arrives upon the next bus arrival request, where x is {str(reminder_list)}",
+            stream,
+            use_history=False,
+            temperature=0.0,  # cached per reminder list
         )
         
-        await asyncio.sleep(0.2)
-        await update.message.reply_text(llm_reply)
+        await stream.finish(llm_reply)
 
     async def set_bus_service_no_async(
         self, update: Update, context, args_list: list = []
     ):
-        print("-"*10)
-        print(f"[{get_time_now()}] Received set bus service no request.")
+        logger.info("Received set bus service no request.")
+        chat_id = self.get_chat_id(update)
         bus_service_no = (
-            args_list[0] if len(args_list) > 0 else self.get_bus_service_no()
+            args_list[0] if len(args_list) > 0 else self.get_bus_service_no(chat_id)
         )
-        self.set_bus_service_no(bus_service_no)
-        print(f"[{get_time_now()}] Set bus service no: done")
+        self.set_bus_service_no(bus_service_no, chat_id)
+        logger.debug("Set bus service no: done")
         
-        await asyncio.sleep(0.2)
-        await update.message.reply_text(
-            f"Bus service set to: {self.get_bus_service_no()}"
+        await self._outbox.reply(
+            update, f"Bus service set to: {self.get_bus_service_no(chat_id)}"
         )
 
     async def set_bus_stop_code_async(
         self, update: Update, context, args_list: list = []
     ):
-        print("-"*10)
-        print(f"[{get_time_now()}] Received set bus stop code request.")
-        bus_stop_code = args_list[0] if len(args_list) > 0 else self.get_bus_stop_code()
+        logger.info("Received set bus stop code request.")
+        chat_id = self.get_chat_id(update)
+        bus_stop_code = args_list[0] if len(args_list) > 0 else self.get_bus_stop_code(chat_id)
         is_name = (args_list[1].lower() == "true") if len(args_list) > 1 else True
         if is_name:
-            bus_stop_code = self.bus_stop_name_to_code(bus_stop_code)
-        self.set_bus_stop_code(bus_stop_code)
-        print(f"[{get_time_now()}] Set bus stop code: done")
+            bus_stop_code = await self.bus_stop_name_to_code(bus_stop_code, chat_id=chat_id)
+        if bus_stop_code is not None:
+            self.set_bus_stop_code(bus_stop_code, chat_id)
+        logger.debug("Set bus stop code: done")
         
-        await asyncio.sleep(0.2)
-        await update.message.reply_text(
-            f"Bus stop code set to: {self.get_bus_stop_code()}"
+        await self._outbox.reply(
+            update, f"Bus stop code set to: {self.get_bus_stop_code(chat_id)}"
         )
 
     async def bus_stop_code_to_name_async(
         self, update: Update, context, args_list: list = []
     ):
-        bus_stop_code = args_list[0] if len(args_list) > 0 else self.get_bus_stop_code()
-        print("-"*10)
-        print(f"[{get_time_now()}] Received bus stop name request.")
+        bus_stop_code = (
+            args_list[0] if len(args_list) > 0 else self.get_bus_stop_code(self.get_chat_id(update))
+        )
+        logger.info("Received bus stop name request.")
         result = self.bus_stop_code_to_name(bus_stop_code)
-        await asyncio.sleep(0.2)
         if result is not None:
-            await update.message.reply_text(
-                f"The name of bus stop {bus_stop_code} is {result}."
+            await self._outbox.reply(
+                update, f"The name of bus stop {bus_stop_code} is {result}."
             )
         else:
-            await update.message.reply_text(
-                f"The name of bus stop {bus_stop_code} is not found."
+            await self._outbox.reply(
+                update, f"The name of bus stop {bus_stop_code} is not found."
             )
 
     async def bus_stop_name_to_code_async(
         self, update: Update, context, args_list: list = []
     ):
         bus_stop_name = args_list[0] if len(args_list) > 0 else ""
-        print("-"*10)
-        print(f"[{get_time_now()}] Received bus stop code request.")
-        result = self.bus_stop_name_to_code(bus_stop_name)
-        await asyncio.sleep(0.2)
+        logger.info("Received bus stop code request.")
+        result = await self.bus_stop_name_to_code(bus_stop_name, chat_id=self.get_chat_id(update))
         if result is not None:
-            await update.message.reply_text(
-                f"The code of bus stop {bus_stop_name} is {result}."
+            await self._outbox.reply(
+                update, f"The code of bus stop {bus_stop_name} is {result}."
             )
         else:
-            await update.message.reply_text(
-                f"The code of bus stop {bus_stop_name} is not found."
+            await self._outbox.reply(
+                update, f"The code of bus stop {bus_stop_name} is not found."
+            )
+
+    async def bus_services_at_stop_async(self, update: Update, context, args_list: list = []):
+        logger.info("Received bus services at stop request.")
+        chat_id = self.get_chat_id(update)
+        bus_stop_code = args_list[0] if len(args_list) > 0 and args_list[0] else self.get_bus_stop_code(chat_id)
+        if not bus_stop_code.isdigit():
+            bus_stop_code = await self.bus_stop_name_to_code(bus_stop_code, chat_id=chat_id)
+        bus_services = self.bus_services_at_stop(bus_stop_code) if bus_stop_code is not None else ()
+        if len(bus_services) > 0:
+            await self._outbox.reply(
+                update, f"Bus services stopping at {bus_stop_code}: {', '.join(bus_services)}"
             )
+        else:
+            await self._outbox.reply(update, f"No bus services found at bus stop {bus_stop_code}.")
+
+    async def stops_between_async(self, update: Update, context, args_list: list = []):
+        logger.info("Received stops between request.")
+        chat_id = self.get_chat_id(update)
+        if len(args_list) < 3:
+            await self._outbox.reply(update, "Please tell me the bus service and the two bus stops.")
+            return
+        bus_service_no = args_list[0].upper()
+        codes = []
+        for bus_stop in args_list[1:3]:
+            if not bus_stop.isdigit():
+                bus_stop = await self.bus_stop_name_to_code(bus_stop, bus_service_no, chat_id)
+            codes.append(bus_stop)
+        stops = self.stops_between(bus_service_no, *codes) if None not in codes else ()
+        if len(stops) == 0:
+            await self._outbox.reply(
+                update, f"Bus {bus_service_no} does not go from {args_list[1]} to {args_list[2]}."
+            )
+            return
+        lines = [f"Bus {bus_service_no} from {codes[0]} to {codes[1]} ({len(stops) - 1} stops):"]
+        lines.extend(f"{code} {self.bus_stop_code_to_name(code) or ''}".rstrip() for code in stops)
+        await self._outbox.reply(update, "\n".join(lines))
+
+    async def watch_async(self, update: Update, context, args_list: list = []):
+        # /watch <bus_service_no> <bus_stop_code> <HH:MM-HH:MM> [days], or /watch to list the watches
+        if len(args_list) == 0 and context is not None and context.args:
+            args_list = context.args[:3] + [" ".join(context.args[3:])]
+        if len(args_list) == 0:
+            await self.get_watches_async(update, context)
+        else:
+            await self.set_watch_async(update, context, args_list=args_list)
+
+    async def set_watch_async(self, update: Update, context, args_list: list = []):
+        logger.info("Received set watch request.")
+        chat_id = self.get_chat_id(update)
+        usage = "Please tell me the bus service, the bus stop and the time, e.g. /watch 199 27011 07:30-08:30 weekdays"
+        if len(args_list) < 3:
+            await self._outbox.reply(update, usage)
+            return
+
+        bus_service_no = args_list[0].upper()
+        bus_stop_code = args_list[1]
+        if not bus_stop_code.isdigit():
+            bus_stop_code = await self.bus_stop_name_to_code(bus_stop_code, bus_service_no, chat_id)
+        else:
+            bus_stop_index = get_bus_stop_index()
+            if bus_stop_index is not None and bus_stop_code not in bus_stop_index:
+                await self._outbox.reply(update, f"No bus stop {bus_stop_code} found.")
+                return
+        window = parse_window(args_list[2])
+        days = parse_days(args_list[3] if len(args_list) > 3 else "")
+        if bus_stop_code is None or window is None or not days:
+            await self._outbox.reply(update, usage)
+            return
+        if len(self._watches.for_chat(chat_id)) >= self._max_watches_per_chat:
+            await self._outbox.reply(
+                update, f"You have {self._max_watches_per_chat} watches already. Remove one with /unwatch <id> first."
+            )
+            return
+
+        # Short enough to type, so regenerated until it is not taken by any chat
+        watch_id = uuid.uuid4().hex[:6]
+        while watch_id in self._watches:
+            watch_id = uuid.uuid4().hex[:6]
+        watch = Watch(watch_id, chat_id, bus_service_no, bus_stop_code, days, *window)
+        self.add_watch(watch)
+        await self._outbox.reply(
+            update,
+            f"I will send you the arrivals of bus {bus_service_no} at {bus_stop_code} every {self._watch_bucket_mins} min, "
+            f"{format_window(*window)} on {format_days(days)}. Stop it with /unwatch {watch.watch_id}",
+        )
+
+    async def get_watches_async(self, update: Update, context, args_list: list = []):
+        logger.info("Received get watches request.")
+        watches = self._watches.for_chat(self.get_chat_id(update))
+        if len(watches) == 0:
+            await self._outbox.reply(update, "You have no watches. Set one with e.g. /watch 199 27011 07:30-08:30 weekdays")
+            return
+        await self._outbox.reply(update, "\n".join(["Your watches:"] + [str(watch) for watch in watches]))
+
+    async def remove_watch_async(self, update: Update, context, args_list: list = []):
+        logger.info("Received remove watch request.")
+        chat_id = self.get_chat_id(update)
+        if len(args_list) == 0 and context is not None and context.args:
+            args_list = context.args
+        if len(args_list) == 0:
+            await self._outbox.reply(update, "Please tell me which watch to remove, e.g. /unwatch <id> or /unwatch all")
+            return
+
+        watch_id = args_list[0].lstrip("#").lower()
+        removed = self.remove_watches(chat_id, None if watch_id == "all" else watch_id)
+        if len(removed) == 0:
+            await self._outbox.reply(update, f"No watch {args_list[0]} found.")
+        else:
+            await self._outbox.reply(update, f"Removed {len(removed)} watch{'es' if len(removed) > 1 else ''}.")
 
     async def set_reminder_async(self, update: Update, context, args_list: list = []):
-        print("-"*10)
-        print(f"[{get_time_now()}] Received set reminder request.")
-        min_bef_arrval = float(args_list[0]) if len(args_list) > 0 else 2.0
+        logger.info("Received set reminder request.")
+        try:
+            min_bef_arrval = float(args_list[0]) if len(args_list) > 0 else 2.0
+        except ValueError:
+            min_bef_arrval = None
+        # Also rejects nan and inf
+        if min_bef_arrval is None or not 0 < min_bef_arrval < float("inf"):
+            await self._outbox.reply(
+                update, "Please tell me how many mins before the bus arrives to remind you, e.g. remind me 5 min before"
+            )
+            return
         remove_other = (args_list[1].lower() == "true") if len(args_list) > 1 else True
-        self.set_reminder(min_bef_arrval, remove_other)
-        print(f"[{get_time_now()}] {min_bef_arrval} is added to the reminder list.")
+        self.set_reminder(min_bef_arrval, remove_other, self.get_chat_id(update))
+        logger.info("%s is added to the reminder list.", min_bef_arrval)
         await self.get_reminder_async(update, context)
 
     async def handle_text(self, update: Update, context, args_list: list = []):
-        print("-"*10)
-        print(f"[{get_time_now()}] Received text request.")
-        llm_reply = self._llm.prompt(f"{update.message.text}")
-        print(f"[{get_time_now()}] LLM reply: {llm_reply}")
-        func_name, args = extract_function_info(llm_reply)
-        print(f"[{get_time_now()}] Extracted: {func_name} {args}")
+        logger.info("Received text request.")
 
-        if func_name is not None and func_name in self._param_map.keys():
-            await self._param_map[func_name.upper()]["function"](
-                update, context, args_list=args
+        # Common phrasings are routed locally, only the rest goes to the LLM
+        with INTENT_PARSE_SECONDS.labels("router").time():
+            func_name, args = self._intent_router.route(update.message.text)
+        if func_name is not None:
+            logger.debug("Routed: %s %s", func_name, args)
+            INTENTS.labels(func_name, "router").inc()
+            await self._profiler.run(
+                func_name, self._param_map[func_name]["function"], update, context, args_list=args
+            )
+            return
+
+        stream = MessageStream(self._outbox, update)
+        llm_reply = await self._profiler.run(
+            "LLM_PROMPT", self.prompt_llm, f"{update.message.text}", stream, chat_id=self.get_chat_id(update)
+        )
+        logger.debug("LLM reply: %s", llm_reply)
+        with INTENT_PARSE_SECONDS.labels("llm").time():
+            func_name, args = extract_function_info(llm_reply)
+        logger.debug("Extracted: %s %s", func_name, args)
+
+        if func_name is not None and func_name in self._param_map.keys() and not stream.started:
+            INTENTS.labels(func_name, "llm").inc()
+            await self._profiler.run(
+                func_name, self._param_map[func_name.upper()]["function"], update, context, args_list=args
             )
         else:
-            await update.message.reply_text(llm_reply)
+            # Answered in plain text
+            INTENTS.labels("CHAT", "llm").inc()
+            await stream.finish(llm_reply)
 
     async def send_bus_stop_image_async(
         self, update: Update, context, args_list: list = []
     ):
-        print("-"*10)
-        print(f"[{get_time_now()}] Received send bus stop image request.")
+        logger.info("Received send bus stop image request.")
 
-        bus_service_no = self.get_bus_service_no()
+        bus_service_no = self.get_bus_service_no(self.get_chat_id(update))
         if len(args_list) > 0:
             bus_service_no = args_list[0]
         file_path = os.path.dirname(__file__) + f"/../data/{bus_service_no}_route.png"
-        
-        await update.message.reply_text(f"This is the bus route of bus {bus_service_no}")
-        await update.message.reply_photo(photo=open(file_path, "rb"))
+        if not os.path.exists(file_path):
+            file_path = await asyncio.to_thread(self.render_route_image, bus_service_no)
+        if file_path is None:
+            await self._outbox.reply(update, self.get_bus_route_info(bus_service_no))
+            return
+
+        # Sent by file_id after the first upload
+        await self._outbox.reply_photo(
+            update, file_path, caption=f"This is the bus route of bus {bus_service_no}"
+        )
+
+    async def profile_async(self, update: Update, context, args_list: list = []):
+        """
+        /profile [secs] [sample_rate] profiles the handlers for secs (default 60), /profile stop ends
+        it early. Only for the chats in admin_chat_ids.
+        """
+
+        chat_id = self.get_chat_id(update)
+        if chat_id not in self._admin_chat_ids:
+            logger.warning("Chat %s is not allowed to profile.", chat_id)
+            return
+        args = list(context.args) if context is not None and context.args else args_list
+        if args and args[0].lower() == "stop":
+            if self._profiler.stop() is None:
+                await self._outbox.reply(update, "Not profiling.")
+            return
+
+        try:
+            secs = float(args[0]) if len(args) > 0 else 60.0
+            sample_rate = float(args[1]) if len(args) > 1 else 1.0
+        except ValueError:
+            await self._outbox.reply(update, "Usage: /profile [secs] [sample_rate], or /profile stop")
+            return
+
+        def on_done(result_dir):
+            task = asyncio.get_running_loop().create_task(
+                self._outbox.send_message(self._bot, chat_id, f"Profiles written to {os.path.abspath(result_dir)}")
+            )
+            self._background_tasks.add(task)
+            task.add_done_callback(self._background_tasks.discard)
+
+        self._profiler.start(secs, min(max(sample_rate, 0.0), 1.0), on_done=on_done)
+        await self._outbox.reply(update, f"Profiling handlers for {secs:g} s.")
 
 
 if __name__ == "__main__":
@@ -1,16 +1,18 @@
 #!/usr/bin/env python3
 import time
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+
+SGT = timezone(timedelta(hours=8))  # LTA DataMall timestamps are in Singapore time
 
 def process_time(timestamp_str, include_date: bool = False):
-    timestamp_dt = datetime.strptime(timestamp_str, "%Y-%m-%dT%H:%M:%S%z")
+    timestamp_dt = datetime.fromisoformat(timestamp_str)
     if not include_date:
         return timestamp_dt.strftime("%H:%M:%S")
     else:
         return timestamp_dt
     
 def datetime_to_timestamp(timestamp_str):
-    timestamp_dt = datetime.strptime(timestamp_str, "%Y-%m-%dT%H:%M:%S%z")
+    timestamp_dt = datetime.fromisoformat(timestamp_str)
     return timestamp_dt.timestamp()
 
 def get_time_now():
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+import time
+import asyncio
+
+
+class ArrivalCache:
+    """
+    Short-TTL cache of whole-stop BusArrival responses, keyed by bus stop code.
+
+    Concurrent misses for the same stop are coalesced: the first caller starts the upstream fetch
+    and everyone else awaits the same in-flight task (single-flight). Failed fetches are not cached.
+    """
+
+    def __init__(self, fetch, ttl: float = 20.0, max_entries: int = 4096):
+        """
+        Args:
+            fetch (coroutine function): fetch(bus_stop_code) returning the BusArrival response of the stop.
+            ttl (float): Secs a response is served from the cache.
+            max_entries (int): Upper bound on the number of cached stops.
+        """
+
+        self._fetch = fetch
+        self._ttl = ttl
+        self._max_entries = max_entries
+        self._entries = {}  # bus stop code -> (expiry time, response)
+        self._in_flight = {}  # bus stop code -> asyncio.Task
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    @property
+    def ttl(self):
+        return self._ttl
+
+    def __len__(self):
+        return len(self._entries)
+
+    async def get(self, bus_stop_code: str):
+        entry = self._entries.get(bus_stop_code)
+        if entry is not None and entry[0] > time.monotonic():
+            self.hits += 1
+            return entry[1]
+
+        task = self._in_flight.get(bus_stop_code)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            task = asyncio.ensure_future(self._fetch_and_store(bus_stop_code))
+            self._in_flight[bus_stop_code] = task
+        # Shielded so that a cancelled caller does not cancel the fetch for everyone else
+        return await asyncio.shield(task)
+
+    async def _fetch_and_store(self, bus_stop_code: str):
+        try:
+            response = await self._fetch(bus_stop_code)
+            self._store(bus_stop_code, response)
+            return response
+        finally:
+            self._in_flight.pop(bus_stop_code, None)
+
+    def _store(self, bus_stop_code: str, response):
+        if bus_stop_code not in self._entries and len(self._entries) >= self._max_entries:
+            now = time.monotonic()
+            for code in [code for code, entry in self._entries.items() if entry[0] <= now]:
+                del self._entries[code]
+            if len(self._entries) >= self._max_entries:
+                # Drop the oldest insertion
+                del self._entries[next(iter(self._entries))]
+        self._entries.pop(bus_stop_code, None)
+        self._entries[bus_stop_code] = (time.monotonic() + self._ttl, response)
+
+    def invalidate(self, bus_stop_code: str = None):
+        if bus_stop_code is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(bus_stop_code, None)
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "entries": len(self._entries),
+            "in_flight": len(self._in_flight),
+        }
+
+
+if __name__ == "__main__":
+    # Example usage:
+    async def fetch(bus_stop_code):
+        await asyncio.sleep(0.1)
+        return {"BusStopCode": bus_stop_code, "Services": []}
+
+    async def main():
+        cache = ArrivalCache(fetch, ttl=15.0)
+        await asyncio.gather(*[cache.get("27011") for _ in range(1000)])
+        await cache.get("27011")
+        print(cache.stats())  # Should print: 1 miss, 999 coalesced, 1 hit
+
+    asyncio.run(main())
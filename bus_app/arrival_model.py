@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+import functools
+import numpy as np
+from datetime import datetime
+from collections import namedtuple
+from app_utils import SGT
+
+LOAD_DESC = {
+    "SEA": "seats available",
+    "SDA": "standing available",
+    "LSD": "limited standing",
+}
+BUS_TYPE_DESC = {
+    "SD": "single deck",
+    "DD": "double deck",
+    "BD": "bendy",
+}
+
+NextBus = namedtuple("NextBus", ["est_arrival", "load", "bus_type", "wheelchair", "monitored"])
+ServiceArrival = namedtuple("ServiceArrival", ["bus_service_no", "bus_stop_code", "operator", "next_buses"])
+
+
+# ======================================== Times ========================================
+# Arrival times are kept as epoch secs: they compare with time.time() whatever the host's timezone,
+# and are only turned into Singapore time to be shown.
+@functools.lru_cache(maxsize=4096)
+def parse_timestamp(timestamp_str: str):
+    """Parses an ISO 8601 DataMall timestamp, e.g. 2024-09-20T08:01:02+08:00, into epoch secs."""
+    # The same estimates come back in every poll until the bus moves, hence the cache
+    return int(datetime.fromisoformat(timestamp_str).timestamp())
+
+
+def format_time(timestamp: float, fmt: str = "%H:%M:%S"):
+    """Formats epoch secs in Singapore time."""
+    return datetime.fromtimestamp(timestamp, SGT).strftime(fmt)
+
+
+def reminder_fire_times(est_arrivals, reminder_mins):
+    """
+    Fire times of every reminder offset before every estimated arrival, in one operation.
+
+    Args:
+        est_arrivals (list): Estimated arrivals in epoch secs.
+        reminder_mins (list): Reminder offsets in mins before the arrival.
+
+    Returns:
+        np.ndarray: [len(est_arrivals), len(reminder_mins)] fire times in epoch secs.
+    """
+
+    return np.asarray(est_arrivals, dtype=np.float64)[:, None] - np.asarray(reminder_mins, dtype=np.float64)[None, :] * 60.0
+
+
+def closest_estimates(current, estimates):
+    """
+    Matches each current estimate with the closest new one, in one operation.
+
+    Args:
+        current (list): Estimated arrivals a batch of reminders follow, in epoch secs.
+        estimates (list): New estimated arrivals, in epoch secs. Must not be empty.
+
+    Returns:
+        (np.ndarray, np.ndarray): The index in estimates of the closest new estimate of each current
+            one, and how far it is from the current one, in secs.
+    """
+
+    current = np.asarray(current, dtype=np.float64)
+    gaps = np.abs(np.asarray(estimates, dtype=np.float64)[None, :] - current[:, None])
+    closest = gaps.argmin(axis=1)
+    return closest, gaps[np.arange(len(current)), closest]
+
+
+# ======================================== Parsing ========================================
+def parse_next_bus(next_bus: dict):
+    """
+    Parses one NextBus/NextBus2/NextBus3 entry of a BusArrival response.
+
+    Returns:
+        NextBus: est_arrival is in epoch secs, or None if there is no bus.
+    """
+
+    if not next_bus or not next_bus.get("EstimatedArrival"):
+        return None
+    return NextBus(
+        est_arrival=parse_timestamp(next_bus["EstimatedArrival"]),
+        load=next_bus.get("Load", ""),
+        bus_type=next_bus.get("Type", ""),
+        wheelchair=next_bus.get("Feature", "") == "WAB",
+        monitored=bool(next_bus.get("Monitored", 0)),
+    )
+
+
+def parse_bus_arrival(data: dict, bus_services: list = None):
+    """
+    Parses a whole-stop BusArrival response.
+
+    Args:
+        data (dict): The BusArrival response.
+        bus_services (list): Only keep these bus service numbers. Keep every service if None.
+
+    Returns:
+        dict: {bus_service_no: ServiceArrival}, in the order of the response.
+    """
+
+    bus_stop_code = data.get("BusStopCode", "")
+    wanted = set(bus_services) if bus_services is not None else None
+    arrivals = {}
+    for service in data.get("Services", []):
+        bus_service_no = service.get("ServiceNo", "")
+        if wanted is not None and bus_service_no not in wanted:
+            continue
+        next_buses = tuple(
+            next_bus
+            for next_bus in (
+                parse_next_bus(service.get(key))
+                for key in ("NextBus", "NextBus2", "NextBus3")
+            )
+            if next_bus is not None
+        )
+        arrivals[bus_service_no] = ServiceArrival(
+            bus_service_no, bus_stop_code, service.get("Operator", ""), next_buses
+        )
+    return arrivals
+
+
+def format_service_arrival(arrival: ServiceArrival):
+    if len(arrival.next_buses) == 0:
+        return f"No estimated arrival for bus {arrival.bus_service_no} at station {arrival.bus_stop_code}."
+
+    first = arrival.next_buses[0]
+    details = [LOAD_DESC.get(first.load, ""), BUS_TYPE_DESC.get(first.bus_type, "")]
+    if first.wheelchair:
+        details.append("wheelchair accessible")
+    details = ", ".join(detail for detail in details if detail)
+
+    text = f"Next bus {arrival.bus_service_no} arriving at station {arrival.bus_stop_code} at {format_time(first.est_arrival)}"
+    if details:
+        text += f" ({details})"
+    following = [format_time(next_bus.est_arrival) for next_bus in arrival.next_buses[1:]]
+    if following:
+        text += ", followed by " + " and ".join(following)
+    return text
+
+
+if __name__ == "__main__":
+    # Example usage:
+    data = {
+        "BusStopCode": "27011",
+        "Services": [
+            {
+                "ServiceNo": "199",
+                "Operator": "SBST",
+                "NextBus": {"EstimatedArrival": "2024-09-20T08:01:02+08:00", "Load": "SEA", "Type": "DD", "Feature": "WAB", "Monitored": 1},
+                "NextBus2": {"EstimatedArrival": "2024-09-20T08:11:40+08:00", "Load": "SDA", "Type": "SD", "Feature": "WAB", "Monitored": 1},
+                "NextBus3": {"EstimatedArrival": "", "Load": "", "Type": "", "Feature": "", "Monitored": 0},
+            },
+        ],
+    }
+    for arrival in parse_bus_arrival(data).values():
+        print(format_service_arrival(arrival))
+
+    # Benchmark: parsing timestamps and computing reminder fire times
+    import time
+
+    timestamps = [f"2024-09-20T08:{i // 60 % 60:02d}:{i % 60:02d}+08:00" for i in range(3000)]
+    start = time.perf_counter()
+    for timestamp in timestamps:
+        datetime.strptime(timestamp, "%Y-%m-%dT%H:%M:%S%z").timestamp()
+    strptime = (time.perf_counter() - start) / len(timestamps)
+    parse_timestamp.cache_clear()
+    start = time.perf_counter()
+    for timestamp in timestamps:
+        parse_timestamp(timestamp)
+    parsed = (time.perf_counter() - start) / len(timestamps)
+    start = time.perf_counter()
+    for timestamp in timestamps:
+        parse_timestamp(timestamp)
+    cached = (time.perf_counter() - start) / len(timestamps)
+    print(f"strptime {strptime * 1e6:.2f} us, fromisoformat {parsed * 1e6:.2f} us, cached {cached * 1e6:.2f} us per timestamp")
+
+    est_arrivals = [parse_timestamp(timestamp) for timestamp in timestamps] * 10
+    reminder_mins = [15.0, 10.0, 5.0]
+    start = time.perf_counter()
+    loop = [[est_arrival - mins * 60.0 for mins in reminder_mins] for est_arrival in est_arrivals]
+    looped = time.perf_counter() - start
+    start = time.perf_counter()
+    batch = reminder_fire_times(est_arrivals, reminder_mins)
+    batched = time.perf_counter() - start
+    assert np.array_equal(batch, np.array(loop))
+    print(f"{batch.size} fire times: loop {looped * 1000:.2f} ms, batch {batched * 1000:.2f} ms")
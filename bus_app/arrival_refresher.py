@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+import time
+import asyncio
+import logging
+import numpy as np
+from arrival_model import closest_estimates
+
+logger = logging.getLogger(__name__)
+
+
+class TrackedReminder:
+    """A scheduled reminder whose fire time follows the estimated arrival of one bus."""
+
+    __slots__ = ("job_id", "chat_id", "bus_service_no", "bus_stop_code", "mins_left", "est_arrival")
+
+    def __init__(self, job_id, chat_id, bus_service_no, bus_stop_code, mins_left, est_arrival):
+        self.job_id = job_id
+        self.chat_id = chat_id
+        self.bus_service_no = bus_service_no
+        self.bus_stop_code = bus_stop_code
+        self.mins_left = mins_left
+        self.est_arrival = est_arrival  # epoch secs
+
+    @property
+    def fire_timestamp(self):
+        return self.est_arrival - self.mins_left * 60.0
+
+
+class ArrivalRefresher:
+    """
+    Background task that keeps pending reminders in line with the latest arrival estimates.
+
+    Reminders are grouped by (bus stop code, bus service no), and each pair is polled once no
+    matter how many chats wait on it. A pair is polled every quarter of the time left until its
+    soonest reminder, clamped to [min_interval, max_interval], so polling tightens as the bus
+    approaches. Each reminder follows the new estimate closest to its own; when that moved by more
+    than drift_threshold secs the reschedule callback is called with the updated reminder.
+    """
+
+    def __init__(
+        self,
+        get_arrivals,
+        reschedule,
+        min_interval: float = 15.0,  # in secs
+        max_interval: float = 120.0,  # in secs
+        drift_threshold: float = 30.0,  # in secs
+        max_match_gap: float = 600.0,  # in secs
+    ):
+        """
+        Args:
+            get_arrivals (coroutine function): get_arrivals(bus_stop_code, [bus_service_no]) -> {bus_service_no: ServiceArrival} or None.
+            reschedule (function): reschedule(reminder) called after reminder.est_arrival was updated.
+                Returns False if the reminder no longer exists.
+        """
+
+        self._get_arrivals = get_arrivals
+        self._reschedule = reschedule
+        self._min_interval = min_interval
+        self._max_interval = max_interval
+        self._drift_threshold = drift_threshold
+        self._max_match_gap = max_match_gap
+
+        self._reminders = {}  # job id -> TrackedReminder
+        self._pairs = {}  # (bus stop code, bus service no) -> set of job ids
+        self._next_poll = {}  # (bus stop code, bus service no) -> timestamp
+        self._wakeup = None
+        self._task = None
+        self.polls = 0
+        self.rescheduled = 0
+
+    def __len__(self):
+        return len(self._reminders)
+
+    def pairs(self):
+        return list(self._pairs.keys())
+
+    def track(self, reminder: TrackedReminder):
+        self.track_many([reminder])
+
+    def track_many(self, reminders: list):
+        now = time.time()
+        for reminder in reminders:
+            self._reminders[reminder.job_id] = reminder
+            pair = (reminder.bus_stop_code, reminder.bus_service_no)
+            self._pairs.setdefault(pair, set()).add(reminder.job_id)
+            # Only the new reminders can bring the pair's poll forward
+            poll_at = now + self._interval(pair, reminder.fire_timestamp)
+            if poll_at < self._next_poll.get(pair, float("inf")):
+                self._next_poll[pair] = poll_at
+        if reminders:
+            self.start()
+            self._wakeup.set()
+
+    def untrack(self, job_id):
+        reminder = self._reminders.pop(job_id, None)
+        if reminder is None:
+            return
+        pair = (reminder.bus_stop_code, reminder.bus_service_no)
+        job_ids = self._pairs.get(pair)
+        if job_ids is not None:
+            job_ids.discard(job_id)
+            if len(job_ids) == 0:
+                del self._pairs[pair]
+                self._next_poll.pop(pair, None)
+
+    def untrack_chat(self, chat_id):
+        for job_id in [job_id for job_id, reminder in self._reminders.items() if reminder.chat_id == chat_id]:
+            self.untrack(job_id)
+
+    # ======================================== Polling ========================================
+    def _interval(self, pair, soonest: float = None):
+        now = time.time()
+        if soonest is None:
+            soonest = min(
+                (self._reminders[job_id].fire_timestamp for job_id in self._pairs.get(pair, ())),
+                default=now + 4 * self._max_interval,
+            )
+        return min(max((soonest - now) / 4.0, self._min_interval), self._max_interval)
+
+    def start(self):
+        """Starts the polling task on the running event loop if it is not running yet."""
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            now = time.time()
+            due = [pair for pair, poll_at in self._next_poll.items() if poll_at <= now]
+            if due:
+                await asyncio.gather(*[self._refresh(pair) for pair in due])
+                continue
+
+            timeout = min(self._next_poll.values(), default=now + 3600.0) - now
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _refresh(self, pair):
+        bus_stop_code, bus_service_no = pair
+        self.polls += 1
+        try:
+            arrivals = await self._get_arrivals(bus_stop_code, [bus_service_no])
+        except Exception as e:
+            logger.warning("Failed to refresh %s: %r", pair, e)
+            arrivals = None
+
+        now = time.time()
+        arrival = arrivals.get(bus_service_no) if arrivals else None
+        estimates = [next_bus.est_arrival for next_bus in arrival.next_buses] if arrival is not None else []
+
+        reminders = []
+        for job_id in list(self._pairs.get(pair, ())):
+            if self._reminders[job_id].fire_timestamp <= now:
+                # Fired already or about to; nothing left to correct
+                self.untrack(job_id)
+            else:
+                reminders.append(self._reminders[job_id])
+
+        if len(reminders) > 0 and len(estimates) > 0:
+            # Every reminder of the pair is matched with its closest new estimate at once
+            closest, drift = closest_estimates([reminder.est_arrival for reminder in reminders], estimates)
+            for i in np.flatnonzero((drift > self._drift_threshold) & (drift <= self._max_match_gap)):
+                reminder = reminders[i]
+                reminder.est_arrival = estimates[closest[i]]
+                if self._reschedule(reminder) is False:
+                    self.untrack(reminder.job_id)
+                else:
+                    self.rescheduled += 1
+
+        if pair in self._pairs:
+            self._next_poll[pair] = time.time() + self._interval(pair)
+
+    def stats(self):
+        return {
+            "reminders": len(self._reminders),
+            "pairs": len(self._pairs),
+            "polls": self.polls,
+            "rescheduled": self.rescheduled,
+        }
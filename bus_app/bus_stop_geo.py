@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+import math
+import heapq
+from array import array
+from collections import namedtuple
+from bus_stop_index import get_bus_stop_index, DEFAULT_BUS_STOP_FILE
+
+EARTH_RADIUS = 6371000.0  # in metres
+CELL_SIZE = 250.0  # in metres
+NEARBY_RADIUS = 500.0  # in metres
+NEAREST_MAX_DISTANCE = 3000.0  # in metres, how far to look when no stop is within NEARBY_RADIUS
+
+NearbyStop = namedtuple("NearbyStop", ["code", "name", "distance"])  # distance in metres
+
+
+class BusStopGeoIndex:
+    """
+    Uniform grid over the bus stop coordinates of a BusStopIndex.
+
+    Coordinates are projected once onto a local plane (equirectangular around the mean latitude,
+    accurate to well under a metre over Singapore) and bucketed into CELL_SIZE cells. Queries only
+    look at the cells around the point, ring by ring, so they touch a few dozen stops instead of
+    all of them. Rings are clipped to the cells spanned by the stops, and points outside that box
+    are compared against every stop, so a point far from Singapore costs one pass over the stops.
+    Stops without coordinates are left out.
+    """
+
+    def __init__(self, bus_stop_index, cell_size: float = CELL_SIZE):
+        self.bus_stop_index = bus_stop_index
+        self._cell_size = cell_size
+
+        self._x = array("d", bytes(8 * len(bus_stop_index)))
+        self._y = array("d", bytes(8 * len(bus_stop_index)))
+        located = [
+            (row, bus_stop)
+            for row, bus_stop in enumerate(bus_stop_index)
+            if bus_stop.latitude != 0.0 or bus_stop.longitude != 0.0
+        ]
+        if located:
+            self._lat0 = math.radians(sum(bus_stop.latitude for _, bus_stop in located) / len(located))
+        else:
+            self._lat0 = 0.0
+        self._cos_lat0 = math.cos(self._lat0)
+
+        cells = {}
+        self._located = array("I", (row for row, _ in located))
+        for row, bus_stop in located:
+            x, y = self._project(bus_stop.latitude, bus_stop.longitude)
+            self._x[row] = x
+            self._y[row] = y
+            cells.setdefault(self._cell_of(x, y), array("I")).append(row)
+        self._cells = cells
+
+        if cells:
+            self._min_cx = min(cx for cx, _ in cells)
+            self._max_cx = max(cx for cx, _ in cells)
+            self._min_cy = min(cy for _, cy in cells)
+            self._max_cy = max(cy for _, cy in cells)
+        self._size = len(located)
+
+    def __len__(self):
+        return self._size
+
+    def _project(self, latitude: float, longitude: float):
+        return (
+            EARTH_RADIUS * math.radians(longitude) * self._cos_lat0,
+            EARTH_RADIUS * math.radians(latitude),
+        )
+
+    def _cell_of(self, x: float, y: float):
+        return (math.floor(x / self._cell_size), math.floor(y / self._cell_size))
+
+    def _ring(self, cx: int, cy: int, r: int):
+        """Yields the rows in the cells at Chebyshev distance r from cell (cx, cy)."""
+        cells = self._cells
+        if r == 0:
+            yield from cells.get((cx, cy), ())
+            return
+        # Only the parts of the ring within the cells spanned by the stops
+        min_x, max_x = max(cx - r, self._min_cx), min(cx + r, self._max_cx)
+        min_y, max_y = max(cy - r + 1, self._min_cy), min(cy + r - 1, self._max_cy)
+        for y in (cy - r, cy + r):
+            if self._min_cy <= y <= self._max_cy:
+                for x in range(min_x, max_x + 1):
+                    yield from cells.get((x, y), ())
+        for x in (cx - r, cx + r):
+            if self._min_cx <= x <= self._max_cx:
+                for y in range(min_y, max_y + 1):
+                    yield from cells.get((x, y), ())
+
+    def _max_ring(self, cx: int, cy: int):
+        # Beyond this ring there are no more cells with stops
+        return max(
+            cx - self._min_cx, self._max_cx - cx, cy - self._min_cy, self._max_cy - cy, 0
+        )
+
+    def _to_nearby(self, distance: float, row: int):
+        code = self.bus_stop_index.codes[row]
+        return NearbyStop(code, self.bus_stop_index.name_of(code), distance)
+
+    def nearest(self, latitude: float, longitude: float, k: int = 5, max_distance: float = math.inf):
+        """
+        Returns:
+            list: Up to k NearbyStop closest to the point and within max_distance metres, closest first.
+        """
+
+        if self._size == 0 or k <= 0:
+            return []
+        x, y = self._project(latitude, longitude)
+        cx, cy = self._cell_of(x, y)
+        if not (self._min_cx <= cx <= self._max_cx and self._min_cy <= cy <= self._max_cy):
+            return self._nearest_outside(x, y, k, max_distance)
+        # Distance from the point to the nearest edge of its own cell
+        margin = min(
+            x - cx * self._cell_size,
+            (cx + 1) * self._cell_size - x,
+            y - cy * self._cell_size,
+            (cy + 1) * self._cell_size - y,
+        )
+
+        found = []  # max-heap of (-distance, row) holding the k closest so far
+        last_ring = self._max_ring(cx, cy)
+        if max_distance != math.inf:
+            last_ring = min(last_ring, int(max_distance // self._cell_size) + 1)
+        for r in range(last_ring + 1):
+            for row in self._ring(cx, cy, r):
+                distance = math.hypot(self._x[row] - x, self._y[row] - y)
+                if distance > max_distance:
+                    continue
+                if len(found) < k:
+                    heapq.heappush(found, (-distance, row))
+                elif distance < -found[0][0]:
+                    heapq.heapreplace(found, (-distance, row))
+            # Stops in rings further out are at least this far away
+            if len(found) == k and -found[0][0] <= margin + r * self._cell_size:
+                break
+
+        return [self._to_nearby(-distance, row) for distance, row in sorted(found, reverse=True)]
+
+    def _nearest_outside(self, x: float, y: float, k: int, max_distance: float):
+        # Every stop is in the box spanned by the cells, none is closer than the box
+        size = self._cell_size
+        dx = max(self._min_cx * size - x, x - (self._max_cx + 1) * size, 0.0)
+        dy = max(self._min_cy * size - y, y - (self._max_cy + 1) * size, 0.0)
+        if math.hypot(dx, dy) > max_distance:
+            return []
+        distances = ((math.hypot(self._x[row] - x, self._y[row] - y), row) for row in self._located)
+        found = heapq.nsmallest(k, (item for item in distances if item[0] <= max_distance))
+        return [self._to_nearby(distance, row) for distance, row in found]
+
+    def within(self, latitude: float, longitude: float, radius: float = NEARBY_RADIUS):
+        """
+        Returns:
+            list: Every NearbyStop within radius metres of the point, closest first.
+        """
+
+        if self._size == 0:
+            return []
+        x, y = self._project(latitude, longitude)
+        cx, cy = self._cell_of(x, y)
+        last_ring = min(self._max_ring(cx, cy), int(radius // self._cell_size) + 1)
+
+        found = []
+        for r in range(last_ring + 1):
+            for row in self._ring(cx, cy, r):
+                distance = math.hypot(self._x[row] - x, self._y[row] - y)
+                if distance <= radius:
+                    found.append((distance, row))
+        found.sort()
+        return [self._to_nearby(distance, row) for distance, row in found]
+
+
+# ======================================== Shared Index ========================================
+_geo_index = None
+_prebuilt_geo_index = None  # built for an index about to be installed, see install_bus_stop_geo_index
+
+
+def get_bus_stop_geo_index(file_path: str = DEFAULT_BUS_STOP_FILE):
+    """
+    Returns the shared BusStopGeoIndex, rebuilt whenever the underlying BusStopIndex is reloaded.
+    Returns None if the bus stop file does not exist.
+    """
+
+    global _geo_index
+    bus_stop_index = get_bus_stop_index(file_path)
+    if bus_stop_index is None:
+        return None
+    geo_index = _geo_index
+    if geo_index is None or geo_index.bus_stop_index is not bus_stop_index:
+        geo_index = _prebuilt_geo_index
+        if geo_index is None or geo_index.bus_stop_index is not bus_stop_index:
+            geo_index = BusStopGeoIndex(bus_stop_index)
+        _geo_index = geo_index
+    return geo_index
+
+
+def install_bus_stop_geo_index(geo_index: BusStopGeoIndex):
+    """
+    Hands over a BusStopGeoIndex built ahead, e.g. in a worker thread, for an index that is about to be
+    installed, so that the first lookup on that index does not build one.
+    """
+
+    global _prebuilt_geo_index
+    _prebuilt_geo_index = geo_index
+
+
+if __name__ == "__main__":
+    # Example usage:
+    import time
+    import random
+
+    start = time.perf_counter()
+    geo_index = get_bus_stop_geo_index()
+    print(f"Built grid over {len(geo_index)} bus stops in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    for bus_stop in geo_index.nearest(1.35483, 103.68501, k=3):  # NTU Hall 11
+        print(bus_stop)
+
+    points = [(random.uniform(1.25, 1.45), random.uniform(103.65, 104.0)) for _ in range(10000)]
+    start = time.perf_counter()
+    for latitude, longitude in points:
+        geo_index.nearest(latitude, longitude, k=5)
+    print(f"nearest k=5: {(time.perf_counter() - start) / len(points) * 1e6:.1f} us")
+
+    start = time.perf_counter()
+    for latitude, longitude in points:
+        geo_index.within(latitude, longitude, 500.0)
+    print(f"within 500 m: {(time.perf_counter() - start) / len(points) * 1e6:.1f} us")
+
+    # Brute force check
+    bus_stop_index = geo_index.bus_stop_index
+    for latitude, longitude in points[:200]:
+        x, y = geo_index._project(latitude, longitude)
+        expected = sorted(
+            (math.hypot(geo_index._x[row] - x, geo_index._y[row] - y), bus_stop_index.codes[row])
+            for row, bus_stop in enumerate(bus_stop_index)
+            if bus_stop.latitude != 0.0 or bus_stop.longitude != 0.0
+        )
+        assert [code for _, code in expected[:5]] == [stop.code for stop in geo_index.nearest(latitude, longitude, k=5)]
+        assert sorted(code for distance, code in expected if distance <= 500.0) == sorted(
+            stop.code for stop in geo_index.within(latitude, longitude, 500.0)
+        )
+    print("Matches brute force")
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+import os
+import csv
+import sys
+import mmap
+import time
+import struct
+import logging
+import threading
+from array import array
+from collections import namedtuple
+from types import MappingProxyType
+from text_utils import normalize_name
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUS_STOP_FILE = os.path.join(os.path.dirname(__file__), "..", "data", "bus_stop.csv")
+
+# Snapshot layout (little-endian): header, latitudes (float64 x count), longitudes (float64 x count),
+# then the code, road name, description and normalized name of every row as NUL-separated UTF-8.
+SNAPSHOT_MAGIC = b"BSTP"
+SNAPSHOT_VERSION = 1
+SNAPSHOT_HEADER = struct.Struct("<4sHHIIqq")  # magic, version, reserved, count, strings size, source mtime_ns, source size
+
+
+class BusStop(namedtuple("BusStop", ["code", "road_name", "description", "latitude", "longitude"])):
+    __slots__ = ()
+
+    @property
+    def name(self):
+        return self.road_name + "-" + self.description
+
+
+class BusStopIndex:
+    """
+    Immutable in-memory index over bus_stop.csv.
+
+    Rows are kept column-wise (tuples of strings, arrays of doubles) and addressed by row number,
+    so a lookup is a dict hit plus a few array reads.
+    """
+
+    __slots__ = (
+        "_codes",
+        "_road_names",
+        "_descriptions",
+        "_latitudes",
+        "_longitudes",
+        "_code_to_row",
+        "_normalized_names",
+        "_name_to_codes",
+    )
+
+    def __init__(self, codes, road_names, descriptions, latitudes, longitudes, normalized_names=None):
+        """
+        Args:
+            latitudes, longitudes: Any sequence of floats. Memoryviews of doubles (e.g. over a mapped
+                snapshot) are used as they are, without copying.
+            normalized_names: Optional. normalize_name of every row's name, computed if not given.
+        """
+
+        self._codes = tuple(codes)
+        self._road_names = tuple(road_names)
+        self._descriptions = tuple(descriptions)
+        self._latitudes = latitudes if isinstance(latitudes, memoryview) else array("d", latitudes)
+        self._longitudes = longitudes if isinstance(longitudes, memoryview) else array("d", longitudes)
+        self._code_to_row = MappingProxyType({code: row for row, code in enumerate(self._codes)})
+
+        if normalized_names is None:
+            normalized_names = [
+                normalize_name(road_name + " " + description)
+                for road_name, description in zip(self._road_names, self._descriptions)
+            ]
+        self._normalized_names = tuple(normalized_names)
+
+        name_to_codes = {}
+        for name, code in zip(self._normalized_names, self._codes):
+            name_to_codes.setdefault(name, []).append(code)
+        self._name_to_codes = MappingProxyType(
+            {name: tuple(codes) for name, codes in name_to_codes.items()}
+        )
+
+    @classmethod
+    def from_csv(cls, file_path: str = DEFAULT_BUS_STOP_FILE):
+        codes, road_names, descriptions, latitudes, longitudes = [], [], [], [], []
+        with open(file_path, "r", newline="") as f:
+            reader = csv.reader(f)
+            for row in reader:
+                if len(row) < 3 or not row[0].isdigit():
+                    # Header or malformed line
+                    continue
+                codes.append(row[0])
+                road_names.append(row[1])
+                descriptions.append(row[2])
+                latitudes.append(float(row[3]) if len(row) > 3 and row[3] else 0.0)
+                longitudes.append(float(row[4]) if len(row) > 4 and row[4] else 0.0)
+        return cls(codes, road_names, descriptions, latitudes, longitudes)
+
+    # ======================================== Snapshot ========================================
+    def write_snapshot(self, snapshot_path: str, source_signature: tuple = (0, 0)):
+        """
+        Writes the index as a binary snapshot, tagged with the (mtime_ns, size) of the CSV it was
+        built from. The file is written aside and renamed into place, so readers never see half of it.
+        """
+
+        count = len(self._codes)
+        strings = "\0".join(
+            field
+            for row in zip(self._codes, self._road_names, self._descriptions, self._normalized_names)
+            for field in row
+        ).encode("utf-8")
+        header = SNAPSHOT_HEADER.pack(
+            SNAPSHOT_MAGIC, SNAPSHOT_VERSION, 0, count, len(strings), source_signature[0], source_signature[1]
+        )
+        latitudes = array("d", self._latitudes)
+        longitudes = array("d", self._longitudes)
+        if sys.byteorder != "little":
+            latitudes.byteswap()
+            longitudes.byteswap()
+
+        tmp_path = f"{snapshot_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(header)
+            f.write(latitudes.tobytes())
+            f.write(longitudes.tobytes())
+            f.write(strings)
+        os.replace(tmp_path, snapshot_path)
+
+    @classmethod
+    def from_snapshot(cls, snapshot_path: str, source_signature: tuple = None):
+        """
+        Maps a snapshot written by write_snapshot. Coordinates stay in the mapped file, only the
+        strings are decoded. Returns None if the snapshot is missing, of another version, or was
+        built from a different CSV than source_signature.
+        """
+
+        if sys.byteorder != "little":
+            return None
+        try:
+            with open(snapshot_path, "rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+
+        size = len(mapped)
+        if size < SNAPSHOT_HEADER.size:
+            return None
+        magic, version, _, count, strings_size, mtime_ns, file_size = SNAPSHOT_HEADER.unpack_from(mapped)
+        start = SNAPSHOT_HEADER.size
+        end = start + 16 * count + strings_size
+        if (
+            magic != SNAPSHOT_MAGIC
+            or version != SNAPSHOT_VERSION
+            or size != end
+            or (source_signature is not None and (mtime_ns, file_size) != tuple(source_signature))
+        ):
+            return None
+
+        view = memoryview(mapped)
+        latitudes = view[start : start + 8 * count].cast("d")
+        longitudes = view[start + 8 * count : start + 16 * count].cast("d")
+        fields = str(view[start + 16 * count : end], "utf-8").split("\0") if count > 0 else []
+        if len(fields) != 4 * count:
+            return None
+        return cls(fields[0::4], fields[1::4], fields[2::4], latitudes, longitudes, fields[3::4])
+
+    def __len__(self):
+        return len(self._codes)
+
+    def __contains__(self, bus_stop_code):
+        return bus_stop_code in self._code_to_row
+
+    def __iter__(self):
+        return (self._record(row) for row in range(len(self._codes)))
+
+    def _record(self, row: int):
+        return BusStop(
+            self._codes[row],
+            self._road_names[row],
+            self._descriptions[row],
+            self._latitudes[row],
+            self._longitudes[row],
+        )
+
+    @property
+    def codes(self):
+        return self._codes
+
+    def row_of(self, bus_stop_code: str):
+        return self._code_to_row.get(bus_stop_code)
+
+    def get(self, bus_stop_code: str):
+        row = self._code_to_row.get(bus_stop_code)
+        return None if row is None else self._record(row)
+
+    def name_of(self, bus_stop_code: str):
+        row = self._code_to_row.get(bus_stop_code)
+        return None if row is None else self._road_names[row] + "-" + self._descriptions[row]
+
+    def coordinates_of(self, bus_stop_code: str):
+        row = self._code_to_row.get(bus_stop_code)
+        return None if row is None else (self._latitudes[row], self._longitudes[row])
+
+    def codes_for_name(self, bus_stop_name: str):
+        return self._name_to_codes.get(normalize_name(bus_stop_name), ())
+
+    def names(self):
+        return self._name_to_codes.keys()
+
+
+# ======================================== Shared Index ========================================
+_indexes = {}  # file path -> (file signature, BusStopIndex)
+_last_checked = {}  # file path -> monotonic time of the last stat
+_load_lock = threading.Lock()
+CHECK_INTERVAL = 1.0  # in secs
+
+
+def _file_signature(file_path: str):
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def snapshot_path_of(file_path: str):
+    return os.path.splitext(file_path)[0] + ".bin"
+
+
+def load_bus_stop_index(file_path: str = DEFAULT_BUS_STOP_FILE, signature: tuple = None):
+    """
+    Loads the index from the snapshot next to file_path if it is up to date, otherwise parses the
+    CSV and (re)generates the snapshot for the next start.
+    """
+
+    signature = _file_signature(file_path) if signature is None else signature
+    snapshot_path = snapshot_path_of(file_path)
+    index = BusStopIndex.from_snapshot(snapshot_path, signature)
+    if index is not None:
+        return index
+
+    index = BusStopIndex.from_csv(file_path)
+    try:
+        index.write_snapshot(snapshot_path, signature)
+    except OSError as e:
+        logger.warning("Could not write bus stop snapshot %s: %s", snapshot_path, e)
+    return index
+
+
+def get_bus_stop_index(file_path: str = DEFAULT_BUS_STOP_FILE, force_check: bool = False):
+    """
+    Returns the shared BusStopIndex for file_path, building it on first use.
+
+    The file is re-stat'ed at most once every CHECK_INTERVAL secs and the index is rebuilt when the
+    file changes. The new index replaces the old one in a single assignment, so readers always see
+    either the old or the new index. Returns None if the file does not exist.
+    """
+
+    file_path = os.path.abspath(file_path)
+    now = time.monotonic()
+    cached = _indexes.get(file_path)
+    if (
+        cached is not None
+        and not force_check
+        and now - _last_checked.get(file_path, 0.0) < CHECK_INTERVAL
+    ):
+        return cached[1]
+
+    signature = _file_signature(file_path)
+    _last_checked[file_path] = now
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+    if signature is None:
+        _indexes.pop(file_path, None)
+        return None
+
+    with _load_lock:
+        cached = _indexes.get(file_path)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        index = load_bus_stop_index(file_path, signature)
+        _indexes[file_path] = (signature, index)
+        return index
+
+
+def install_bus_stop_index(index: BusStopIndex, file_path: str = DEFAULT_BUS_STOP_FILE):
+    """
+    Makes index the shared index of file_path, right after file_path was replaced with the data
+    index was built from, and writes the matching snapshot. Readers switch over in a single assignment.
+    """
+
+    file_path = os.path.abspath(file_path)
+    signature = _file_signature(file_path)
+    try:
+        index.write_snapshot(snapshot_path_of(file_path), signature)
+    except OSError as e:
+        logger.warning("Could not write bus stop snapshot %s: %s", snapshot_path_of(file_path), e)
+    with _load_lock:
+        _indexes[file_path] = (signature, index)
+        _last_checked[file_path] = time.monotonic()
+
+
+if __name__ == "__main__":
+    # Example usage:
+    start = time.perf_counter()
+    index = get_bus_stop_index()
+    print(f"Loaded {len(index)} bus stops in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    start = time.perf_counter()
+    BusStopIndex.from_csv(DEFAULT_BUS_STOP_FILE)
+    print(f"CSV parse: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    start = time.perf_counter()
+    BusStopIndex.from_snapshot(snapshot_path_of(DEFAULT_BUS_STOP_FILE))
+    print(f"Snapshot load: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    start = time.perf_counter()
+    for _ in range(100000):
+        get_bus_stop_index().name_of("27011")
+    print(f"Lookup: {(time.perf_counter() - start) * 10:.2f} us")
+
+    print(index.get("27011"))  # Should print the NTU Hall 11 bus stop record
+    print(index.codes_for_name("Jurong West Ctrl 3-Boon Lay Int"))
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+import math
+import heapq
+from array import array
+from collections import namedtuple
+from text_utils import normalize_name
+from bus_stop_index import get_bus_stop_index, DEFAULT_BUS_STOP_FILE
+
+MATCH_CONFIDENCE_THRESHOLD = 0.6  # below this the LLM fallback is consulted
+TOKEN_WEIGHT = 0.6  # the rest of the score comes from trigram similarity
+
+# Full word -> abbreviation used by LTA in bus_stop.csv
+ABBREVIATIONS = {
+    "block": "blk",
+    "blocks": "blks",
+    "avenue": "ave",
+    "road": "rd",
+    "street": "st",
+    "drive": "dr",
+    "crescent": "cres",
+    "lorong": "lor",
+    "jalan": "jln",
+    "bukit": "bt",
+    "tanjong": "tg",
+    "sungei": "sg",
+    "upper": "upp",
+    "north": "nth",
+    "south": "sth",
+    "opposite": "opp",
+    "after": "aft",
+    "before": "bef",
+    "between": "bet",
+    "station": "stn",
+    "mrt": "stn",
+    "interchange": "int",
+    "central": "ctrl",
+    "centre": "ctr",
+    "center": "ctr",
+    "carpark": "cp",
+    "school": "sch",
+    "primary": "pr",
+    "secondary": "sec",
+    "industrial": "ind",
+    "building": "bldg",
+    "church": "ch",
+    "park": "pk",
+    "place": "pl",
+    "garden": "gdn",
+    "gardens": "gdns",
+    "heights": "hts",
+    "terminal": "ter",
+    "singapore": "spore",
+    "serangoon": "sgoon",
+    "commonwealth": "cwealth",
+    "condominium": "condo",
+    "hospital": "hosp",
+}
+
+BusStopMatch = namedtuple("BusStopMatch", ["code", "name", "score"])
+
+
+def canonical_tokens(name: str):
+    """Normalizes a bus stop name and maps every word onto its LTA abbreviation."""
+    return [ABBREVIATIONS.get(token, token) for token in normalize_name(name).split()]
+
+
+def trigrams(tokens: list):
+    text = " " + " ".join(tokens) + " "
+    return {text[i : i + 3] for i in range(len(text) - 2)}
+
+
+class BusStopMatcher:
+    """
+    Ranked fuzzy matcher over every bus stop in a BusStopIndex.
+
+    Two inverted indexes are kept, one over canonical tokens and one over character trigrams.
+    A candidate's score is the IDF-weighted share of query tokens it contains blended with the
+    Dice coefficient of the trigram sets, so "blk 683a jurong west central 1" still finds
+    "Jurong West Ctrl 1-Blk 683a" and small typos only cost a little.
+    """
+
+    def __init__(self, bus_stop_index):
+        self._index = bus_stop_index
+        self._codes = bus_stop_index.codes
+        self._names = []
+        self._token_postings = {}
+        self._trigram_postings = {}
+        self._trigram_counts = array("H")
+
+        for row, bus_stop in enumerate(bus_stop_index):
+            self._names.append(bus_stop.name)
+            tokens = canonical_tokens(bus_stop.road_name + " " + bus_stop.description)
+            for token in set(tokens):
+                self._token_postings.setdefault(token, array("I")).append(row)
+            grams = trigrams(tokens)
+            for gram in grams:
+                self._trigram_postings.setdefault(gram, array("I")).append(row)
+            self._trigram_counts.append(len(grams))
+
+        total = max(len(self._codes), 1)
+        self._idf = {
+            token: math.log(1.0 + total / len(rows))
+            for token, rows in self._token_postings.items()
+        }
+        self._max_idf = math.log(1.0 + total)
+
+    @property
+    def bus_stop_index(self):
+        return self._index
+
+    def match(self, bus_stop_name: str, top_k: int = 5):
+        """
+        Returns up to top_k BusStopMatch tuples, best first, with scores in [0, 1].
+        """
+
+        if bus_stop_name is None:
+            return []
+        bus_stop_name = bus_stop_name.strip()
+
+        # Bus stop code given directly
+        if bus_stop_name.isdigit():
+            name = self._index.name_of(bus_stop_name)
+            return [BusStopMatch(bus_stop_name, name, 1.0)] if name is not None else []
+
+        tokens = canonical_tokens(bus_stop_name)
+        if not tokens:
+            return []
+
+        query_tokens = set(tokens)
+        token_scores = {}
+        for token in query_tokens:
+            for row in self._token_postings.get(token, ()):
+                token_scores[row] = token_scores.get(row, 0.0) + self._idf[token]
+        token_total = sum(self._idf.get(token, self._max_idf) for token in query_tokens)
+
+        query_grams = trigrams(tokens)
+        common = {}
+        for gram in query_grams:
+            for row in self._trigram_postings.get(gram, ()):
+                common[row] = common.get(row, 0) + 1
+
+        n_query_grams = len(query_grams)
+        scored = []
+        for row, n_common in common.items():
+            dice = 2.0 * n_common / (n_query_grams + self._trigram_counts[row])
+            token_score = token_scores.get(row, 0.0) / token_total
+            scored.append((TOKEN_WEIGHT * token_score + (1.0 - TOKEN_WEIGHT) * dice, row))
+
+        return [
+            BusStopMatch(self._codes[row], self._names[row], round(min(score, 1.0), 4))
+            for score, row in heapq.nlargest(top_k, scored)
+        ]
+
+    def best_match(self, bus_stop_name: str):
+        matches = self.match(bus_stop_name, top_k=1)
+        return matches[0] if matches else None
+
+
+_matcher = None
+_prebuilt_matcher = None  # built for an index about to be installed, see install_bus_stop_matcher
+
+
+def get_bus_stop_matcher(file_path: str = DEFAULT_BUS_STOP_FILE):
+    """
+    Returns the shared BusStopMatcher, rebuilt whenever the underlying BusStopIndex is reloaded.
+    Returns None if the bus stop file does not exist.
+    """
+
+    global _matcher
+    bus_stop_index = get_bus_stop_index(file_path)
+    if bus_stop_index is None:
+        return None
+    matcher = _matcher
+    if matcher is None or matcher.bus_stop_index is not bus_stop_index:
+        matcher = _prebuilt_matcher
+        if matcher is None or matcher.bus_stop_index is not bus_stop_index:
+            matcher = BusStopMatcher(bus_stop_index)
+        _matcher = matcher
+    return matcher
+
+
+def install_bus_stop_matcher(matcher: BusStopMatcher):
+    """
+    Hands over a BusStopMatcher built ahead, e.g. in a worker thread, for an index that is about to be
+    installed, so that the first lookup on that index does not build one.
+    """
+
+    global _prebuilt_matcher
+    _prebuilt_matcher = matcher
+
+
+if __name__ == "__main__":
+    # Example usage:
+    import time
+
+    start = time.perf_counter()
+    matcher = get_bus_stop_matcher()
+    print(f"Built matcher in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    for query in ["Boon Lay Interchange", "hall 11", "Blk 683A Jurong West Central 1", "opp westwood secondary school", "clementi mrt"]:
+        start = time.perf_counter()
+        matches = matcher.match(query, top_k=3)
+        print(f"{query!r} ({(time.perf_counter() - start) * 1000:.2f} ms): {matches}")
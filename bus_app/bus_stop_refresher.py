@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+import os
+import csv
+import asyncio
+from collections import namedtuple
+from lta_client import LtaClient
+from bus_stop_index import (
+    BusStopIndex,
+    DEFAULT_BUS_STOP_FILE,
+    get_bus_stop_index,
+    install_bus_stop_index,
+)
+from bus_stop_matcher import BusStopMatcher, install_bus_stop_matcher
+from bus_stop_geo import BusStopGeoIndex, install_bus_stop_geo_index
+
+PAGE_SIZE = 500  # records per DataMall page
+BUS_STOP_FIELDS = ["BusStopCode", "RoadName", "Description", "Latitude", "Longitude"]
+# Singapore, with the cross-border stops in Johor Bahru
+LATITUDE_RANGE = (1.15, 1.55)
+LONGITUDE_RANGE = (103.55, 104.1)
+
+BusStopsDiff = namedtuple("BusStopsDiff", ["added", "removed", "changed", "total"])  # codes, codes, codes, count
+
+
+class DatasetError(Exception):
+    """Raised when a fetched dataset does not look complete enough to replace the current one."""
+
+
+async def fetch_pages(client: LtaClient, path: str, max_concurrency: int = 4, page_size: int = PAGE_SIZE):
+    """
+    Fetches every page of a paginated DataMall dataset, up to max_concurrency pages at a time.
+
+    Pages are requested in order until one comes back shorter than page_size, which marks the end
+    of the dataset; pages past the end that were already in flight are discarded. Any page that
+    fails after the client's retries fails the whole fetch with LtaError.
+
+    Returns:
+        list: The records of all pages, in order.
+    """
+
+    pages = {}  # page no -> records
+    last_page = None  # first page shorter than page_size
+    next_page = 0
+    pending = {}  # task -> page no
+
+    async def fetch(page: int):
+        data = await client.get(path, params={"$skip": page * page_size})
+        return data.get("value") or []
+
+    try:
+        while True:
+            while len(pending) < max_concurrency and (last_page is None or next_page <= last_page):
+                pending[asyncio.ensure_future(fetch(next_page))] = next_page
+                next_page += 1
+            if len(pending) == 0:
+                break
+
+            done, _ = await asyncio.wait(pending.keys(), return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                page = pending.pop(task)
+                records = task.result()
+                pages[page] = records
+                if len(records) < page_size and (last_page is None or page < last_page):
+                    last_page = page
+            if last_page is not None:
+                # Pages past the end are not needed
+                for task, page in list(pending.items()):
+                    if page > last_page:
+                        task.cancel()
+                        del pending[task]
+    finally:
+        for task in pending:
+            task.cancel()
+
+    return [record for page in range(last_page + 1) for record in pages[page]]
+
+
+def validate_bus_stops(records: list, current_count: int = 0, min_ratio: float = 0.9):
+    """
+    Checks the fetched BusStops records and returns them as CSV rows (lists of strings).
+
+    Raises:
+        DatasetError: If a record is malformed or lies outside Singapore (e.g. at 0/0), codes repeat,
+            or the dataset is much smaller than the current one (a sign of a truncated fetch).
+    """
+
+    rows = []
+    codes = set()
+    for record in records:
+        code = str(record.get("BusStopCode", ""))
+        if not code.isdigit():
+            raise DatasetError(f"Invalid bus stop code {code!r}")
+        if code in codes:
+            raise DatasetError(f"Duplicate bus stop code {code}")
+        try:
+            latitude = float(record.get("Latitude") or 0.0)
+            longitude = float(record.get("Longitude") or 0.0)
+        except (TypeError, ValueError):
+            raise DatasetError(f"Invalid coordinates of bus stop {code}")
+        if not (
+            LATITUDE_RANGE[0] <= latitude <= LATITUDE_RANGE[1] and LONGITUDE_RANGE[0] <= longitude <= LONGITUDE_RANGE[1]
+        ):
+            raise DatasetError(f"Coordinates of bus stop {code} out of range: {latitude}, {longitude}")
+        codes.add(code)
+        rows.append([code, record.get("RoadName") or "", record.get("Description") or "", repr(latitude), repr(longitude)])
+
+    if len(rows) == 0:
+        raise DatasetError("No bus stops fetched")
+    if len(rows) < current_count * min_ratio:
+        raise DatasetError(f"Only {len(rows)} bus stops fetched, {current_count} currently known")
+    return rows
+
+
+def diff_bus_stops(bus_stop_index: BusStopIndex, new_index: BusStopIndex):
+    old_codes = set(bus_stop_index.codes) if bus_stop_index is not None else set()
+    new_codes = set(new_index.codes)
+    changed = []
+    for code in sorted(old_codes & new_codes):
+        if bus_stop_index.get(code) != new_index.get(code):
+            changed.append(code)
+    return BusStopsDiff(
+        tuple(sorted(new_codes - old_codes)), tuple(sorted(old_codes - new_codes)), tuple(changed), len(new_codes)
+    )
+
+
+def write_bus_stops(rows: list, file_path: str):
+    """Writes rows as the bus stop CSV, written aside and renamed into place."""
+    tmp_path = f"{file_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(BUS_STOP_FIELDS)
+        writer.writerows(rows)
+    os.replace(tmp_path, file_path)
+
+
+class BusStopRefresher:
+    """
+    Refreshes the bus stop dataset from DataMall's BusStops endpoint.
+
+    Pages are fetched concurrently, validated and diffed against the current index. Only a changed
+    dataset is written: the CSV and its snapshot are replaced atomically and the new index is
+    installed as the shared one, so handlers keep using the old index until the swap. Parsing,
+    writing and building the name matcher and geo grid of the new index run in a worker thread, so
+    no handler rebuilds them after the swap. Concurrent refresh() calls share one refresh.
+    """
+
+    def __init__(
+        self,
+        lta_client: LtaClient,
+        file_path: str = DEFAULT_BUS_STOP_FILE,
+        max_concurrency: int = 4,
+        page_size: int = PAGE_SIZE,
+        min_ratio: float = 0.9,
+    ):
+        self._lta_client = lta_client
+        self._file_path = file_path
+        self._max_concurrency = max_concurrency
+        self._page_size = page_size
+        self._min_ratio = min_ratio
+        self._task = None
+
+    async def refresh(self):
+        """
+        Returns:
+            BusStopsDiff: What changed. Nothing is written if nothing changed.
+
+        Raises:
+            LtaError: If DataMall could not be fetched.
+            DatasetError: If the fetched dataset failed validation.
+        """
+
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._refresh())
+        return await asyncio.shield(self._task)
+
+    async def _refresh(self):
+        records = await fetch_pages(self._lta_client, "BusStops", self._max_concurrency, self._page_size)
+        return await asyncio.to_thread(self._apply, records)
+
+    def _apply(self, records: list):
+        bus_stop_index = get_bus_stop_index(self._file_path, force_check=True)
+        rows = validate_bus_stops(records, len(bus_stop_index) if bus_stop_index is not None else 0, self._min_ratio)
+        new_index = BusStopIndex(
+            [row[0] for row in rows],
+            [row[1] for row in rows],
+            [row[2] for row in rows],
+            [float(row[3]) for row in rows],
+            [float(row[4]) for row in rows],
+        )
+        diff = diff_bus_stops(bus_stop_index, new_index)
+        if bus_stop_index is not None and not (diff.added or diff.removed or diff.changed):
+            return diff
+
+        # Built before the swap, picked up by the first lookup on the new index
+        install_bus_stop_matcher(BusStopMatcher(new_index))
+        install_bus_stop_geo_index(BusStopGeoIndex(new_index))
+        write_bus_stops(rows, self._file_path)
+        install_bus_stop_index(new_index, self._file_path)
+        return diff
+
+
+if __name__ == "__main__":
+    # Example usage, against DataMall or e.g. a local fake: LTA_BASE_URL=http://127.0.0.1:8080 python bus_stop_refresher.py
+    import time
+    import tempfile
+    from lta_client import LTA_BASE_URL
+
+    async def main():
+        client = LtaClient(
+            api_key=os.environ.get("LTA_API_KEY", ""), base_url=os.environ.get("LTA_BASE_URL", LTA_BASE_URL)
+        )
+        file_path = os.path.join(tempfile.mkdtemp(), "bus_stop.csv")
+        refresher = BusStopRefresher(client, file_path)
+        try:
+            for _ in range(2):
+                start = time.perf_counter()
+                diff = await refresher.refresh()
+                print(
+                    f"Refreshed in {(time.perf_counter() - start) * 1000:.1f} ms: {diff.total} bus stops, "
+                    f"{len(diff.added)} added, {len(diff.removed)} removed, {len(diff.changed)} changed"
+                )
+        finally:
+            await client.close()
+
+    asyncio.run(main())
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+import re
+
+# Argument patterns
+SERVICE = r"(?:[a-z]{1,2})?\d{1,3}[a-z]?"  # 199, 179A, NR1
+SERVICES = rf"{SERVICE}(?:\s*(?:,|and|&)\s*{SERVICE})*"  # 199, 179 and 179A
+STOP_CODE = r"\d{5}"
+MINS = r"\d+(?:\.\d+)?"
+MIN_UNIT = r"(?:m|min|mins|minute|minutes)\b"
+WINDOW = r"\d{1,2}[:.]\d{2}\s*(?:-|–|to|until|till)\s*\d{1,2}[:.]\d{2}"  # 07:30-08:30, 7.30 to 8.30
+ARRIVING = r"(?:coming|come|arriv\w*|reach\w*|here)"
+AT_STOP = rf"(?:\s+(?:at|@)\s+(?:bus\s*stop\s*)?({STOP_CODE}|[a-z][^?]*?))?\s*\??$"  # optional trailing " at <stop>"
+BEFORE = r"(?:before|earlier|ahead)(?:\s+(?:the\s+)?(?:next\s+)?(?:bus\s+)?(?:arrives|comes|arrival|it\s+(?:arrives|comes)))?"
+ADDS = r"\b(?:also|another|add|extra)\b"  # a reminder kept next to the others
+DAYS = r"\b(?:weekdays?|weekends?|daily|every\s*day|(?:mon|tue|wed|thu|fri|sat|sun)\w*(?:\s*(?:,|and|&)\s*(?:mon|tue|wed|thu|fri|sat|sun)\w*)*)\b"
+
+
+class IntentRouter:
+    """
+    Rule-based intent classifier over the intents of App._param_map.
+
+    Each rule is a regex over the lowercased message plus a function building the argument list
+    from the match, so route() returns the same (function name, args) as
+    extract_function_info(llm_reply) would. Messages no rule matches return (None, None) and are
+    left to the LLM.
+    """
+
+    def __init__(self, param_map: dict):
+        rules = [
+            # Bare inputs: "199", "bus 179a", "27011"
+            ("BUS_ARRIVAL", rf"^(?:bus\s*)?({SERVICE})\s*\??$", lambda m: [m.group(1).upper()]),
+            ("BUS_ARRIVAL", rf"^(?:bus\s*stop\s*)?({STOP_CODE})\s*\??$", lambda m: ["", m.group(1)]),
+            # Reminders: "remind me 5 min before", "also remind me 10 mins before the bus arrives", "set a reminder
+            # for 3 mins". SET_REMINDER replaces the chat's bus reminders, so "remind me to call mom in 10 minutes" and
+            # other reminders that are not about the bus are left to the LLM.
+            (
+                "SET_REMINDER",
+                rf"^(?:please\s+)?(?:also\s+)?remind\s+me\s+(?:also\s+|again\s+)?({MINS})\s*{MIN_UNIT}\s+{BEFORE}\s*[.!]?$",
+                lambda m: [m.group(1), "false" if re.search(ADDS, m.string) else "true"],
+            ),
+            (
+                "SET_REMINDER",
+                rf"^(?:(?:set|add)\s+)?(?:a\s+|an\s+extra\s+|another\s+)?(?:bus\s+)?reminder\s+(?:at\s+|for\s+)?({MINS})"
+                rf"\s*(?:{MIN_UNIT})?(?:\s+{BEFORE})?\s*[.!]?$",
+                lambda m: [m.group(1), "false" if re.search(ADDS, m.string) else "true"],
+            ),
+            ("GET_REMINDER", r"\b(?:what|which|show|list|get|my|current)\b.*\breminders?\b|^reminders?\s*\??$", lambda m: []),
+            # Watches: "notify me about 199 at 27011 07:30-08:30 on weekdays", "remove watch 3f2a1c"
+            (
+                "SET_WATCH",
+                rf"\b(?:notify|update|alert|tell|message|ping|watch|send)\b.*?\b({SERVICE})\s+(?:at|@)\s+(?:bus\s*stop\s*)?({STOP_CODE})\b"
+                rf".*?\b({WINDOW})",
+                lambda m: [m.group(1).upper(), m.group(2), m.group(3), (re.search(DAYS, m.string) or [""])[0]],
+            ),
+            (
+                "REMOVE_WATCH",
+                r"\b(?:stop|remove|delete|cancel|unwatch)\b.*?\bwatch(?:es)?\b\s*#?([0-9a-f]{6}\b|all\b)?",
+                lambda m: [m.group(1)] if m.group(1) else (["all"] if re.search(r"\ball\b", m.string) else []),
+            ),
+            ("GET_WATCHES", r"\b(?:what|which|show|list|get|my|current)\b.*\bwatch(?:es)?\b|^watches\s*\??$", lambda m: []),
+            # Route questions: "which buses stop at 27011", "stops between 27011 and boon lay int on 199"
+            (
+                "GET_BUS_SERVICES_AT_STOP",
+                rf"\b(?:which|what)\s+(?:bus(?:es)?|services?|bus\s+services)\b.*?\b(?:stop|call|go|pass)\w*\s+(?:at|by|through)\s+"
+                rf"(?:bus\s*stop\s*)?({STOP_CODE}|[a-z][^?]*?)\s*\??$",
+                lambda m: [m.group(1)],
+            ),
+            (
+                "GET_STOPS_BETWEEN",
+                rf"\bstops?\b.*?\bbetween\s+(?:bus\s*stop\s*)?({STOP_CODE}|[a-z].*?)\s+and\s+(?:bus\s*stop\s*)?({STOP_CODE}|[a-z].*?)"
+                rf"\s+(?:on|for|of|by)\s+(?:bus\s*)?({SERVICE})\s*\??$",
+                lambda m: [m.group(3).upper(), m.group(1), m.group(2)],
+            ),
+            (
+                "GET_STOPS_BETWEEN",
+                rf"\bstops?\b.*?\b(?:on|for|of|by)\s+(?:bus\s*)?({SERVICE})\s+(?:from\s+|between\s+)(?:bus\s*stop\s*)?({STOP_CODE}|[a-z].*?)"
+                rf"\s+(?:and|to)\s+(?:bus\s*stop\s*)?({STOP_CODE}|[a-z][^?]*?)\s*\??$",
+                lambda m: [m.group(1).upper(), m.group(2), m.group(3)],
+            ),
+            # Routes: "show me the route of 199", "199 route"
+            (
+                "SHOW_BUS_ROUTE",
+                rf"^(?:show\s+(?:me\s+)?|what\s+is\s+|what's\s+)?(?:the\s+)?(?:bus\s*)?({SERVICE})(?:'s)?\s+route\s*\??$",
+                lambda m: [m.group(1).upper()],
+            ),
+            (
+                "SHOW_BUS_ROUTE",
+                rf"^(?:show\s+(?:me\s+)?|what\s+is\s+|what's\s+)?(?:the\s+)?route\s+(?:of|for)\s+(?:bus\s*)?({SERVICE})\s*\??$",
+                lambda m: [m.group(1).upper()],
+            ),
+            # Stop code <-> name
+            (
+                "GET_BUS_STOP_NAME_FROM_CODE",
+                rf"\b(?:name\s+of|what\s+is|what's|where\s+is)\s+(?:bus\s*stop\s*(?:code\s*)?)?({STOP_CODE})\b",
+                lambda m: [m.group(1)],
+            ),
+            (
+                "GET_BUS_STOP_CODE_FROM_NAME",
+                r"\b(?:bus\s*)?stop\s+code\s+(?:of|for)\s+(.+?)\s*\??$|\bcode\s+(?:of|for)\s+(.+?)\s*\??$",
+                lambda m: [(m.group(1) or m.group(2)).strip()],
+            ),
+            # Tracking settings
+            (
+                "SET_BUS_STOP_CODE_FROM_CODE",
+                rf"\b(?:set|change|switch|track|use)\b.*\bstop\b.*?\b({STOP_CODE})\b",
+                lambda m: [m.group(1), "false"],
+            ),
+            (
+                "SET_BUS_STOP_CODE_FROM_NAME",
+                r"\b(?:set|change|switch|track|use)\b.*?\bstop\b(?:\s+code)?\s+(?:to|as)\s+(.+?)\s*$",
+                lambda m: [m.group(1), "true"],
+            ),
+            (
+                "SET_BUS_SERVICE_NO",
+                rf"\b(?:set|change|switch|track|use)\b.*?\b(?:bus|service)\b(?:\s+(?:no|number|service))?\s*(?:to|as)?\s+({SERVICE})\s*$",
+                lambda m: [m.group(1).upper()],
+            ),
+            ("GET_BUS_STOP_CODE", r"\b(?:what|which)\b.*\b(?:bus\s*)?stop\b.*\b(?:tracking|tracked|current|set|my)\b|\bcurrent\s+(?:bus\s*)?stop\b", lambda m: []),
+            ("GET_BUS_SERVICE_NUMBER", r"\b(?:what|which)\b.*\b(?:bus|service)\b.*\b(?:tracking|tracked|current|set|my)\b|\bcurrent\s+(?:bus|service)\b", lambda m: []),
+            # Arrival questions: "when is 199 coming", "199 at 27011", "when is the next 179 arriving at boon lay int".
+            # The service has to be right next to the arrival phrasing, since BUS_ARRIVAL also changes the tracked
+            # service; "next 2 buses" or "my bus 199 is not coming" are left to the LLM.
+            (
+                "BUS_ARRIVAL",
+                rf"^(?:bus\s*)?({SERVICES})\s+(?:at|@)\s+(?:bus\s*stop\s*)?({STOP_CODE}|[a-z][^?]*?)\s*\??$",
+                lambda m: [m.group(1), m.group(2)],
+            ),
+            (
+                "BUS_ARRIVAL",
+                rf"^(?:when|what\s+time)\s+(?:is|will|does|do|'s)\s+(?:the\s+)?(?:next\s+)?(?:bus\s*)?({SERVICES})"
+                rf"(?:\s+(?:be\s+)?{ARRIVING})?{AT_STOP}",
+                lambda m: [m.group(1), m.group(2)] if m.group(2) else [m.group(1)],
+            ),
+            (
+                "BUS_ARRIVAL",
+                rf"^how\s+long\s+(?:more\s+)?(?:for|until|till|before)\s+(?:the\s+)?(?:next\s+)?(?:bus\s*)?({SERVICES})"
+                rf"(?:\s+{ARRIVING})?{AT_STOP}",
+                lambda m: [m.group(1), m.group(2)] if m.group(2) else [m.group(1)],
+            ),
+            (
+                "BUS_ARRIVAL",
+                rf"^(?:eta|next)\s+(?:of\s+|for\s+)?(?:bus\s*)?({SERVICES}){AT_STOP}",
+                lambda m: [m.group(1), m.group(2)] if m.group(2) else [m.group(1)],
+            ),
+            (
+                "BUS_ARRIVAL",
+                rf"^(?:is\s+)?(?:the\s+)?(?:next\s+)?(?:bus\s*)?({SERVICES})\s+(?:{ARRIVING}(?:\s+soon)?|eta){AT_STOP}",
+                lambda m: [m.group(1), m.group(2)] if m.group(2) else [m.group(1)],
+            ),
+            (
+                "BUS_ARRIVAL",
+                rf"^(?:when\s+(?:is|will)\s+(?:my|the)\s+(?:next\s+)?bus(?:\s+(?:be\s+)?{ARRIVING})?|next\s+bus|bus\s+eta|eta)\s*\??$",
+                lambda m: [],
+            ),
+        ]
+
+        self._rules = [
+            (intent, re.compile(pattern), build_args)
+            for intent, pattern, build_args in rules
+            if intent in param_map
+        ]
+        self.hits = 0
+        self.misses = 0
+
+    def route(self, text: str):
+        """
+        Returns:
+            tuple: (function name, args) of the first rule that matches, or (None, None).
+        """
+
+        text = " ".join(text.lower().split())
+        for intent, pattern, build_args in self._rules:
+            match = pattern.search(text)
+            if match is not None:
+                self.hits += 1
+                return intent, build_args(match)
+        self.misses += 1
+        return None, None
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total > 0 else 0.0
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": round(self.hit_rate, 4)}
@@ -1,28 +1,309 @@
 #!/usr/bin/env python3
 import os
-from groq import Groq
+import json
+import time
+import queue
+import sqlite3
+import asyncio
+import hashlib
+import threading
+from collections import deque, OrderedDict
+from groq import Groq, AsyncGroq, GroqError
+from metrics import LLM_REQUEST_SECONDS, LLM_REQUESTS
+
+LLM_ERROR_REPLY = "Sorry, I can't answer that right now. Please try again later."
+
+
+def estimate_tokens(text: str):
+    """Rough token count (about 4 chars per token), good enough for budgeting history."""
+    return len(text) // 4 + 1
+
+
+class ChatHistory:
+    """One chat's recent messages, trimmed from the oldest end to stay within a token budget."""
+
+    __slots__ = ("_messages", "_tokens", "_max_tokens", "_max_length")
+
+    def __init__(self, max_tokens: int, max_length: int):
+        self._messages = deque()  # (message, tokens)
+        self._tokens = 0
+        self._max_tokens = max_tokens
+        self._max_length = max_length
+
+    def __len__(self):
+        return len(self._messages)
+
+    @property
+    def tokens(self):
+        return self._tokens
+
+    def append(self, role: str, content: str):
+        tokens = estimate_tokens(content)
+        self._messages.append(({"role": role, "content": content}, tokens))
+        self._tokens += tokens
+        while self._messages and (
+            self._tokens > self._max_tokens or len(self._messages) > self._max_length
+        ):
+            self._tokens -= self._messages.popleft()[1]
+
+    def messages(self):
+        return [message for message, _ in self._messages]
+
+
+class ResponseCache:
+    """
+    LRU cache of LLM replies with a TTL, keyed on the normalized messages plus the model parameters.
+
+    Entries live in memory up to max_entries. If file_path is given, they are also written to a
+    SQLite file so that they survive restarts; a memory miss falls back to the file. Writes to the
+    file are queued to a writer thread, which commits them in batches and trims the file (expired
+    entries, then the oldest beyond max_disk_entries) every trim_every writes.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl: float = 3600.0,  # in secs
+        file_path: str = None,
+        max_disk_entries: int = 100000,
+        trim_every: int = 1000,
+    ):
+        self._entries = OrderedDict()  # key -> (reply, created)
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._max_disk_entries = max_disk_entries
+        self._trim_every = trim_every
+        self._lock = threading.Lock()
+        self._conn = None
+        self._writes = None
+        self._writer = None
+        if file_path is not None:
+            self._conn = sqlite3.connect(file_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, "
+                "reply TEXT NOT NULL, "
+                "created REAL NOT NULL)"  # epoch secs
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS responses_created ON responses (created)")
+            self._conn.commit()
+            self._writes = queue.Queue()
+            self._writer = threading.Thread(target=self._write_loop, name="ResponseCacheWriter", daemon=True)
+            self._writer.start()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(messages: list, **params):
+        normalized = [(message["role"], " ".join(message["content"].lower().split())) for message in messages]
+        payload = json.dumps([normalized, sorted(params.items())], separators=(",", ":"))
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: str):
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is None and self._conn is not None:
+            with self._lock:
+                entry = self._conn.execute(
+                    "SELECT reply, created FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+            if entry is not None:
+                self._put_memory(key, entry)
+
+        if entry is None or now - entry[1] > self._ttl:
+            if entry is not None:
+                self.remove(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key: str, reply: str):
+        entry = (reply, time.time())
+        self._put_memory(key, entry)
+        if self._writes is not None:
+            self._writes.put(("INSERT OR REPLACE INTO responses VALUES (?, ?, ?)", (key,) + entry))
+
+    def _put_memory(self, key: str, entry: tuple):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+    def remove(self, key: str):
+        self._entries.pop(key, None)
+        if self._writes is not None:
+            self._writes.put(("DELETE FROM responses WHERE key = ?", (key,)))
+
+    def clear(self):
+        self._entries.clear()
+        if self._writes is not None:
+            self._writes.put(("DELETE FROM responses", ()))
+            # A file lookup right after must not find the cleared entries
+            self._writes.join()
+
+    def flush(self):
+        """Waits until every queued write is in the file."""
+        if self._writes is not None:
+            self._writes.join()
+
+    # ======================================== Writer thread ========================================
+    def _write_loop(self):
+        writes = 0
+        while True:
+            batch = [self._writes.get()]
+            while len(batch) < 256:
+                try:
+                    batch.append(self._writes.get_nowait())
+                except queue.Empty:
+                    break
+            statements = [write for write in batch if write is not None]
+            if statements:
+                with self._lock:
+                    for sql, params in statements:
+                        self._conn.execute(sql, params)
+                    writes += len(statements)
+                    if writes >= self._trim_every:
+                        self._trim()
+                        writes = 0
+                    self._conn.commit()
+            for _ in batch:
+                self._writes.task_done()
+            if len(statements) < len(batch):
+                return
+
+    def _trim(self):
+        # Both deletes walk the created index from the oldest end only
+        self._conn.execute("DELETE FROM responses WHERE created < ?", (time.time() - self._ttl,))
+        excess = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0] - self._max_disk_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY created LIMIT ?)", (excess,)
+            )
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+    def close(self):
+        if self._writer is not None:
+            self._writes.put(None)
+            self._writer.join()
+            self._writer = None
+            self._writes = None
+        if self._conn is not None:
+            with self._lock:
+                self._conn.close()
+            self._conn = None
 
 
 class LLM:
     def __init__(
-        self, api_key: str = "", param_map: dict = {}, max_history_length: int = 30
+        self,
+        api_key: str = "",
+        param_map: dict = {},
+        max_history_length: int = 30,
+        max_history_tokens: int = 1024,
+        max_chats: int = 10000,
+        max_concurrency: int = 4,
+        timeout: float = 30.0,  # in secs
+        response_cache: ResponseCache = None,
+        cache_max_temperature: float = 0.5,  # below the default temperature, which asks for varied replies
+        base_url: str = None,  # None for the Groq API
     ):
-        self._groq_client = Groq(api_key=api_key)
-        self._history = []
+        self._groq_client = Groq(api_key=api_key, base_url=base_url)
+        self._async_groq_client = AsyncGroq(api_key=api_key, base_url=base_url)
+
+        # Per-chat history, least recently used chats are dropped first
+        self._histories = OrderedDict()
         self._max_history_length = max_history_length
+        self._max_history_tokens = max_history_tokens
+        self._max_chats = max_chats
+
+        # Bounds the number of LLM requests in flight, the rest wait their turn
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._timeout = timeout
+
+        # Replies to identical requests are reused, unless a higher temperature asks for variety
+        self._response_cache = response_cache if response_cache is not None else ResponseCache()
+        self._cache_max_temperature = cache_max_temperature
+
+        self.set_param_map(param_map)
+
+    def set_param_map(self, param_map: dict):
+        """Sets the function map and precompiles the system prompt from it."""
         self._param_map = param_map
-        
-        self._func_desc = {}
-        for key, val in param_map.items():
-            self._func_desc[key] = val["description"] + " Output in this format: " + val["function_architype"]
+        functions = "\n".join(
+            f"{val['function_architype']}: {' '.join(val['description'].split())}"
+            for val in param_map.values()
+        )
+        self._system_prompt = {
+            "role": "system",
+            "content": "You are the Telegram assistant of WhenIs199Coming, a bus arrival app. "
+            "You help users check bus arrival times at bus stops and answer general questions.\n"
+            "If the user's intention matches one of these functions, reply with only the function in the given format, "
+            "filling in the arguments in <>, e.g. FUNCTION_NAME<arg1><arg2>. Never invent functions.\n"
+            f"{functions}\n"
+            "Otherwise, talk to the user normally.",
+        }
+        self._system_prompt_tokens = estimate_tokens(self._system_prompt["content"])
+
+    def get_history(self, chat_id=None):
+        history = self._histories.get(chat_id)
+        if history is None:
+            history = ChatHistory(self._max_history_tokens, self._max_history_length)
+            self._histories[chat_id] = history
+            while len(self._histories) > self._max_chats:
+                self._histories.popitem(last=False)
+        else:
+            self._histories.move_to_end(chat_id)
+        return history
+
+    def add_to_history(self, role: str, content: str, chat_id=None):
+        """Add a message to the conversation history of a chat."""
+        self.get_history(chat_id).append(role, content)
 
-    def add_to_history(self, role: str, content: str):
-        """Add a message to the conversation history."""
-        self._history.append({"role": role, "content": content})
+    def clear_history(self, chat_id=None):
+        self._histories.pop(chat_id, None)
 
-        if len(self._history) > self._max_history_length:
-            for _ in range(len(self._history) - self._max_history_length):
-                self._history.pop(0)
+    def _build_messages(self, msg: str, chat_id=None, use_history: bool = True):
+        history = self.get_history(chat_id).messages() if use_history else []
+        return [self._system_prompt] + history + [{"role": "user", "content": msg}]
+
+    def payload_tokens(self, msg: str, chat_id=None, use_history: bool = True):
+        """Estimated prompt size of a request, in tokens."""
+        history_tokens = self.get_history(chat_id).tokens if use_history else 0
+        return self._system_prompt_tokens + history_tokens + estimate_tokens(msg)
+
+    def _cache_key(self, messages, model, temperature, max_token, top_p, use_cache):
+        if not use_cache or temperature > self._cache_max_temperature:
+            return None
+        return ResponseCache.make_key(messages, model=model, temperature=temperature, max_token=max_token, top_p=top_p)
+
+    def _remember(self, msg, reply, chat_id, use_history, cache_key):
+        if cache_key is not None:
+            self._response_cache.put(cache_key, reply)
+        if use_history:
+            self.add_to_history("user", msg, chat_id)
+            self.add_to_history("assistant", reply, chat_id)
+
+    def get_cache_stats(self):
+        return self._response_cache.stats()
+
+    def get_history_stats(self):
+        return {
+            "chats": len(self._histories),
+            "messages": sum(len(history) for history in self._histories.values()),
+            "tokens": sum(history.tokens for history in self._histories.values()),
+        }
+
+    def close(self):
+        self._response_cache.close()
 
     def prompt(
         self,
@@ -31,35 +312,120 @@ class LLM:
         temperature: float = 0.7,
         max_token: int = 512,
         top_p: float = 1.0,
+        chat_id=None,
+        use_history: bool = True,
+        use_cache: bool = True,
     ):
-        self.add_to_history("user", msg)
-        completion = self._groq_client.chat.completions.create(
-            model=model,
-            messages=[
-                {
-                    "role": "system",
-                    "content": f"You are a Telegram assistant for a bus arrival app, WhenIs199Coming. \
-                        You help users check bus arrival times at specific bus stops and respond to \
-                        their geneal inquiries. If the user intention matches the description in the map provided here: \
-                        {self._func_desc}, please strictly return the function architype (please do not invent any new functions) and only return the key in uppercase \
-                        without modifying the key and include the arguments in the '<>' bracket if any arguments\
-                        are needed. For example: FUNCTION_NAME<arg1><arg2>. You may also have general conversation with the user if possible.",
-                },
-                {"role": "user", "content": msg},
-            ]
-            + self._history,
-            temperature=temperature,
-            max_tokens=max_token,
-            top_p=top_p,
-            stream=True,
-            stop=None,
-        )
+        messages = self._build_messages(msg, chat_id, use_history)
+        cache_key = self._cache_key(messages, model, temperature, max_token, top_p, use_cache)
+        if cache_key is not None:
+            reply = self._response_cache.get(cache_key)
+            if reply is not None:
+                LLM_REQUESTS.labels("cached").inc()
+                self._remember(msg, reply, chat_id, use_history, None)
+                return reply
+
+        try:
+            with LLM_REQUEST_SECONDS.time():
+                completion = self._groq_client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=max_token,
+                    top_p=top_p,
+                    stream=True,
+                    stop=None,
+                )
+
+                reply = ""
+                for chunk in completion:
+                    reply += chunk.choices[0].delta.content or ""
+        except Exception:
+            LLM_REQUESTS.labels("error").inc()
+            raise
+        LLM_REQUESTS.labels("ok").inc()
+
+        self._remember(msg, reply, chat_id, use_history, cache_key)
+        return reply
+
+    async def prompt_async(
+        self,
+        msg: str,
+        model: str = "llama3-8b-8192",
+        temperature: float = 0.7,
+        max_token: int = 512,
+        top_p: float = 1.0,
+        chat_id=None,
+        use_history: bool = True,
+        use_cache: bool = True,
+        on_token=None,
+        timeout: float = None,
+    ):
+        """
+        Same as prompt, without blocking the event loop.
+
+        Args:
+            chat_id: The chat whose history is sent along and extended.
+            use_history (bool): Set to False for one-off prompts that neither need nor belong in the history.
+            use_cache (bool): Set to False to always ask the model, e.g. for varied replies. Requests with a
+                temperature above cache_max_temperature are never cached either.
+            on_token (coroutine function): Optional. Called with the reply so far whenever a chunk arrives,
+                while the request holds one of the max_concurrency slots, so it should only buffer the text
+                (as MessageStream.update does) and never wait on Telegram.
+            timeout (float): Secs before the request is cancelled and asyncio.TimeoutError is raised,
+                including the time spent waiting for a free slot. Defaults to the LLM's timeout.
+        """
+
+        messages = self._build_messages(msg, chat_id, use_history)
+        cache_key = self._cache_key(messages, model, temperature, max_token, top_p, use_cache)
+        if cache_key is not None:
+            reply = self._response_cache.get(cache_key)
+            if reply is not None:
+                LLM_REQUESTS.labels("cached").inc()
+                if on_token is not None:
+                    await on_token(reply)
+                self._remember(msg, reply, chat_id, use_history, None)
+                return reply
+
+        timeout = self._timeout if timeout is None else timeout
+        try:
+            with LLM_REQUEST_SECONDS.time():
+                reply = await asyncio.wait_for(
+                    self._prompt_async(messages, model, temperature, max_token, top_p, on_token),
+                    timeout,
+                )
+        except Exception:
+            LLM_REQUESTS.labels("error").inc()
+            raise
+        LLM_REQUESTS.labels("ok").inc()
+        self._remember(msg, reply, chat_id, use_history, cache_key)
+        return reply
+
+    async def _prompt_async(self, messages, model, temperature, max_token, top_p, on_token):
+        async with self._semaphore:
+            completion = await self._async_groq_client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_token,
+                top_p=top_p,
+                stream=True,
+                stop=None,
+            )
 
-        reply = ""
-        for chunk in completion:
-            reply += chunk.choices[0].delta.content or ""
+            reply = ""
+            try:
+                async for chunk in completion:
+                    content = chunk.choices[0].delta.content
+                    if not content:
+                        continue
+                    reply += content
+                    if on_token is not None:
+                        await on_token(reply)
+            finally:
+                # Also reached on cancellation, which releases the connection
+                await completion.close()
 
-        self.add_to_history("assistant", reply)
         return reply
 
 
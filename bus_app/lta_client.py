@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+import os
+import random
+import asyncio
+import aiohttp
+from metrics import LTA_REQUEST_SECONDS, LTA_ERRORS
+
+LTA_BASE_URL = "https://datamall2.mytransport.sg/ltaodataservice"
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class LtaError(Exception):
+    """Raised when DataMall cannot be reached or keeps answering with an error."""
+
+    def __init__(self, message: str, status: int = None):
+        super().__init__(message)
+        self.status = status
+
+
+class LtaClient:
+    """
+    Async LTA DataMall client.
+
+    One aiohttp session (and so one keep-alive connection pool) is shared by every request. Failed
+    requests, i.e. connection errors, timeouts, 429/5xx answers and bodies that are not JSON, are
+    retried with exponential backoff and full jitter. Every failure is raised as an LtaError.
+    """
+
+    def __init__(
+        self,
+        api_key: str = "",
+        base_url: str = LTA_BASE_URL,
+        timeout: float = 5.0,  # in secs, per attempt
+        retries: int = 3,
+        backoff: float = 0.25,  # in secs
+        max_backoff: float = 4.0,  # in secs
+        pool_size: int = 32,
+    ):
+        self._api_key = api_key
+        self._base_url = base_url.rstrip("/")
+        self._timeout = aiohttp.ClientTimeout(total=timeout)
+        self._retries = max(retries, 1)
+        self._backoff = backoff
+        self._max_backoff = max_backoff
+        self._pool_size = pool_size
+        self._session = None
+
+    @property
+    def base_url(self):
+        return self._base_url
+
+    def _get_session(self):
+        # Created lazily since aiohttp sessions must be bound to the running event loop
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self._pool_size, keepalive_timeout=30, ttl_dns_cache=300
+                ),
+                headers={"AccountKey": self._api_key, "accept": "application/json"},
+                timeout=self._timeout,
+            )
+        return self._session
+
+    def _backoff_delay(self, attempt: int):
+        return random.uniform(0.0, min(self._max_backoff, self._backoff * (2**attempt)))
+
+    async def get(self, path: str, params: dict = None):
+        """GETs base_url/path and returns the decoded JSON body."""
+        path = path.lstrip("/")
+        with LTA_REQUEST_SECONDS.labels(path).time():
+            try:
+                return await self._get(path, params)
+            except LtaError:
+                LTA_ERRORS.labels(path).inc()
+                raise
+
+    async def _get(self, path: str, params: dict = None):
+        url = f"{self._base_url}/{path}"
+        error = None
+        for attempt in range(self._retries):
+            if attempt > 0:
+                await asyncio.sleep(self._backoff_delay(attempt - 1))
+            try:
+                async with self._get_session().get(url, params=params) as response:
+                    if response.status in RETRY_STATUS:
+                        error = LtaError(f"{url} returned {response.status}", response.status)
+                        continue
+                    if response.status != 200:
+                        raise LtaError(f"{url} returned {response.status}", response.status)
+                    try:
+                        return await response.json(content_type=None)
+                    except ValueError as e:
+                        # e.g. an HTML error page from a proxy in front of DataMall
+                        error = LtaError(f"{url} returned a body that is not JSON: {e!r}", response.status)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = LtaError(f"{url} failed: {e!r}")
+        raise error
+
+    async def bus_arrival(self, bus_stop_code: str, bus_service_no: str = None):
+        params = {"BusStopCode": bus_stop_code}
+        if bus_service_no:
+            params["ServiceNo"] = bus_service_no
+        return await self.get("v3/BusArrival", params=params)
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+if __name__ == "__main__":
+    # Example usage:
+    async def main():
+        client = LtaClient(api_key=os.environ.get("LTA_API_KEY"))
+        try:
+            print(await client.bus_arrival("27011", "199"))
+        finally:
+            await client.close()
+
+    asyncio.run(main())
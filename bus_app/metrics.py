@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+import time
+import bisect
+from aiohttp import web
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)  # in secs
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = ""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Timer:
+    """Observes the secs spent in a with block, also around awaits."""
+
+    __slots__ = ("_histogram", "_start")
+
+    def __init__(self, histogram):
+        self._histogram = histogram
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._histogram.observe(time.perf_counter() - self._start)
+        return False
+
+
+class _Metric:
+    """A metric with optional labels; each combination of label values gets its own child."""
+
+    type = None
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._children = {}
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.label_names):
+                raise ValueError(f"{self.name} takes labels {self.label_names}, got {values}")
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def samples(self):
+        """Yields (suffix, label string, value) of every child."""
+        raise NotImplementedError
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+    def samples(self):
+        for values, child in self._children.items():
+            yield "", _format_labels(self.label_names, values), child.value
+
+
+class _GaugeChild:
+    __slots__ = ("value", "function")
+
+    def __init__(self):
+        self.value = 0
+        self.function = None
+
+    def set(self, value: float):
+        self.value = value
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def dec(self, amount: float = 1):
+        self.value -= amount
+
+    def set_function(self, function):
+        """Reads the value from function() at scrape time instead, e.g. the length of a queue."""
+        self.function = function
+
+    def get(self):
+        return self.function() if self.function is not None else self.value
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1):
+        self.labels().dec(amount)
+
+    def set_function(self, function):
+        self.labels().set_function(function)
+
+    def samples(self):
+        for values, child in self._children.items():
+            yield "", _format_labels(self.label_names, values), child.get()
+
+
+class _HistogramChild:
+    __slots__ = ("_buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: tuple):
+        self._buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # per bucket, not cumulative; the last is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self._buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def time(self):
+        return _Timer(self)
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def samples(self):
+        for values, child in self._children.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+                cumulative += count
+                le = f'le="{_format_value(float(bound))}"'
+                yield "_bucket", _format_labels(self.label_names, values, le), cumulative
+            labels = _format_labels(self.label_names, values)
+            yield "_sum", labels, child.sum
+            yield "_count", labels, child.count
+
+
+class MetricsRegistry:
+    """
+    Counters, gauges and histograms kept in plain Python numbers, so recording one costs about a
+    dict lookup, and rendered in the Prometheus text format only when scraped.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+
+    def _register(self, cls, name: str, *args, **kwargs):
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = cls(name, *args, **kwargs)
+        elif not isinstance(metric, cls):
+            raise ValueError(f"{name} is already registered as a {metric.type}")
+        return metric
+
+    def counter(self, name: str, help: str, labels: tuple = ()):
+        return self._register(Counter, name, help, labels)
+
+    def gauge(self, name: str, help: str, labels: tuple = ()):
+        return self._register(Gauge, name, help, labels)
+
+    def histogram(self, name: str, help: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        return self._register(Histogram, name, help, labels, buckets)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for suffix, labels, value in metric.samples():
+                lines.append(f"{metric.name}{suffix}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+METRICS = MetricsRegistry()
+
+# Hot-path metrics
+LTA_REQUEST_SECONDS = METRICS.histogram(
+    "bus_app_lta_request_seconds", "LTA DataMall requests, retries included.", ["path"]
+)
+LTA_ERRORS = METRICS.counter("bus_app_lta_errors_total", "LTA DataMall requests that failed.", ["path"])
+LLM_REQUEST_SECONDS = METRICS.histogram(
+    "bus_app_llm_request_seconds", "LLM requests, waiting for a free slot included."
+)
+LLM_REQUESTS = METRICS.counter("bus_app_llm_requests_total", "LLM prompts by outcome.", ["outcome"])
+INTENT_PARSE_SECONDS = METRICS.histogram(
+    "bus_app_intent_parse_seconds",
+    "Parsing a request into an intent, locally or from the LLM reply.",
+    ["source"],
+    buckets=(0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01),
+)
+INTENTS = METRICS.counter("bus_app_intents_total", "Text requests by intent.", ["intent", "source"])
+TELEGRAM_REQUEST_SECONDS = METRICS.histogram(
+    "bus_app_telegram_request_seconds", "Bot API requests sending replies, rate limit waits excluded.", ["method"]
+)
+PENDING_REMINDERS = METRICS.gauge("bus_app_pending_reminders", "Reminders scheduled and not sent yet.")
+REMINDER_ERRORS = METRICS.counter("bus_app_reminder_errors_total", "Due reminders that could not be sent.")
+SESSIONS = METRICS.gauge("bus_app_sessions", "Chat sessions kept in memory.")
+WATCHES = METRICS.gauge("bus_app_watches", "Standing watches.")
+WATCH_MESSAGES = METRICS.counter("bus_app_watch_messages_total", "Scheduled arrival updates sent for watches.")
+WATCH_ERRORS = METRICS.counter("bus_app_watch_errors_total", "Scheduled arrival updates that could not be sent.")
+
+
+async def metrics_handler(request):
+    return web.Response(body=METRICS.render().encode(), headers={"Content-Type": CONTENT_TYPE})
+
+
+class MetricsServer:
+    """Serves GET /metrics on its own port, for when there is no webhook server to serve it."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 9100):
+        self._host = host
+        self._port = port
+        self._runner = None
+
+        self.app = web.Application()
+        self.app.router.add_get("/metrics", metrics_handler)
+
+    async def start(self):
+        """Starts serving and returns the port, which is picked by the OS if port is 0."""
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self._host, self._port)
+        await site.start()
+        return self._runner.addresses[0][1]
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+if __name__ == "__main__":
+    # Example usage:
+    registry = MetricsRegistry()
+    requests = registry.histogram("example_request_seconds", "Example requests.", ["path"])
+    for _ in range(100000):
+        with requests.labels("v3/BusArrival").time():
+            pass
+
+    start = time.perf_counter()
+    for _ in range(100000):
+        with requests.labels("v3/BusArrival").time():
+            pass
+    print(f"Timed block overhead: {(time.perf_counter() - start) / 100000 * 1e6:.2f} us")
+    print(registry.render())
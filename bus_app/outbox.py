@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+import os
+import time
+import sqlite3
+import asyncio
+import threading
+import logging
+import contextlib
+from telegram.error import BadRequest
+from metrics import TELEGRAM_REQUEST_SECONDS
+
+logger = logging.getLogger(__name__)
+
+MAX_MESSAGE_LENGTH = 4096  # Telegram's limit per text message
+
+
+class TokenBucket:
+    """
+    Token bucket refilled at rate tokens/sec up to capacity.
+
+    reserve() always takes a token and lets the balance go negative, returning how long the caller
+    has to wait for its token. Without locks, concurrent callers therefore queue up in order.
+    """
+
+    __slots__ = ("_rate", "_capacity", "_tokens", "_updated")
+
+    def __init__(self, rate: float, capacity: float):
+        self._rate = rate
+        self._capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+
+    def reserve(self):
+        now = time.monotonic()
+        self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+        self._tokens -= 1.0
+        return 0.0 if self._tokens >= 0 else -self._tokens / self._rate
+
+    @property
+    def is_full(self):
+        elapsed = time.monotonic() - self._updated
+        return self._tokens + elapsed * self._rate >= self._capacity
+
+
+class FileIdCache:
+    """
+    file_id Telegram assigned to each uploaded file, so later sends reference the file instead of
+    uploading it again. Keys include the file's mtime and size, so a changed file is uploaded anew.
+    Kept in memory, and in SQLite if file_path is given (file ids stay valid across restarts).
+    """
+
+    def __init__(self, file_path: str = None):
+        self._file_ids = {}
+        self._lock = threading.Lock()
+        self._conn = None
+        if file_path is not None:
+            self._conn = sqlite3.connect(file_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS file_ids (key TEXT PRIMARY KEY, file_id TEXT NOT NULL)")
+            self._conn.commit()
+            self._file_ids.update(self._conn.execute("SELECT key, file_id FROM file_ids").fetchall())
+
+    @staticmethod
+    def key_of(file_path: str):
+        stat = os.stat(file_path)
+        return f"{os.path.abspath(file_path)}:{stat.st_mtime_ns}:{stat.st_size}"
+
+    def __len__(self):
+        return len(self._file_ids)
+
+    def get(self, key: str):
+        return self._file_ids.get(key)
+
+    def put(self, key: str, file_id: str):
+        self._file_ids[key] = file_id
+        if self._conn is not None:
+            with self._lock:
+                self._conn.execute("INSERT OR REPLACE INTO file_ids VALUES (?, ?)", (key, file_id))
+                self._conn.commit()
+
+    def remove(self, key: str):
+        self._file_ids.pop(key, None)
+        if self._conn is not None:
+            with self._lock:
+                self._conn.execute("DELETE FROM file_ids WHERE key = ?", (key,))
+                self._conn.commit()
+
+    def close(self):
+        if self._conn is not None:
+            with self._lock:
+                self._conn.close()
+            self._conn = None
+
+
+class Outbox:
+    """
+    Rate-limited outgoing messages.
+
+    Every send waits for a token from its chat's bucket and from the global bucket, which keeps the
+    bot under Telegram's flood limits (about 1 msg/sec per chat and 30 msgs/sec overall) without
+    fixed sleeps. At most max_in_flight requests are sent at a time; more would only queue up in the
+    bot's connection pool, which gets slower the more requests wait in it.
+    """
+
+    def __init__(
+        self,
+        global_rate: float = 30.0,  # msgs/sec
+        chat_rate: float = 1.0,  # msgs/sec
+        chat_burst: int = 3,
+        max_buckets: int = 10000,
+        file_ids: FileIdCache = None,
+        max_in_flight: int = 64,
+    ):
+        self._global_bucket = TokenBucket(global_rate, global_rate)
+        self._chat_rate = chat_rate
+        self._chat_burst = chat_burst
+        self._max_buckets = max_buckets
+        self._chat_buckets = {}
+        self._file_ids = file_ids if file_ids is not None else FileIdCache()
+        self._in_flight = asyncio.Semaphore(max_in_flight)
+        self.sent = 0
+        self.delayed = 0
+        self.uploaded = 0
+
+    async def acquire(self, chat_id):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) >= self._max_buckets:
+                self._prune()
+            bucket = TokenBucket(self._chat_rate, self._chat_burst)
+            self._chat_buckets[chat_id] = bucket
+        delay = max(bucket.reserve(), self._global_bucket.reserve())
+        self.sent += 1
+        if delay > 0:
+            self.delayed += 1
+            await asyncio.sleep(delay)
+
+    @contextlib.asynccontextmanager
+    async def slot(self, chat_id, method: str = "sendMessage"):
+        """Waits for the rate limits, then holds one of the in-flight slots while the request is sent."""
+        await self.acquire(chat_id)
+        async with self._in_flight:
+            with TELEGRAM_REQUEST_SECONDS.labels(method).time():
+                yield
+
+    def _prune(self):
+        # Full buckets carry no state, a new bucket is equivalent
+        for chat_id in [chat_id for chat_id, bucket in self._chat_buckets.items() if bucket.is_full]:
+            del self._chat_buckets[chat_id]
+
+    async def reply(self, update, text: str, **kwargs):
+        chat_id = update.effective_chat.id if update.effective_chat is not None else None
+        message = None
+        for chunk in split_message(text):
+            async with self.slot(chat_id):
+                message = await update.message.reply_text(chunk, **kwargs)
+        return message
+
+    async def send_message(self, bot, chat_id, text: str, **kwargs):
+        message = None
+        for chunk in split_message(text):
+            async with self.slot(chat_id):
+                message = await bot.send_message(chat_id=chat_id, text=chunk, **kwargs)
+        return message
+
+    async def reply_photo(self, update, file_path: str, **kwargs):
+        """Replies with the image at file_path, uploading it only if Telegram does not know it yet."""
+        chat_id = update.effective_chat.id if update.effective_chat is not None else None
+        key = FileIdCache.key_of(file_path)
+        file_id = self._file_ids.get(key)
+        if file_id is not None:
+            try:
+                async with self.slot(chat_id, "sendPhoto"):
+                    return await update.message.reply_photo(photo=file_id, **kwargs)
+            except BadRequest:
+                # Unknown or expired file id
+                self._file_ids.remove(key)
+
+        async with self.slot(chat_id, "sendPhoto"):
+            with open(file_path, "rb") as f:
+                message = await update.message.reply_photo(photo=f, **kwargs)
+        self.uploaded += 1
+        if message is not None and message.photo:
+            self._file_ids.put(key, message.photo[-1].file_id)
+        return message
+
+    def close(self):
+        self._file_ids.close()
+
+    def buffer(self, update, separator: str = "\n"):
+        return ReplyBuffer(self, update, separator)
+
+    def stats(self):
+        return {
+            "sent": self.sent,
+            "delayed": self.delayed,
+            "uploaded": self.uploaded,
+            "chats": len(self._chat_buckets),
+            "file_ids": len(self._file_ids),
+        }
+
+
+class ReplyBuffer:
+    """
+    Collects one handler's replies and sends them as a single message when flushed, or when
+    leaving the async with block.
+    """
+
+    def __init__(self, outbox: Outbox, update, separator: str = "\n"):
+        self._outbox = outbox
+        self._update = update
+        self._separator = separator
+        self._texts = []
+
+    def add(self, text: str):
+        self._texts.append(text)
+
+    def __len__(self):
+        return len(self._texts)
+
+    async def flush(self, **kwargs):
+        if len(self._texts) == 0:
+            return None
+        text = self._separator.join(self._texts)
+        self._texts.clear()
+        return await self._outbox.reply(self._update, text, **kwargs)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.flush()
+
+
+class MessageStream:
+    """
+    Shows a reply while it is still being generated: the first update sends a message and later
+    updates edit it, at most once every min_interval secs. finish() makes sure the final text is shown.
+
+    update() only buffers the text; a background task sends it, so a producer such as the LLM stream
+    is never held up by Telegram's rate limits.
+    """
+
+    def __init__(self, outbox: Outbox, update, min_interval: float = 1.0, **kwargs):
+        self._outbox = outbox
+        self._update = update
+        self._min_interval = min_interval
+        self._kwargs = kwargs
+        self._message = None
+        self._shown = ""
+        self._last_edit = 0.0
+        self._pending = None  # latest text not shown yet
+        self._started = False
+        self._task = None
+        self._wakeup = asyncio.Event()
+
+    @property
+    def started(self):
+        return self._started
+
+    async def update(self, text: str):
+        self._pending = text[:MAX_MESSAGE_LENGTH]
+        self._started = True
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._flush())
+
+    async def _flush(self):
+        while self._pending is not None and self._pending != self._shown:
+            wait = self._min_interval - (time.monotonic() - self._last_edit)
+            if wait > 0:
+                # Woken up early by finish()
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self._show(self._pending)
+            except Exception as e:
+                logger.warning("Failed to show a partial reply: %r", e)
+                return
+
+    async def _show(self, text: str):
+        if self._message is None:
+            self._message = await self._outbox.reply(self._update, text, **self._kwargs)
+        else:
+            async with self._outbox.slot(self._message.chat_id, "editMessageText"):
+                await self._message.edit_text(text, **self._kwargs)
+        self._shown = text
+        self._last_edit = time.monotonic()
+
+    async def finish(self, text: str):
+        # Lets a running update complete, so the message is not sent twice
+        self._pending = None
+        self._wakeup.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+
+        if self._message is None:
+            await self._outbox.reply(self._update, text, **self._kwargs)
+            return
+        chunks = split_message(text)
+        if chunks[0] != self._shown:
+            await self._show(chunks[0])
+        for chunk in chunks[1:]:
+            await self._outbox.reply(self._update, chunk, **self._kwargs)
+
+
+def split_message(text: str, max_length: int = MAX_MESSAGE_LENGTH):
+    """Splits text into chunks Telegram accepts, preferably at line breaks."""
+    chunks = []
+    while len(text) > max_length:
+        cut = text.rfind("\n", 0, max_length)
+        if cut <= 0:
+            cut = max_length
+        chunks.append(text[:cut])
+        text = text[cut:].lstrip("\n")
+    chunks.append(text)
+    return chunks
@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+import io
+import os
+import time
+import asyncio
+import pstats
+import random
+import cProfile
+import logging
+import functools
+import tracemalloc
+from datetime import datetime
+
+DEFAULT_PROFILE_DIR = os.path.join(os.path.dirname(__file__), "..", "data", "profiles")
+# Allocations are grouped by line only; every extra frame traced makes allocating much slower
+TRACEMALLOC_FRAMES = 1
+TOP_LINES = 30
+
+logger = logging.getLogger(__name__)
+
+
+class _HandlerRecord:
+    __slots__ = ("calls", "profiled", "seconds", "allocated", "stats", "snapshot_taken")
+
+    def __init__(self):
+        self.calls = 0
+        self.profiled = 0
+        self.seconds = 0.0  # wall time of the profiled calls
+        self.allocated = 0  # net bytes still allocated after the profiled calls
+        self.stats = None
+        self.snapshot_taken = False
+
+
+class HandlerProfiler:
+    """
+    Profiles handler calls during a time window, on demand.
+
+    Outside a window a wrapped handler costs one attribute check. Inside, calls are sampled with
+    sample_rate and profiled with cProfile one at a time, since only one profiler can be enabled
+    per thread; calls made meanwhile, including those from within the profiled call, are only
+    counted. Everything the event loop runs while a profiled handler awaits shows up in its profile
+    as well, which under load is the contention that slows it down. tracemalloc traces allocations for the whole
+    window, and the first profiled call of each handler is bracketed by two snapshots. Expect the
+    handlers to run a few times slower during a window, mostly from tracing allocations.
+
+    When the window ends, <output_dir>/<start time>/ receives per handler <name>.prof (for pstats
+    or snakeviz), <name>.txt (top functions) and <name>.allocations.txt (snapshot diff), plus
+    allocations.snapshot (tracemalloc.Snapshot.load) and summary.txt.
+    """
+
+    def __init__(self, output_dir: str = DEFAULT_PROFILE_DIR, inspect=None):
+        """
+        Args:
+            output_dir (str): Where the results of each window are written.
+            inspect (function): Optional. inspect() -> dict of sizes worth tracking, e.g. of caches,
+                written to the summary at the start and the end of the window.
+        """
+
+        self._output_dir = output_dir
+        self._inspect = inspect
+        self._deadline = None  # monotonic time the window ends at, None outside a window
+        self._sample_rate = 1.0
+        self._records = {}
+        self._busy = False  # a call is being profiled
+        self._started_tracemalloc = False
+        self._started_at = None
+        self._sizes_at_start = None
+        self._timer = None
+        self._on_done = None
+        self._writing = None  # task writing the results of the last window
+        self._writing_allocations = set()  # tasks writing <name>.allocations.txt
+
+    @property
+    def active(self):
+        return self._deadline is not None
+
+    def start(self, duration: float, sample_rate: float = 1.0, on_done=None):
+        """
+        Opens a profiling window of duration secs, restarting any open one.
+
+        Args:
+            on_done (function): Optional. on_done(result_dir) called when the results are written.
+        """
+
+        if self.active:
+            self.stop()
+        self._records = {}
+        self._sample_rate = sample_rate
+        self._started_at = datetime.now()
+        self._sizes_at_start = self._inspect() if self._inspect is not None else None
+        self._on_done = on_done
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            self._started_tracemalloc = True
+        self._deadline = time.monotonic() + duration
+        try:
+            self._timer = asyncio.get_running_loop().call_later(duration, self.stop)
+        except RuntimeError:
+            # No running loop, the window ends with the first call after the deadline
+            self._timer = None
+        logger.info("Profiling handlers for %.0f s, sampling %.0f%% of calls", duration, sample_rate * 100)
+
+    def stop(self):
+        """
+        Closes the window and writes the results, in a worker thread if an event loop is running
+        (see wait_written). Returns the result directory, or None if no window was open.
+        """
+
+        if not self.active:
+            return None
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._deadline = None
+
+        result_dir = os.path.join(self._output_dir, self._started_at.strftime("%Y%m%d-%H%M%S"))
+        snapshot = self._take_snapshot() if tracemalloc.is_tracing() else None
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+        # Calls still being profiled no longer add to these records
+        records, self._records = self._records, {}
+        sizes_at_end = self._inspect() if self._sizes_at_start is not None else None
+        results = (
+            result_dir, records, self._started_at, datetime.now(), self._sizes_at_start, sizes_at_end, snapshot
+        )
+        on_done, self._on_done = self._on_done, None
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._write(*results)
+            self._written(result_dir, on_done)
+        else:
+            self._writing = loop.create_task(self._write_async(results, on_done))
+        return result_dir
+
+    async def wait_written(self):
+        """Waits until the results of the last window are written."""
+        if self._writing_allocations:
+            await asyncio.gather(*self._writing_allocations)
+        if self._writing is not None:
+            await self._writing
+            self._writing = None
+
+    async def _write_async(self, results: tuple, on_done):
+        try:
+            await asyncio.to_thread(self._write, *results)
+        except OSError as e:
+            logger.warning("Could not write profiles to %s: %s", results[0], e)
+            return
+        self._written(results[0], on_done)
+
+    def _written(self, result_dir: str, on_done):
+        logger.info("Profiles written to %s", result_dir)
+        if on_done is not None:
+            on_done(result_dir)
+
+    @staticmethod
+    def _write(result_dir: str, records: dict, started_at, ended_at, sizes_at_start, sizes_at_end, snapshot):
+        os.makedirs(result_dir, exist_ok=True)
+        lines = [f"Window: {started_at:%Y-%m-%d %H:%M:%S} to {ended_at:%Y-%m-%d %H:%M:%S}", ""]
+        lines.append(f"{'handler':<32} {'calls':>8} {'profiled':>9} {'mean ms':>9} {'mean KiB kept':>14}")
+        for name, record in sorted(records.items(), key=lambda item: -item[1].seconds):
+            profiled = max(record.profiled, 1)
+            lines.append(
+                f"{name:<32} {record.calls:>8} {record.profiled:>9} "
+                f"{record.seconds / profiled * 1000:>9.1f} {record.allocated / profiled / 1024:>14.1f}"
+            )
+            if record.stats is not None:
+                record.stats.dump_stats(os.path.join(result_dir, f"{name}.prof"))
+                text = io.StringIO()
+                record.stats.stream = text
+                record.stats.sort_stats("cumulative").print_stats(TOP_LINES)
+                with open(os.path.join(result_dir, f"{name}.txt"), "w") as f:
+                    f.write(text.getvalue())
+
+        if sizes_at_end is not None:
+            lines += ["", f"{'size':<32} {'start':>10} {'end':>10}"]
+            for key in sizes_at_end:
+                lines.append(f"{key:<32} {sizes_at_start.get(key, ''):>10} {sizes_at_end[key]:>10}")
+
+        if snapshot is not None:
+            snapshot = HandlerProfiler._filter(snapshot)
+            snapshot.dump(os.path.join(result_dir, "allocations.snapshot"))
+            lines += ["", f"Top {TOP_LINES} allocations still alive at the end:"]
+            lines += [str(stat) for stat in snapshot.statistics("lineno")[:TOP_LINES]]
+        with open(os.path.join(result_dir, "summary.txt"), "w") as f:
+            f.write("\n".join(lines) + "\n")
+
+    def _take_snapshot(self):
+        # Only the snapshot has to be taken on the loop, it is filtered and compared in a worker thread
+        return tracemalloc.take_snapshot()
+
+    @staticmethod
+    def _filter(snapshot):
+        # Leave out what profiling itself allocates
+        return snapshot.filter_traces(
+            [tracemalloc.Filter(False, module.__file__) for module in (tracemalloc, cProfile, pstats)]
+            + [tracemalloc.Filter(False, __file__)]
+        )
+
+    async def _write_allocations_async(self, result_dir: str, name: str, before, after):
+        try:
+            await asyncio.to_thread(self._write_allocations, result_dir, name, before, after)
+        except OSError as e:
+            logger.warning("Could not write allocations of %s to %s: %s", name, result_dir, e)
+
+    @staticmethod
+    def _write_allocations(result_dir: str, name: str, before, after):
+        stats = HandlerProfiler._filter(after).compare_to(HandlerProfiler._filter(before), "lineno")
+        os.makedirs(result_dir, exist_ok=True)
+        with open(os.path.join(result_dir, f"{name}.allocations.txt"), "w") as f:
+            f.write(f"Allocations of one {name} call, by line:\n")
+            f.write("\n".join(str(stat) for stat in stats[:TOP_LINES]) + "\n")
+
+    # ======================================== Wrapping ========================================
+    def wrap(self, name: str, handler):
+        """Returns handler wrapped to be profiled as name while a window is open."""
+
+        @functools.wraps(handler)
+        async def wrapper(*args, **kwargs):
+            if self._deadline is None:
+                return await handler(*args, **kwargs)
+            return await self._run(name, handler, args, kwargs)
+
+        return wrapper
+
+    async def run(self, name: str, handler, *args, **kwargs):
+        """Awaits handler(*args, **kwargs), profiled as name while a window is open."""
+        if self._deadline is None:
+            return await handler(*args, **kwargs)
+        return await self._run(name, handler, args, kwargs)
+
+    async def _run(self, name: str, handler, args, kwargs):
+        if time.monotonic() > self._deadline:
+            self.stop()
+            return await handler(*args, **kwargs)
+
+        record = self._records.get(name)
+        if record is None:
+            record = self._records[name] = _HandlerRecord()
+        record.calls += 1
+
+        if self._busy or random.random() >= self._sample_rate:
+            return await handler(*args, **kwargs)
+
+        before = None
+        if not record.snapshot_taken and tracemalloc.is_tracing():
+            before = self._take_snapshot()
+        profile = cProfile.Profile()
+        self._busy = True
+        traced = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        profile.enable()
+        try:
+            return await handler(*args, **kwargs)
+        finally:
+            profile.disable()
+            self._busy = False
+            # Unless the window closed meanwhile and its records are being written
+            if self._records.get(name) is record:
+                self._add(name, record, profile, time.perf_counter() - start, traced, before)
+
+    def _add(self, name: str, record: _HandlerRecord, profile, seconds: float, traced: int, before):
+        record.seconds += seconds
+        record.allocated += tracemalloc.get_traced_memory()[0] - traced
+        record.profiled += 1
+
+        if record.stats is None:
+            record.stats = pstats.Stats(profile)
+        else:
+            record.stats.add(profile)
+        if before is not None and tracemalloc.is_tracing():
+            record.snapshot_taken = True
+            result_dir = os.path.join(self._output_dir, self._started_at.strftime("%Y%m%d-%H%M%S"))
+            task = asyncio.get_running_loop().create_task(
+                self._write_allocations_async(result_dir, name, before, self._take_snapshot())
+            )
+            self._writing_allocations.add(task)
+            task.add_done_callback(self._writing_allocations.discard)
+
+
+if __name__ == "__main__":
+    # Example usage:
+    import tempfile
+
+    async def noop():
+        pass
+
+    async def handler(n):
+        await asyncio.sleep(0.01)
+        return sum(i * i for i in range(n))
+
+    async def main():
+        profiler = HandlerProfiler(tempfile.mkdtemp(), inspect=lambda: {"example": 1})
+
+        wrapped_noop = profiler.wrap("noop", noop)
+        start = time.perf_counter()
+        for _ in range(100000):
+            await wrapped_noop()
+        off = (time.perf_counter() - start) / 100000
+        start = time.perf_counter()
+        for _ in range(100000):
+            await noop()
+        bare = (time.perf_counter() - start) / 100000
+        print(f"Overhead when off: {(off - bare) * 1e6:.2f} us per call")
+
+        done = asyncio.Event()
+
+        def on_done(result_dir):
+            print(f"Results in {result_dir}: {sorted(os.listdir(result_dir))}")
+            done.set()
+
+        wrapped = profiler.wrap("handler", handler)
+        profiler.start(0.5, on_done=on_done)
+        await asyncio.gather(*[wrapped(100000) for _ in range(5)])
+        await done.wait()
+
+    asyncio.run(main())
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+import time
+import heapq
+import asyncio
+import itertools
+
+
+class ReminderScheduler:
+    """
+    Native asyncio scheduler for reminders, built on a min-heap of fire times.
+
+    schedule and reschedule are O(log n); cancel is O(1) and leaves a dead heap entry behind that
+    is skipped when popped (the heap is compacted once dead entries outnumber live ones). All
+    reminders due within the same tick are handed to the callback as one batch.
+    """
+
+    def __init__(self, callback, tick: float = 0.05):
+        """
+        Args:
+            callback (coroutine function): callback(list of payloads) for every batch of due reminders.
+            tick (float): Reminders due within tick secs of each other are fired together.
+        """
+
+        self._callback = callback
+        self._tick = tick
+        self._heap = []  # [fire_at, seq, job_id]
+        self._entries = {}  # job id -> heap entry
+        self._payloads = {}  # job id -> (chat id, payload)
+        self._by_chat = {}  # chat id -> set of job ids
+        self._seq = itertools.count()
+        self._dead = 0
+        self._wakeup = None
+        self._task = None
+        self._batches = set()
+        self.fired = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, job_id):
+        return job_id in self._entries
+
+    def fire_at(self, job_id):
+        entry = self._entries.get(job_id)
+        return None if entry is None else entry[0]
+
+    def job_ids(self):
+        return list(self._entries.keys())
+
+    def schedule(self, job_id, fire_at: float, payload, chat_id=None):
+        """Schedules payload to be fired at the epoch time fire_at, replacing any job with the same id."""
+        if job_id in self._entries:
+            self.cancel(job_id)
+        entry = [fire_at, next(self._seq), job_id]
+        self._entries[job_id] = entry
+        self._payloads[job_id] = (chat_id, payload)
+        self._by_chat.setdefault(chat_id, set()).add(job_id)
+        heapq.heappush(self._heap, entry)
+        self._notify(fire_at)
+
+    def schedule_many(self, jobs: list):
+        """Schedules (job_id, fire_at, payload, chat_id) jobs at once, with one heapify for a large batch."""
+        entries = []
+        for job_id, fire_at, payload, chat_id in jobs:
+            if job_id in self._entries:
+                self.cancel(job_id)
+            entry = [fire_at, next(self._seq), job_id]
+            self._entries[job_id] = entry
+            self._payloads[job_id] = (chat_id, payload)
+            self._by_chat.setdefault(chat_id, set()).add(job_id)
+            entries.append(entry)
+        if len(entries) == 0:
+            return
+        if len(entries) > len(self._heap):
+            self._heap.extend(entries)
+            heapq.heapify(self._heap)
+        else:
+            for entry in entries:
+                heapq.heappush(self._heap, entry)
+        self._notify(min(entry[0] for entry in entries))
+
+    def reschedule(self, job_id, fire_at: float):
+        """Moves a pending job to fire_at. Returns False if the job does not exist (anymore)."""
+        old = self._entries.get(job_id)
+        if old is None:
+            return False
+        old[2] = None
+        self._dead += 1
+        entry = [fire_at, next(self._seq), job_id]
+        self._entries[job_id] = entry
+        heapq.heappush(self._heap, entry)
+        self._notify(fire_at)
+        self._maybe_compact()
+        return True
+
+    def cancel(self, job_id):
+        entry = self._entries.pop(job_id, None)
+        if entry is None:
+            return False
+        entry[2] = None
+        self._dead += 1
+        chat_id, _ = self._payloads.pop(job_id)
+        job_ids = self._by_chat.get(chat_id)
+        if job_ids is not None:
+            job_ids.discard(job_id)
+            if len(job_ids) == 0:
+                del self._by_chat[chat_id]
+        self._maybe_compact()
+        return True
+
+    def cancel_chat(self, chat_id):
+        """Cancels every pending job of chat_id. Returns the number of jobs cancelled."""
+        job_ids = list(self._by_chat.get(chat_id, ()))
+        for job_id in job_ids:
+            self.cancel(job_id)
+        return len(job_ids)
+
+    def _maybe_compact(self):
+        if self._dead > 1024 and self._dead > len(self._entries):
+            self._heap = [entry for entry in self._heap if entry[2] is not None]
+            heapq.heapify(self._heap)
+            self._dead = 0
+
+    def _pop_due(self, now: float):
+        batch = []
+        heap = self._heap
+        while heap and heap[0][0] <= now + self._tick:
+            fire_at, _, job_id = heapq.heappop(heap)
+            if job_id is None:
+                self._dead -= 1
+                continue
+            del self._entries[job_id]
+            chat_id, payload = self._payloads.pop(job_id)
+            job_ids = self._by_chat.get(chat_id)
+            if job_ids is not None:
+                job_ids.discard(job_id)
+                if len(job_ids) == 0:
+                    del self._by_chat[chat_id]
+            batch.append(payload)
+        return batch
+
+    # ======================================== Loop ========================================
+    def _notify(self, fire_at: float):
+        if self._task is None or self._task.done():
+            self.start()
+        elif self._heap[0][0] >= fire_at:
+            # New earliest job, the loop has to wake up sooner
+            self._wakeup.set()
+
+    def start(self):
+        """Starts the scheduler task on the running event loop if it is not running yet."""
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            now = time.time()
+            batch = self._pop_due(now)
+            if batch:
+                self.fired += len(batch)
+                task = asyncio.get_running_loop().create_task(self._callback(batch))
+                self._batches.add(task)
+                task.add_done_callback(self._batches.discard)
+                continue
+
+            timeout = self._heap[0][0] - now if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+
+if __name__ == "__main__":
+    # Benchmark: 100k pending reminders
+    import random
+    import tracemalloc
+
+    async def main():
+        fired = []
+        batches = []
+
+        async def callback(batch):
+            now = time.time()
+            batches.append(len(batch))
+            fired.extend(now - fire_at for fire_at in batch)
+
+        scheduler = ReminderScheduler(callback)
+        n = 100000
+        now = time.time()
+        fire_times = [now + 1.0 + random.random() * 2.0 for _ in range(n)]
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        for i, fire_at in enumerate(fire_times):
+            scheduler.schedule(i, fire_at, fire_at, chat_id=i % 10000)
+        elapsed = time.perf_counter() - start
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print(f"schedule: {n} reminders in {elapsed * 1000:.1f} ms ({elapsed / n * 1e6:.2f} us each), {memory / 1e6:.1f} MB")
+
+        start = time.perf_counter()
+        for i in range(0, n, 10):
+            scheduler.reschedule(i, fire_times[i] + 0.5)
+            scheduler._payloads[i] = (scheduler._payloads[i][0], fire_times[i] + 0.5)
+        elapsed = time.perf_counter() - start
+        print(f"reschedule: {n // 10} reminders in {elapsed * 1000:.1f} ms")
+
+        start = time.perf_counter()
+        cancelled = sum(scheduler.cancel_chat(chat_id) for chat_id in range(1000))
+        elapsed = time.perf_counter() - start
+        print(f"cancel_chat: {cancelled} reminders of 1000 chats in {elapsed * 1000:.1f} ms")
+
+        pending = len(scheduler)
+        while len(fired) < pending:
+            await asyncio.sleep(0.05)
+        fired.sort()
+        print(
+            f"fired: {len(fired)} reminders in {len(batches)} batches, "
+            f"lateness p50 {fired[len(fired) // 2] * 1000:.1f} ms, max {fired[-1] * 1000:.1f} ms"
+        )
+        await scheduler.stop()
+
+        bulk = ReminderScheduler(callback)
+        start = time.perf_counter()
+        bulk.schedule_many([(i, fire_at + 3600, fire_at, i % 10000) for i, fire_at in enumerate(fire_times)])
+        elapsed = time.perf_counter() - start
+        print(f"schedule_many: {n} reminders in {elapsed * 1000:.1f} ms")
+        await bulk.stop()
+
+    asyncio.run(main())
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+import time
+import sqlite3
+import threading
+from arrival_refresher import TrackedReminder
+
+
+class ReminderStore:
+    """
+    Durable store of pending reminders as plain records in SQLite.
+
+    Only plain values are stored (job id, chat id, bus service no, bus stop code, mins left and the
+    estimated arrival), so pending reminders can be re-scheduled in bulk after a restart.
+    """
+
+    def __init__(self, file_path: str = ":memory:"):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(file_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS reminders ("
+            "job_id TEXT PRIMARY KEY, "
+            "chat_id INTEGER, "
+            "bus_service_no TEXT NOT NULL, "
+            "bus_stop_code TEXT NOT NULL, "
+            "mins_left REAL NOT NULL, "
+            "est_arrival REAL NOT NULL, "  # epoch secs
+            "fire_at REAL NOT NULL)"  # epoch secs
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS reminders_fire_at ON reminders (fire_at)")
+        self._conn.commit()
+
+    @staticmethod
+    def _to_row(reminder: TrackedReminder):
+        return (
+            reminder.job_id,
+            reminder.chat_id,
+            reminder.bus_service_no,
+            reminder.bus_stop_code,
+            reminder.mins_left,
+            reminder.est_arrival,
+            reminder.fire_timestamp,
+        )
+
+    def add(self, reminder: TrackedReminder):
+        self.add_many([reminder])
+
+    def add_many(self, reminders: list):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO reminders VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [self._to_row(reminder) for reminder in reminders],
+            )
+            self._conn.commit()
+
+    def update(self, reminder: TrackedReminder):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE reminders SET est_arrival = ?, fire_at = ? WHERE job_id = ?",
+                (reminder.est_arrival, reminder.fire_timestamp, reminder.job_id),
+            )
+            self._conn.commit()
+
+    def remove(self, job_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM reminders WHERE job_id = ?", (job_id,))
+            self._conn.commit()
+
+    def remove_chat(self, chat_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM reminders WHERE chat_id = ?", (chat_id,))
+            self._conn.commit()
+
+    def remove_arrived(self, before: float = None):
+        """Deletes reminders whose bus arrived before the given epoch time (default now)."""
+        before = time.time() if before is None else before
+        with self._lock:
+            deleted = self._conn.execute("DELETE FROM reminders WHERE est_arrival < ?", (before,)).rowcount
+            self._conn.commit()
+        return deleted
+
+    def load_pending(self):
+        """Returns every stored reminder as TrackedReminder, soonest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT job_id, chat_id, bus_service_no, bus_stop_code, mins_left, est_arrival "
+                "FROM reminders ORDER BY fire_at"
+            ).fetchall()
+        return [
+            TrackedReminder(job_id, chat_id, bus_service_no, bus_stop_code, mins_left, est_arrival)
+            for job_id, chat_id, bus_service_no, bus_stop_code, mins_left, est_arrival in rows
+        ]
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM reminders").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+if __name__ == "__main__":
+    # Example usage:
+    store = ReminderStore()
+    now = int(time.time())
+    reminders = [TrackedReminder(str(i), i, "199", "27011", 5.0, now + 600 + i) for i in range(50000)]
+    start = time.perf_counter()
+    store.add_many(reminders)
+    print(f"Stored {len(store)} reminders in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    start = time.perf_counter()
+    pending = store.load_pending()
+    print(f"Loaded {len(pending)} reminders in {(time.perf_counter() - start) * 1000:.1f} ms")
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+import os
+import math
+import zlib
+import struct
+import hashlib
+
+RENDER_VERSION = 1  # bump when the drawing changes, so cached images are re-rendered
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(__file__), "..", "data", "route_images")
+
+BACKGROUND = (250, 250, 247)
+ROUTE_COLOURS = [(33, 102, 172), (214, 96, 77)]  # direction 1, direction 2
+STOP_COLOUR = (255, 255, 255)
+OUTLINE_COLOUR = (60, 60, 60)
+START_COLOUR = (26, 152, 80)
+END_COLOUR = (215, 48, 39)
+
+
+class Canvas:
+    """RGB pixel buffer with just enough drawing to plot a route, encoded as PNG without any imaging library."""
+
+    def __init__(self, width: int, height: int, background: tuple = BACKGROUND):
+        self.width = width
+        self.height = height
+        self._pixels = bytearray(bytes(background) * (width * height))
+
+    def fill_rect(self, x0: int, y0: int, x1: int, y1: int, colour: tuple):
+        x0, x1 = max(x0, 0), min(x1, self.width - 1)
+        if x0 > x1:
+            return
+        run = bytes(colour) * (x1 - x0 + 1)
+        for y in range(max(y0, 0), min(y1, self.height - 1) + 1):
+            start = (y * self.width + x0) * 3
+            self._pixels[start : start + len(run)] = run
+
+    def disc(self, cx: int, cy: int, radius: int, colour: tuple):
+        for dy in range(-radius, radius + 1):
+            dx = int(math.sqrt(radius * radius - dy * dy))
+            self.fill_rect(cx - dx, cy + dy, cx + dx, cy + dy, colour)
+
+    def line(self, x0: int, y0: int, x1: int, y1: int, colour: tuple, width: int = 3):
+        # Bresenham, stamping a width x width square at every step
+        half = width // 2
+        dx, dy = abs(x1 - x0), -abs(y1 - y0)
+        sx, sy = (1 if x0 < x1 else -1), (1 if y0 < y1 else -1)
+        error = dx + dy
+        while True:
+            self.fill_rect(x0 - half, y0 - half, x0 + half, y0 + half, colour)
+            if x0 == x1 and y0 == y1:
+                break
+            e2 = 2 * error
+            if e2 >= dy:
+                error += dy
+                x0 += sx
+            if e2 <= dx:
+                error += dx
+                y0 += sy
+
+    def to_png(self):
+        row_size = self.width * 3
+        raw = b"".join(
+            b"\x00" + self._pixels[y * row_size : (y + 1) * row_size] for y in range(self.height)
+        )
+
+        def chunk(tag: bytes, data: bytes):
+            return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+
+        return (
+            b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", self.width, self.height, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(raw, 6))
+            + chunk(b"IEND", b"")
+        )
+
+
+def render_route_png(routes: list, width: int = 640, height: int = 640, margin: int = 24):
+    """
+    Draws routes onto a map-less diagram scaled to fit the image.
+
+    Args:
+        routes (list): One list of (latitude, longitude) per direction, stops in order.
+
+    Returns:
+        bytes: The PNG image.
+    """
+
+    points = [point for route in routes for point in route]
+    canvas = Canvas(width, height)
+    if len(points) == 0:
+        return canvas.to_png()
+
+    # Equirectangular projection, keeping the aspect ratio
+    cos_lat = math.cos(math.radians(sum(latitude for latitude, _ in points) / len(points)))
+    xs = [longitude * cos_lat for _, longitude in points]
+    ys = [latitude for latitude, _ in points]
+    min_x, min_y = min(xs), min(ys)
+    span = max(max(xs) - min_x, max(ys) - min_y) or 1e-6
+    scale = min(width, height) - 2 * margin
+    offset_x = (width - scale * (max(xs) - min_x) / span) / 2
+    offset_y = (height - scale * (max(ys) - min_y) / span) / 2
+
+    def project(latitude: float, longitude: float):
+        x = offset_x + (longitude * cos_lat - min_x) / span * scale
+        y = height - (offset_y + (latitude - min_y) / span * scale)
+        return int(round(x)), int(round(y))
+
+    projected = [[project(*point) for point in route] for route in routes]
+    for i, route in enumerate(projected):
+        colour = ROUTE_COLOURS[i % len(ROUTE_COLOURS)]
+        for (x0, y0), (x1, y1) in zip(route, route[1:]):
+            canvas.line(x0, y0, x1, y1, colour)
+    for route in projected:
+        for x, y in route:
+            canvas.disc(x, y, 5, OUTLINE_COLOUR)
+            canvas.disc(x, y, 3, STOP_COLOUR)
+    if projected and projected[0]:
+        canvas.disc(*projected[0][0], 7, START_COLOUR)
+        canvas.disc(*projected[0][-1], 5, END_COLOUR)
+    return canvas.to_png()
+
+
+class RouteImageCache:
+    """
+    Rendered route images on disk, named after a hash of everything drawn (the stop coordinates
+    and RENDER_VERSION), so an unchanged route is rendered once and a changed one gets a new file.
+    """
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR):
+        self._cache_dir = cache_dir
+        self.rendered = 0
+
+    @staticmethod
+    def content_hash(routes: list):
+        payload = repr((RENDER_VERSION, [[(round(lat, 6), round(lon, 6)) for lat, lon in route] for route in routes]))
+        return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+    def get(self, bus_service_no: str, routes: list):
+        """Returns the path of the route image, rendering it first if it is not cached yet."""
+        file_path = os.path.join(self._cache_dir, f"{bus_service_no}_{self.content_hash(routes)}.png")
+        if os.path.exists(file_path):
+            return file_path
+
+        png = render_route_png(routes)
+        os.makedirs(self._cache_dir, exist_ok=True)
+        tmp_path = f"{file_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(png)
+        os.replace(tmp_path, file_path)
+        self.rendered += 1
+        return file_path
+
+
+if __name__ == "__main__":
+    # Example usage:
+    import time
+    import tempfile
+    from route_store import get_route_store
+    from bus_stop_index import get_bus_stop_index
+
+    route_store = get_route_store()
+    bus_stop_index = get_bus_stop_index()
+    routes = [
+        [bus_stop_index.coordinates_of(code) for code in route_store.route("199", direction) if code in bus_stop_index]
+        for direction in route_store.directions("199")
+    ]
+
+    cache = RouteImageCache(tempfile.mkdtemp())
+    for _ in range(2):
+        start = time.perf_counter()
+        file_path = cache.get("199", routes)
+        print(f"{file_path} ({os.path.getsize(file_path) / 1000:.1f} kB) in {(time.perf_counter() - start) * 1000:.1f} ms")
@@ -0,0 +1,441 @@
+#!/usr/bin/env python3
+import os
+import sys
+import glob
+import time
+import struct
+import asyncio
+import threading
+from array import array
+from bisect import bisect_left
+from types import MappingProxyType
+from lta_client import LtaClient
+from bus_stop_refresher import fetch_pages, DatasetError
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
+DEFAULT_ROUTE_FILE = os.path.join(DATA_DIR, "bus_routes.bin")
+
+# Layout (little-endian): header, route table (ROUTE_ENTRY per route), route stop codes (uint32),
+# route distances (float32 km), stop codes (uint32, sorted), stop offsets (uint32, one more than
+# stops) into the services of each stop (uint16 route table index, 2 bytes padded to 4), then the
+# bus service numbers of the route table as NUL-separated UTF-8, then the URL the routes were
+# fetched from as UTF-8.
+ROUTE_MAGIC = b"BRTE"
+ROUTE_VERSION = 2
+# magic, version, reserved, routes, route stops, stops, stop services, services size, fetched at (epoch secs), source size
+ROUTE_HEADER = struct.Struct("<4sHHIIIIIdI")
+MAX_ROUTE_AGE = 7 * 24 * 3600.0  # in secs, routes fetched longer ago are fetched again
+ROUTE_ENTRY = struct.Struct("<BxxxII")  # direction, first route stop, route stop count
+
+
+class RouteStore:
+    """
+    Immutable index of every bus route, kept in flat arrays.
+
+    Routes are keyed by (bus service no, direction) and hold their stops in order. The bus stop ->
+    services index is precomputed as a sorted array of stop codes with offsets into the route table,
+    so services_at() is a binary search and loading is a handful of array copies. Positions of the
+    stops along a route are indexed on first use, after which stops_between() is a dict hit plus a
+    slice.
+    """
+
+    __slots__ = (
+        "_keys",
+        "_key_to_route",
+        "_entries",
+        "_codes",
+        "_distances",
+        "_stop_codes",
+        "_stop_offsets",
+        "_stop_services",
+        "_positions",
+        "source",
+        "fetched_at",
+    )
+
+    def __init__(
+        self, keys, entries, codes, distances, stop_codes, stop_offsets, stop_services, source="", fetched_at=0.0
+    ):
+        self._keys = tuple(keys)  # route table: (bus service no, direction)
+        self._key_to_route = MappingProxyType({key: route for route, key in enumerate(self._keys)})
+        self._entries = tuple(entries)  # route table: (first route stop, route stop count)
+        self._codes = codes
+        self._distances = distances
+        self._stop_codes = stop_codes
+        self._stop_offsets = stop_offsets
+        self._stop_services = stop_services
+        self._positions = {}  # route -> {bus stop code: positions}, filled on first use
+        self.source = source  # DataMall URL the routes were fetched from, "" if not fetched
+        self.fetched_at = fetched_at  # epoch secs
+
+    @classmethod
+    def from_routes(cls, routes: dict, distances: dict = None, source: str = "", fetched_at: float = 0.0):
+        """
+        Args:
+            routes (dict): {(bus service no, direction): sequence of bus stop codes, in order}
+            distances (dict): Optional. {(bus service no, direction): sequence of km from the start}
+            source (str), fetched_at (float): Where and when (epoch secs) the routes were fetched from.
+        """
+
+        distances = distances or {}
+        keys = sorted(routes, key=lambda key: (service_sort_key(key[0]), key[1]))
+        entries = []
+        codes = array("I")
+        route_distances = array("f")
+        stop_routes = {}
+        for route, key in enumerate(keys):
+            stops = [int(code) for code in routes[key]]
+            entries.append((len(codes), len(stops)))
+            codes.extend(stops)
+            route_distances.extend(distances.get(key) or [0.0] * len(stops))
+            for code in stops:
+                stop_routes.setdefault(code, set()).add(route)
+
+        stop_codes = array("I", sorted(stop_routes))
+        stop_offsets = array("I", [0])
+        stop_services = array("H")
+        for code in stop_codes:
+            # One route per service is enough, the first direction calling at the stop
+            seen = set()
+            for route in sorted(stop_routes[code]):
+                if keys[route][0] not in seen:
+                    seen.add(keys[route][0])
+                    stop_services.append(route)
+            stop_offsets.append(len(stop_services))
+        return cls(keys, entries, codes, route_distances, stop_codes, stop_offsets, stop_services, source, fetched_at)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, bus_service_no):
+        bus_service_no = str(bus_service_no).upper()
+        return (bus_service_no, 1) in self._key_to_route or (bus_service_no, 2) in self._key_to_route
+
+    def services(self):
+        return list(dict.fromkeys(service for service, _ in self._keys))
+
+    def directions(self, bus_service_no: str):
+        bus_service_no = str(bus_service_no).upper()
+        return [direction for direction in (1, 2) if (bus_service_no, direction) in self._key_to_route]
+
+    def _route_of(self, bus_service_no: str, direction: int):
+        return self._key_to_route.get((str(bus_service_no).upper(), direction))
+
+    def route(self, bus_service_no: str, direction: int = 1):
+        """Returns the bus stop codes of the route in order, or () if there is no such route."""
+        route = self._route_of(bus_service_no, direction)
+        if route is None:
+            return ()
+        start, count = self._entries[route]
+        return tuple(f"{code:05d}" for code in self._codes[start : start + count])
+
+    def distances(self, bus_service_no: str, direction: int = 1):
+        route = self._route_of(bus_service_no, direction)
+        if route is None:
+            return array("f")
+        start, count = self._entries[route]
+        return self._distances[start : start + count]
+
+    def services_at(self, bus_stop_code: str):
+        """Returns the bus services calling at the bus stop."""
+        if not bus_stop_code.isdigit():
+            return ()
+        code = int(bus_stop_code)
+        i = bisect_left(self._stop_codes, code)
+        if i == len(self._stop_codes) or self._stop_codes[i] != code:
+            return ()
+        return tuple(
+            self._keys[route][0] for route in self._stop_services[self._stop_offsets[i] : self._stop_offsets[i + 1]]
+        )
+
+    def serves(self, bus_service_no: str, bus_stop_code: str):
+        return str(bus_service_no).upper() in self.services_at(bus_stop_code)
+
+    def _positions_of(self, route: int):
+        positions = self._positions.get(route)
+        if positions is None:
+            start, count = self._entries[route]
+            positions = {}
+            for position, code in enumerate(self._codes[start : start + count]):
+                positions.setdefault(f"{code:05d}", []).append(position)
+            self._positions[route] = positions
+        return positions
+
+    def stops_between(self, bus_service_no: str, from_code: str, to_code: str):
+        """
+        Returns:
+            tuple: The bus stop codes from from_code to to_code (both included) along the shortest
+                matching stretch of either direction, or () if the bus does not go from one to the other.
+        """
+
+        best = None
+        for direction in (1, 2):
+            route = self._route_of(bus_service_no, direction)
+            if route is None:
+                continue
+            positions = self._positions_of(route)
+            for start in positions.get(from_code, ()):
+                for end in positions.get(to_code, ()):
+                    if end > start and (best is None or end - start < best[2] - best[1]):
+                        best = (route, start, end)
+        if best is None:
+            return ()
+        route, start, end = best
+        first = self._entries[route][0]
+        return tuple(f"{code:05d}" for code in self._codes[first + start : first + end + 1])
+
+    # ======================================== Storage ========================================
+    @classmethod
+    def from_records(cls, records: list, source: str = "", fetched_at: float = 0.0):
+        """
+        Builds the store from DataMall BusRoutes records, fetched from source at fetched_at.
+
+        Raises:
+            DatasetError: If a record is malformed.
+        """
+
+        stops = {}
+        for record in records:
+            try:
+                key = (str(record["ServiceNo"]).upper(), int(record["Direction"]))
+                sequence = int(record["StopSequence"])
+                bus_stop_code = str(record["BusStopCode"])
+                distance = float(record.get("Distance") or 0.0)
+            except (KeyError, TypeError, ValueError):
+                raise DatasetError(f"Invalid bus route record {record!r}")
+            if not bus_stop_code.isdigit() or key[1] not in (1, 2):
+                raise DatasetError(f"Invalid bus route record {record!r}")
+            stops.setdefault(key, []).append((sequence, bus_stop_code, distance))
+
+        routes, distances = {}, {}
+        for key, route in stops.items():
+            route.sort()
+            routes[key] = [bus_stop_code for _, bus_stop_code, _ in route]
+            distances[key] = [distance for _, _, distance in route]
+        return cls.from_routes(routes, distances, source, fetched_at)
+
+    @classmethod
+    def from_legacy_files(cls, data_dir: str = DATA_DIR):
+        """Builds the store from hand-made <bus service no>_route.csv files (code,name per line)."""
+        routes = {}
+        for file_path in glob.glob(os.path.join(data_dir, "*_route.csv")):
+            bus_service_no = os.path.basename(file_path)[: -len("_route.csv")].upper()
+            with open(file_path, "r") as f:
+                routes[(bus_service_no, 1)] = [line.split(",")[0].strip() for line in f if line.strip()]
+        return cls.from_routes(routes)
+
+    def write(self, file_path: str):
+        """Writes the store to file_path, written aside and renamed into place."""
+        arrays = [
+            array("I", self._codes),
+            array("f", self._distances),
+            array("I", self._stop_codes),
+            array("I", self._stop_offsets),
+            array("H", self._stop_services),
+        ]
+        if sys.byteorder != "little":
+            for values in arrays:
+                values.byteswap()
+        stop_services = arrays[4].tobytes()
+        stop_services += bytes(len(stop_services) % 4)
+        services = "\0".join(service for service, _ in self._keys).encode("utf-8")
+        source = self.source.encode("utf-8")
+
+        tmp_path = f"{file_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(
+                ROUTE_HEADER.pack(
+                    ROUTE_MAGIC,
+                    ROUTE_VERSION,
+                    0,
+                    len(self._keys),
+                    len(self._codes),
+                    len(self._stop_codes),
+                    len(self._stop_services),
+                    len(services),
+                    self.fetched_at,
+                    len(source),
+                )
+            )
+            f.write(b"".join(ROUTE_ENTRY.pack(key[1], *entry) for key, entry in zip(self._keys, self._entries)))
+            for values in arrays[:4]:
+                f.write(values.tobytes())
+            f.write(stop_services)
+            f.write(services)
+            f.write(source)
+        os.replace(tmp_path, file_path)
+
+    @classmethod
+    def read(cls, file_path: str):
+        """Reads a store written by write. Returns None if the file is missing or of another version."""
+        try:
+            with open(file_path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        if len(data) < ROUTE_HEADER.size:
+            return None
+        magic, version, _, route_count, code_count, stop_count, service_count, services_size, fetched_at, source_size = (
+            ROUTE_HEADER.unpack_from(data)
+        )
+        padded_service_count = service_count + service_count % 2
+        sizes = [
+            ("I", code_count),
+            ("f", code_count),
+            ("I", stop_count),
+            ("I", stop_count + 1),
+            ("H", padded_service_count),
+        ]
+        offset = ROUTE_HEADER.size + ROUTE_ENTRY.size * route_count
+        if (
+            magic != ROUTE_MAGIC
+            or version != ROUTE_VERSION
+            or len(data)
+            != offset + sum(4 * count for _, count in sizes[:4]) + 2 * padded_service_count + services_size + source_size
+        ):
+            return None
+
+        route_table = list(ROUTE_ENTRY.iter_unpack(data[ROUTE_HEADER.size : offset]))
+        arrays = []
+        for typecode, count in sizes:
+            values = array(typecode)
+            values.frombytes(data[offset : offset + values.itemsize * count])
+            if sys.byteorder != "little":
+                values.byteswap()
+            arrays.append(values)
+            offset += values.itemsize * count
+        codes, distances, stop_codes, stop_offsets, stop_services = arrays
+        del stop_services[service_count:]
+        services = data[offset : offset + services_size].decode("utf-8").split("\0") if route_count > 0 else []
+        source = data[offset + services_size :].decode("utf-8")
+        if len(services) != route_count:
+            return None
+
+        keys = [(service, direction) for service, (direction, _, _) in zip(services, route_table)]
+        entries = [(start, count) for _, start, count in route_table]
+        return cls(keys, entries, codes, distances, stop_codes, stop_offsets, stop_services, source, fetched_at)
+
+
+def service_sort_key(bus_service_no: str):
+    # 2 < 10 < 10e < 179 < 179A < NR1
+    digits = "".join(char for char in bus_service_no if char.isdigit())
+    return (not bus_service_no[:1].isdigit(), int(digits) if digits else 0, bus_service_no)
+
+
+# ======================================== Shared Store ========================================
+_stores = {}  # file path -> RouteStore
+_load_lock = threading.Lock()
+
+
+def get_route_store(file_path: str = DEFAULT_ROUTE_FILE):
+    """
+    Returns the shared RouteStore of file_path, reading it on first use. Until the routes have been
+    fetched from DataMall, the store is built from the hand-made *_route.csv files next to it.
+    """
+
+    file_path = os.path.abspath(file_path)
+    store = _stores.get(file_path)
+    if store is not None:
+        return store
+    with _load_lock:
+        store = _stores.get(file_path)
+        if store is None:
+            store = RouteStore.read(file_path)
+            if store is None:
+                store = RouteStore.from_legacy_files(os.path.dirname(file_path))
+            _stores[file_path] = store
+        return store
+
+
+class RouteRefresher:
+    """
+    Refreshes the route store from DataMall's BusRoutes endpoint, fetching pages concurrently.
+    The file is replaced atomically and the new store installed as the shared one in a single
+    assignment. Concurrent refresh() calls share one refresh. The routes are stale once they are
+    older than max_age secs or were fetched from another DataMall than the client's.
+    """
+
+    def __init__(
+        self,
+        lta_client: LtaClient,
+        file_path: str = DEFAULT_ROUTE_FILE,
+        max_concurrency: int = 8,
+        min_ratio: float = 0.9,
+        max_age: float = MAX_ROUTE_AGE,  # in secs
+    ):
+        self._lta_client = lta_client
+        self._file_path = os.path.abspath(file_path)
+        self._max_concurrency = max_concurrency
+        self._min_ratio = min_ratio
+        self._max_age = max_age
+        self._task = None
+
+    def is_stale(self):
+        store = get_route_store(self._file_path)
+        return store.source != self._lta_client.base_url or time.time() - store.fetched_at > self._max_age
+
+    async def refresh(self):
+        """
+        Returns:
+            RouteStore: The new store.
+
+        Raises:
+            LtaError: If DataMall could not be fetched.
+            DatasetError: If the fetched dataset failed validation.
+        """
+
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._refresh())
+        return await asyncio.shield(self._task)
+
+    async def _refresh(self):
+        fetched_at = time.time()
+        records = await fetch_pages(self._lta_client, "BusRoutes", self._max_concurrency)
+        return await asyncio.to_thread(self._apply, records, fetched_at)
+
+    def _apply(self, records: list, fetched_at: float):
+        store = RouteStore.from_records(records, self._lta_client.base_url, fetched_at)
+        current = RouteStore.read(self._file_path)
+        if len(store) == 0:
+            raise DatasetError("No bus routes fetched")
+        # Routes of another DataMall, e.g. a fake one, are no measure for these
+        if current is not None and current.source == store.source and len(store) < len(current) * self._min_ratio:
+            raise DatasetError(f"Only {len(store)} bus routes fetched, {len(current)} currently known")
+        store.write(self._file_path)
+        _stores[self._file_path] = store
+        return store
+
+
+if __name__ == "__main__":
+    # Example usage, against DataMall or e.g. a local fake: LTA_BASE_URL=http://127.0.0.1:8080 python route_store.py
+    import tempfile
+    from lta_client import LTA_BASE_URL
+
+    store = get_route_store()
+    print(f"{len(store)} routes: {store.services()}")
+    print(store.services_at("27011"))
+    print(store.stops_between("199", "27011", "27199"))
+
+    async def main():
+        client = LtaClient(
+            api_key=os.environ.get("LTA_API_KEY", ""), base_url=os.environ.get("LTA_BASE_URL", LTA_BASE_URL)
+        )
+        file_path = os.path.join(tempfile.mkdtemp(), "bus_routes.bin")
+        try:
+            start = time.perf_counter()
+            store = await RouteRefresher(client, file_path).refresh()
+            print(f"Fetched {len(store)} routes in {(time.perf_counter() - start) * 1000:.1f} ms")
+        finally:
+            await client.close()
+
+        start = time.perf_counter()
+        store = RouteStore.read(file_path)
+        print(f"Read {len(store)} routes ({os.path.getsize(file_path) / 1000:.0f} kB) in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+        start = time.perf_counter()
+        for _ in range(100000):
+            store.services_at("27011")
+        print(f"services_at: {(time.perf_counter() - start) * 10:.2f} us")
+
+    if os.environ.get("LTA_API_KEY") or os.environ.get("LTA_BASE_URL"):
+        asyncio.run(main())
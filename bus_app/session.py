@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+import json
+import time
+import queue
+import sqlite3
+import threading
+from collections import OrderedDict
+
+
+class Session:
+    """Per-chat tracking state."""
+
+    __slots__ = (
+        "chat_id",
+        "bus_service_no",
+        "bus_stop_code",
+        "reminder_mins",
+        "est_arrivals",
+        "last_seen",
+    )
+
+    def __init__(
+        self,
+        chat_id,
+        bus_service_no: str = "",
+        bus_stop_code: str = "",
+        reminder_mins: list = None,
+        last_seen: float = 0.0,
+        est_arrivals: tuple = (),
+    ):
+        self.chat_id = chat_id
+        self.bus_service_no = bus_service_no
+        self.bus_stop_code = bus_stop_code
+        self.reminder_mins = list(reminder_mins) if reminder_mins is not None else []
+        self.est_arrivals = tuple(est_arrivals)  # estimated arrivals of the tracked service at the tracked stop, in epoch secs
+        self.last_seen = last_seen
+
+    def __repr__(self):
+        return (
+            f"Session(chat_id={self.chat_id!r}, bus_service_no={self.bus_service_no!r}, "
+            f"bus_stop_code={self.bus_stop_code!r}, reminder_mins={self.reminder_mins!r})"
+        )
+
+
+# ======================================== Backends ========================================
+class SessionBackend:
+    """
+    In-memory backend: sessions only live in the SessionStore's LRU, so an evicted session is
+    recreated from the defaults. Subclass and override load/save/delete to persist them.
+    """
+
+    def load(self, chat_id):
+        return None
+
+    def save(self, session: Session):
+        pass
+
+    def save_many(self, sessions: list):
+        for session in sessions:
+            self.save(session)
+
+    def delete(self, chat_id):
+        pass
+
+    def delete_expired(self, deadline: float):
+        """Deletes the sessions last seen before the epoch time deadline."""
+        pass
+
+    def close(self):
+        pass
+
+
+class SqliteSessionBackend(SessionBackend):
+    """
+    Sessions in a SQLite file. Saves and deletes are queued to a writer thread, which commits them
+    in batches, so the event loop never waits on a commit; loading a chat with queued writes waits
+    for them first.
+    """
+
+    def __init__(self, file_path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(file_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "chat_id INTEGER PRIMARY KEY, "
+            "bus_service_no TEXT NOT NULL, "
+            "bus_stop_code TEXT NOT NULL, "
+            "reminder_mins TEXT NOT NULL, "
+            "last_seen REAL NOT NULL, "
+            "est_arrivals TEXT NOT NULL DEFAULT '[]')"
+        )
+        # Files created before est_arrivals was kept
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(sessions)")]
+        if "est_arrivals" not in columns:
+            self._conn.execute("ALTER TABLE sessions ADD COLUMN est_arrivals TEXT NOT NULL DEFAULT '[]'")
+        self._conn.commit()
+        self._queued = {}  # chat id -> writes queued and not committed yet
+        self._queued_lock = threading.Lock()  # not held during commits
+        self._writes = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name="SessionWriter", daemon=True)
+        self._writer.start()
+
+    def load(self, chat_id):
+        if chat_id in self._queued:
+            self.flush()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT bus_service_no, bus_stop_code, reminder_mins, last_seen, est_arrivals FROM sessions WHERE chat_id = ?",
+                (chat_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        return Session(chat_id, row[0], row[1], json.loads(row[2]), row[3], json.loads(row[4]))
+
+    @staticmethod
+    def _row_of(session: Session):
+        return (
+            session.chat_id,
+            session.bus_service_no,
+            session.bus_stop_code,
+            json.dumps(session.reminder_mins),
+            session.last_seen,
+            json.dumps([int(est_arrival) for est_arrival in session.est_arrivals]),
+        )
+
+    def save(self, session: Session):
+        self.save_many([session])
+
+    def save_many(self, sessions: list):
+        if len(sessions) == 0:
+            return
+        rows = [self._row_of(session) for session in sessions]
+        self._queue("INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?, ?, ?)", rows, [row[0] for row in rows])
+
+    def delete(self, chat_id):
+        self._queue("DELETE FROM sessions WHERE chat_id = ?", [(chat_id,)], [chat_id])
+
+    def delete_expired(self, deadline: float):
+        self._queue("DELETE FROM sessions WHERE last_seen < ?", [(deadline,)], [])
+
+    def _queue(self, sql: str, rows: list, chat_ids: list):
+        with self._queued_lock:
+            for chat_id in chat_ids:
+                self._queued[chat_id] = self._queued.get(chat_id, 0) + 1
+        self._writes.put((sql, rows, chat_ids))
+
+    def flush(self):
+        """Waits until every queued write is committed."""
+        self._writes.join()
+
+    # ======================================== Writer thread ========================================
+    def _write_loop(self):
+        while True:
+            batch = [self._writes.get()]
+            while len(batch) < 256:
+                try:
+                    batch.append(self._writes.get_nowait())
+                except queue.Empty:
+                    break
+            writes = [write for write in batch if write is not None]
+            if writes:
+                with self._lock:
+                    for sql, rows, _ in writes:
+                        self._conn.executemany(sql, rows)
+                    self._conn.commit()
+                with self._queued_lock:
+                    for _, _, chat_ids in writes:
+                        for chat_id in chat_ids:
+                            self._queued[chat_id] -= 1
+                            if self._queued[chat_id] == 0:
+                                del self._queued[chat_id]
+            for _ in batch:
+                self._writes.task_done()
+            if len(writes) < len(batch):
+                return
+
+    def close(self):
+        if self._writer is not None:
+            self._writes.put(None)
+            self._writer.join()
+            self._writer = None
+        with self._lock:
+            self._conn.close()
+
+
+# ======================================== Store ========================================
+class SessionStore:
+    """
+    Sessions keyed by chat_id, held in an LRU bounded by max_sessions and expired after ttl secs
+    of inactivity. New sessions start from the given defaults; the backend decides whether
+    evicted sessions can be loaded back.
+
+    Sessions are saved when they are modified, when the LRU evicts them and on close, so last_seen
+    and est_arrivals survive restarts. evict_expired is meant to be called periodically; it also
+    saves the sessions seen since its last call, so the backend does not expire them.
+    """
+
+    def __init__(
+        self,
+        bus_service_no: str = "",
+        bus_stop_code: str = "",
+        reminder_mins: list = [],
+        backend: SessionBackend = None,
+        max_sessions: int = 10000,
+        ttl: float = 24 * 3600.0,  # in secs
+    ):
+        self._defaults = (str(bus_service_no), str(bus_stop_code), tuple(reminder_mins))
+        self._backend = backend if backend is not None else SessionBackend()
+        self._max_sessions = max_sessions
+        self._ttl = ttl
+        self._sessions = OrderedDict()
+        self._swept_at = time.time()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, chat_id):
+        return chat_id in self._sessions
+
+    def get(self, chat_id):
+        """Returns the session of chat_id, loading or creating it if needed."""
+        now = time.time()
+        session = self._sessions.get(chat_id)
+        if session is not None and now - session.last_seen > self._ttl:
+            del self._sessions[chat_id]
+            session = None
+
+        if session is None:
+            session = self._backend.load(chat_id)
+            if session is None or now - session.last_seen > self._ttl:
+                bus_service_no, bus_stop_code, reminder_mins = self._defaults
+                session = Session(chat_id, bus_service_no, bus_stop_code, reminder_mins)
+            self._sessions[chat_id] = session
+            self._evict()
+        else:
+            self._sessions.move_to_end(chat_id)
+
+        session.last_seen = now
+        return session
+
+    def save(self, session: Session):
+        """Persists a modified session through the backend."""
+        self._backend.save(session)
+
+    def remove(self, chat_id):
+        self._sessions.pop(chat_id, None)
+        self._backend.delete(chat_id)
+
+    def evict_expired(self):
+        """Drops every session idle for longer than ttl. Returns the number of sessions dropped."""
+        now = time.time()
+        deadline = now - self._ttl
+        # The LRU is in order of last_seen, the expired sessions are at its front
+        expired = 0
+        for session in self._sessions.values():
+            if session.last_seen >= deadline:
+                break
+            expired += 1
+        for _ in range(expired):
+            self._sessions.popitem(last=False)
+
+        # Sessions only read since the last sweep have an older last_seen in the backend
+        seen = []
+        for session in reversed(self._sessions.values()):
+            if session.last_seen < self._swept_at:
+                break
+            seen.append(session)
+        self._swept_at = now
+        self._backend.save_many(seen)
+        self._backend.delete_expired(deadline)
+        return expired
+
+    def _evict(self):
+        while len(self._sessions) > self._max_sessions:
+            _, session = self._sessions.popitem(last=False)
+            self._backend.save(session)
+
+    def flush(self):
+        """Saves every session in memory, e.g. to keep their last_seen across a restart."""
+        self._backend.save_many(list(self._sessions.values()))
+
+    def close(self):
+        self.flush()
+        self._backend.close()
+
+
+if __name__ == "__main__":
+    # Example usage:
+    store = SessionStore("199", "27011", [15.0], max_sessions=1000)
+    for chat_id in range(5000):
+        store.get(chat_id).bus_service_no = str(chat_id)
+    print(len(store))  # Should print: 1000
+    print(store.get(4999))  # Should print the session of chat 4999
+    print(store.get(0))  # Should print a fresh session with the defaults
@@ -37,6 +37,39 @@ def bus_stop_raw_to_dict(file_path):
     
     return data_dict
 
+def normalize_name(name: str):
+    """
+    Normalizes a bus stop name for lookups: lowercase, punctuation stripped and whitespace collapsed.
+
+    Args:
+        name (str): The raw bus stop name, e.g. "Jurong West Ctrl 3-Boon Lay Int".
+
+    Returns:
+        str: The normalized name, e.g. "jurong west ctrl 3 boon lay int".
+    """
+
+    name = re.sub(r"['.]", "", name.lower())  # S'goon -> sgoon, St. -> st
+    return " ".join(re.sub(r"[^0-9a-z]+", " ", name).split())
+
+def split_bus_services(text: str):
+    """
+    Splits a list of bus service numbers such as "199, 179 and 179A" into ["199", "179", "179A"].
+    Words that are not bus service numbers are dropped.
+    """
+
+    tokens = re.split(r"[\s,/&]+|\band\b", text)
+    return [token.upper() for token in tokens if token and re.fullmatch(r"[A-Za-z]{0,3}\d{1,3}[A-Za-z]?", token)]
+
+def is_plain_reply(text: str, min_length: int = 20):
+    """
+    Tells whether a partial LLM reply is conversation rather than a function architype such as
+    BUS_ARRIVAL<199>, so that it can be shown to the user before it is complete.
+    """
+
+    if len(text.strip()) < min_length:
+        return False
+    return re.match(r"\s*[A-Z][A-Z_]*(<|\s*$)", text) is None
+
 def extract_function_info(text: str):
     '''
     ----
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+import time
+import asyncio
+import logging
+from watch_table import WatchTable
+
+logger = logging.getLogger(__name__)
+
+
+class WatchScheduler:
+    """
+    Background task that pushes standing watches every bucket_mins, on the clock (07:30, 07:35, ...).
+
+    The watches due in a bucket are grouped by bus stop and push(bus_stop_code, watches) is called
+    once per stop, at most max_concurrent stops at a time. So the upstream fetches per bucket are
+    bounded by the number of watched stops, not the number of subscribers.
+    """
+
+    def __init__(self, table: WatchTable, push, bucket_mins: int = 5, max_concurrent: int = 16):
+        """
+        Args:
+            push (coroutine function): push(bus_stop_code, [Watch]) for every stop with due watches.
+            bucket_mins (int): Watches are pushed every bucket_mins within their window. Must divide 60.
+        """
+
+        if bucket_mins <= 0 or 60 % bucket_mins != 0:
+            raise ValueError(f"bucket_mins must be a positive divisor of 60, got {bucket_mins}")
+        self._table = table
+        self._push = push
+        self._bucket = bucket_mins * 60.0  # in secs
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._task = None
+        self._buckets = set()
+        self.fetches = 0
+
+    def next_bucket(self, now: float = None):
+        """Epoch time of the next bucket boundary; Singapore is a whole number of hours ahead of UTC."""
+        now = time.time() if now is None else now
+        return (now // self._bucket + 1) * self._bucket
+
+    def start(self):
+        """Starts the scheduler task on the running event loop if it is not running yet."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        last = 0.0
+        while True:
+            # Waking up a little early would find the bucket just pushed again
+            bucket = max(self.next_bucket(), last + self._bucket)
+            await asyncio.sleep(bucket - time.time())
+            last = bucket
+            # A slow bucket must not delay the next one
+            task = asyncio.get_running_loop().create_task(self.run_bucket(bucket))
+            self._buckets.add(task)
+            task.add_done_callback(self._buckets.discard)
+
+    async def run_bucket(self, timestamp: float):
+        """Pushes the watches due at the epoch time timestamp. Returns the number of stops fetched."""
+        due = self._table.due(timestamp)
+        if len(due) == 0:
+            return 0
+        logger.info("Pushing %s watches at %s stops.", sum(len(watches) for watches in due.values()), len(due))
+
+        async def push(bus_stop_code, watches):
+            async with self._semaphore:
+                self.fetches += 1
+                try:
+                    await self._push(bus_stop_code, watches)
+                except Exception as e:
+                    logger.warning("Failed to push watches of %s: %r", bus_stop_code, e)
+
+        await asyncio.gather(*[push(bus_stop_code, watches) for bus_stop_code, watches in due.items()])
+        return len(due)
+
+
+if __name__ == "__main__":
+    # Example usage:
+    from datetime import datetime
+    from app_utils import SGT
+    from watch_table import Watch, WEEKDAYS
+
+    async def main():
+        table = WatchTable()
+        for i in range(10000):
+            table.add(Watch(str(i), i, "199", f"{i % 50:05d}", WEEKDAYS, 450, 510))
+        pushed = []
+
+        async def push(bus_stop_code, watches):
+            await asyncio.sleep(0.01)  # the upstream fetch
+            pushed.extend(watches)
+
+        scheduler = WatchScheduler(table, push)
+        monday_0800 = datetime(2024, 9, 23, 8, 0, tzinfo=SGT).timestamp()
+        start = time.perf_counter()
+        stops = await scheduler.run_bucket(monday_0800)
+        elapsed = time.perf_counter() - start
+        print(f"{len(pushed)} watches pushed with {stops} fetches in {elapsed * 1000:.1f} ms")
+        print(f"Next bucket in {scheduler.next_bucket() - time.time():.0f} s")
+
+    asyncio.run(main())
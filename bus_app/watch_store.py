@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+import time
+import sqlite3
+import threading
+from watch_table import Watch, WEEKDAYS
+
+
+class WatchStore:
+    """Durable store of standing watches in SQLite, loaded into the WatchTable on start."""
+
+    def __init__(self, file_path: str = ":memory:"):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(file_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS watches ("
+            "watch_id TEXT PRIMARY KEY, "
+            "chat_id INTEGER, "
+            "bus_service_no TEXT NOT NULL, "
+            "bus_stop_code TEXT NOT NULL, "
+            "days INTEGER NOT NULL, "  # bitmask of weekdays, bit 0 is Monday
+            "start_min INTEGER NOT NULL, "  # mins after midnight, Singapore time
+            "end_min INTEGER NOT NULL)"
+        )
+        self._conn.commit()
+
+    def add(self, watch: Watch):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO watches VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    watch.watch_id,
+                    watch.chat_id,
+                    watch.bus_service_no,
+                    watch.bus_stop_code,
+                    watch.days,
+                    watch.start_min,
+                    watch.end_min,
+                ),
+            )
+            self._conn.commit()
+
+    def remove(self, watch_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM watches WHERE watch_id = ?", (watch_id,))
+            self._conn.commit()
+
+    def remove_chat(self, chat_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM watches WHERE chat_id = ?", (chat_id,))
+            self._conn.commit()
+
+    def load(self):
+        """Returns every stored watch."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT watch_id, chat_id, bus_service_no, bus_stop_code, days, start_min, end_min FROM watches"
+            ).fetchall()
+        return [Watch(*row) for row in rows]
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM watches").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+if __name__ == "__main__":
+    # Example usage:
+    store = WatchStore()
+    start = time.perf_counter()
+    for i in range(10000):
+        store.add(Watch(str(i), i, "199", "27011", WEEKDAYS, 450, 510))
+    print(f"Stored {len(store)} watches in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    start = time.perf_counter()
+    watches = store.load()
+    print(f"Loaded {len(watches)} watches in {(time.perf_counter() - start) * 1000:.1f} ms: {watches[0]}")
+    store.close()
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+import re
+import numpy as np
+from datetime import datetime
+from app_utils import SGT
+
+DAY_NAMES = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+WEEKDAYS = 0b0011111
+WEEKENDS = 0b1100000
+EVERY_DAY = 0b1111111
+DAY_PRESETS = {
+    "weekday": WEEKDAYS,
+    "weekdays": WEEKDAYS,
+    "weekend": WEEKENDS,
+    "weekends": WEEKENDS,
+    "": EVERY_DAY,
+    "day": EVERY_DAY,
+    "daily": EVERY_DAY,
+    "everyday": EVERY_DAY,
+}
+CLOCK = r"(\d{1,2})[:.](\d{2})"
+
+
+def parse_days(text: str):
+    """
+    Parses "weekdays", "weekends", "daily" or a list of days such as "mon, wed and fri" into a
+    bitmask of weekdays (bit 0 is Monday). Empty text means every day.
+
+    Returns:
+        int: The bitmask, or None if the text is not understood.
+    """
+
+    text = re.sub(r"^(?:on\s+)?(?:every\s+)?", "", " ".join(text.lower().split()))
+    if text in DAY_PRESETS:
+        return DAY_PRESETS[text]
+
+    days = 0
+    for name in re.split(r"\s*(?:,|and|&|\s)\s*", text):
+        if name == "":
+            continue
+        day = next((i for i, day_name in enumerate(DAY_NAMES) if name.startswith(day_name)), None)
+        if day is None:
+            return None
+        days |= 1 << day
+    return days
+
+
+def parse_window(text: str):
+    """
+    Parses a time window such as "07:30-08:30" or "7.30 to 8.30", in Singapore time.
+
+    Returns:
+        (int, int): Start and end in mins after midnight, or None if the text is not understood.
+    """
+
+    match = re.fullmatch(rf"\s*{CLOCK}\s*(?:-|–|to|until|till)\s*{CLOCK}\s*", text.lower())
+    if match is None:
+        return None
+    start_hour, start_min, end_hour, end_min = (int(group) for group in match.groups())
+    if start_hour > 23 or end_hour > 23 or start_min > 59 or end_min > 59:
+        return None
+    start, end = start_hour * 60 + start_min, end_hour * 60 + end_min
+    # Windows across midnight are not supported
+    return (start, end) if start <= end else None
+
+
+def format_days(days: int):
+    for name, preset in (("every day", EVERY_DAY), ("weekdays", WEEKDAYS), ("weekends", WEEKENDS)):
+        if days == preset:
+            return name
+    return ", ".join(name.capitalize() for i, name in enumerate(DAY_NAMES) if days & (1 << i))
+
+
+def format_window(start_min: int, end_min: int):
+    return f"{start_min // 60:02d}:{start_min % 60:02d}-{end_min // 60:02d}:{end_min % 60:02d}"
+
+
+class Watch:
+    """A standing request for the arrivals of one bus service at one stop, on some days within a time window."""
+
+    __slots__ = ("watch_id", "chat_id", "bus_service_no", "bus_stop_code", "days", "start_min", "end_min", "row")
+
+    def __init__(self, watch_id, chat_id, bus_service_no, bus_stop_code, days, start_min, end_min):
+        self.watch_id = watch_id
+        self.chat_id = chat_id
+        self.bus_service_no = bus_service_no
+        self.bus_stop_code = bus_stop_code
+        self.days = days  # bitmask of weekdays, bit 0 is Monday
+        self.start_min = start_min  # mins after midnight, Singapore time
+        self.end_min = end_min  # inclusive
+        self.row = None  # row in the WatchTable
+
+    def __str__(self):
+        return (
+            f"#{self.watch_id}: {self.bus_service_no} at {self.bus_stop_code}, "
+            f"{format_window(self.start_min, self.end_min)} on {format_days(self.days)}"
+        )
+
+
+class WatchTable:
+    """
+    Standing watches in a compact columnar table.
+
+    The days and time window of each watch are kept in NumPy columns (5 bytes a watch), so finding
+    the watches due at some time is one vectorized scan however many there are. due() groups them by
+    bus stop, so each stop is fetched once per time bucket for all of its subscribers. Rows of
+    removed watches are reused.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self._days = np.zeros(capacity, dtype=np.uint8)  # 0 for free rows, which are never due
+        self._start = np.zeros(capacity, dtype=np.int16)
+        self._end = np.zeros(capacity, dtype=np.int16)
+        self._rows = [None] * capacity  # row -> Watch
+        self._free = list(range(capacity - 1, -1, -1))
+        self._watches = {}  # watch id -> Watch
+        self._by_chat = {}  # chat id -> {watch id: Watch}, in the order they were added
+
+    def __len__(self):
+        return len(self._watches)
+
+    def __contains__(self, watch_id):
+        return watch_id in self._watches
+
+    def get(self, watch_id):
+        return self._watches.get(watch_id)
+
+    def for_chat(self, chat_id):
+        return list(self._by_chat.get(chat_id, {}).values())
+
+    def _grow(self):
+        capacity = len(self._rows)
+        self._days = np.concatenate([self._days, np.zeros(capacity, dtype=np.uint8)])
+        self._start = np.concatenate([self._start, np.zeros(capacity, dtype=np.int16)])
+        self._end = np.concatenate([self._end, np.zeros(capacity, dtype=np.int16)])
+        self._rows.extend([None] * capacity)
+        self._free.extend(range(2 * capacity - 1, capacity - 1, -1))
+
+    def add(self, watch: Watch):
+        """Adds a watch, replacing any watch with the same id."""
+        self.remove(watch.watch_id)
+        if len(self._free) == 0:
+            self._grow()
+        row = self._free.pop()
+        self._days[row] = watch.days
+        self._start[row] = watch.start_min
+        self._end[row] = watch.end_min
+        self._rows[row] = watch
+        watch.row = row
+        self._watches[watch.watch_id] = watch
+        self._by_chat.setdefault(watch.chat_id, {})[watch.watch_id] = watch
+
+    def remove(self, watch_id):
+        watch = self._watches.pop(watch_id, None)
+        if watch is None:
+            return None
+        self._days[watch.row] = 0
+        self._rows[watch.row] = None
+        self._free.append(watch.row)
+        watch.row = None
+        watches = self._by_chat.get(watch.chat_id)
+        if watches is not None:
+            watches.pop(watch_id, None)
+            if len(watches) == 0:
+                del self._by_chat[watch.chat_id]
+        return watch
+
+    def remove_chat(self, chat_id):
+        """Removes every watch of chat_id. Returns the removed watches."""
+        return [self.remove(watch_id) for watch_id in list(self._by_chat.get(chat_id, {}))]
+
+    def due(self, timestamp: float):
+        """
+        Returns:
+            dict: {bus stop code: [Watch]} of the watches whose day and window include the epoch time timestamp.
+        """
+
+        now = datetime.fromtimestamp(timestamp, SGT)
+        minute = now.hour * 60 + now.minute
+        active = (
+            ((self._days & np.uint8(1 << now.weekday())) != 0)
+            & (self._start <= minute)
+            & (self._end >= minute)
+        )
+        due = {}
+        for row in np.flatnonzero(active):
+            watch = self._rows[row]
+            due.setdefault(watch.bus_stop_code, []).append(watch)
+        return due
+
+    def stats(self):
+        return {
+            "watches": len(self._watches),
+            "chats": len(self._by_chat),
+            "stops": len({watch.bus_stop_code for watch in self._watches.values()}),
+            "capacity": len(self._rows),
+        }
+
+
+if __name__ == "__main__":
+    # Benchmark: 100k watches over 2000 stops
+    import time
+    import random
+
+    print(parse_days("every weekday"), parse_days("Mon, Wed and Fri"), parse_window("07:30-08:30"))
+    table = WatchTable()
+    rng = random.Random(0)
+    start = time.perf_counter()
+    for i in range(100000):
+        begin = rng.randrange(5 * 60, 22 * 60)
+        table.add(Watch(i, i % 20000, "199", f"{rng.randrange(2000):05d}", rng.choice([WEEKDAYS, EVERY_DAY]), begin, begin + 60))
+    print(f"Added {len(table)} watches in {(time.perf_counter() - start) * 1000:.1f} ms, {table.stats()}")
+
+    monday_0800 = datetime(2024, 9, 23, 8, 0, tzinfo=SGT).timestamp()
+    start = time.perf_counter()
+    due = table.due(monday_0800)
+    elapsed = time.perf_counter() - start
+    print(f"due: {sum(len(watches) for watches in due.values())} watches at {len(due)} stops in {elapsed * 1000:.2f} ms")
+    print(str(next(iter(due.values()))[0]))
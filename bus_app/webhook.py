@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+import time
+import signal
+import asyncio
+import logging
+from aiohttp import web
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+from metrics import metrics_handler
+
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+UNBOUNDED_UPDATES = 2**31 - 1  # concurrent updates of the base class, see ChatOrderedUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """
+    Processes up to max_concurrent_updates updates at a time, but the updates of one chat one after
+    another and in order, so a chat's replies never overtake each other.
+
+    The base class takes its semaphore before do_process_update, so bounded there a chat sending
+    many updates at once would fill every slot with updates waiting on its own lock. The base class
+    is therefore left unbounded and a slot is only taken once the chat's lock is held.
+    """
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(UNBOUNDED_UPDATES)
+        self._slots = asyncio.Semaphore(max_concurrent_updates)
+        self._locks = {}  # chat id -> [lock, users]
+
+    async def do_process_update(self, update, coroutine):
+        chat_id = update.effective_chat.id if isinstance(update, Update) and update.effective_chat else None
+        entry = self._locks.get(chat_id)
+        if entry is None:
+            entry = self._locks[chat_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0], self._slots:
+                await coroutine
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[chat_id]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+
+class WebhookServer:
+    """
+    aiohttp server receiving Telegram updates by webhook.
+
+    POST <path> hands each update to the application's update queue and answers right away, so
+    Telegram is never kept waiting on a handler. GET /healthz reports whether the application is
+    running and how far behind it is, GET /metrics the bot's metrics for Prometheus.
+    """
+
+    def __init__(
+        self,
+        application,
+        host: str = "0.0.0.0",
+        port: int = 8443,
+        path: str = "/telegram",
+        secret_token: str = None,
+    ):
+        self._application = application
+        self._host = host
+        self._port = port
+        self._path = path
+        self._secret_token = secret_token
+        self._runner = None
+        self._started = None
+        self.received = 0
+        self.rejected = 0
+
+        self.app = web.Application()
+        self.app.router.add_post(path, self.handle_update)
+        self.app.router.add_get("/healthz", self.healthz)
+        self.app.router.add_get("/metrics", metrics_handler)
+
+    async def handle_update(self, request):
+        if self._secret_token is not None and request.headers.get(SECRET_TOKEN_HEADER) != self._secret_token:
+            self.rejected += 1
+            return web.Response(status=403)
+        try:
+            data = await request.json()
+            if not isinstance(data, dict) or "update_id" not in data:
+                raise ValueError("not an update")
+            update = Update.de_json(data, self._application.bot)
+        except (ValueError, TypeError, AttributeError, KeyError) as e:
+            logger.debug("Rejected a malformed update: %r", e)
+            self.rejected += 1
+            return web.Response(status=400)
+        self.received += 1
+        await self._application.update_queue.put(update)
+        return web.Response()
+
+    async def healthz(self, request):
+        running = self._application.running
+        return web.json_response(
+            {
+                "status": "ok" if running else "unavailable",
+                "uptime": round(time.monotonic() - self._started, 1) if self._started else 0.0,
+                "received": self.received,
+                "rejected": self.rejected,
+                "queued": self._application.update_queue.qsize(),
+            },
+            status=200 if running else 503,
+        )
+
+    async def start(self):
+        """Starts serving and returns the port, which is picked by the OS if port is 0."""
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self._host, self._port)
+        await site.start()
+        self._started = time.monotonic()
+        return self._runner.addresses[0][1]
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+async def run_webhook(
+    application,
+    host: str = "0.0.0.0",
+    port: int = 8443,
+    path: str = "/telegram",
+    webhook_url: str = None,
+    secret_token: str = None,
+):
+    """
+    Runs application on a WebhookServer until SIGINT/SIGTERM, calling its post_init and
+    post_shutdown like run_polling does. If webhook_url (the public URL the server is reachable at)
+    is given, Telegram is told to deliver updates to webhook_url + path.
+    """
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            pass
+
+    server = WebhookServer(application, host, port, path, secret_token)
+    async with application:
+        if application.post_init is not None:
+            await application.post_init(application)
+        await application.start()
+        try:
+            port = await server.start()
+            logger.info("Listening for updates on %s:%s%s", host, port, path)
+            if webhook_url:
+                await application.bot.set_webhook(
+                    url=webhook_url.rstrip("/") + path,
+                    secret_token=secret_token,
+                    allowed_updates=Update.ALL_TYPES,
+                )
+            await stop.wait()
+        finally:
+            await server.stop()
+            await application.stop()
+            if application.post_shutdown is not None:
+                await application.post_shutdown(application)
@@ -12,6 +12,8 @@ setup(
         # For example: 'requests >= 2.19.1',
         'requests',
         'groq',
+        'aiohttp',
+        'numpy',
         'python-telegram-bot == 21.4',
     ],
 )
\ No newline at end of file
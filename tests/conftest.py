@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The bot's modules import each other by name, as when app.py is run from bus_app/
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "bus_app"))
+# The fakes of the upstream APIs the benchmarks run against
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
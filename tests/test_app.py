@@ -0,0 +1,130 @@
+import uuid
+import asyncio
+import logging
+import pytest
+from telegram.error import Forbidden
+from fake_groq import FakeGroq, DEFAULT_REPLY
+from app_func import App, TrackedReminder, Watch, EVERY_DAY, REMINDER_ERRORS, WATCH_ERRORS
+
+
+class Bot:
+    def __init__(self, blocked=()):
+        self.blocked = set(blocked)
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if chat_id in self.blocked:
+            raise Forbidden("Forbidden: bot was blocked by the user")
+        self.sent.append((chat_id, text))
+
+
+@pytest.fixture
+def app():
+    app = App(groq_api_key="x", bus_service_no="199", bus_stop_code="27011")
+    yield app
+    asyncio.run(app.shutdown())
+
+
+def test_failed_reminders_are_logged_and_counted(app, caplog):
+    app._bot = Bot(blocked=[2])
+    reminders = [TrackedReminder(f"job{chat_id}", chat_id, "199", "27011", 5, 0) for chat_id in (1, 2)]
+    errors = REMINDER_ERRORS.labels().value
+    with caplog.at_level(logging.WARNING):
+        asyncio.run(app.send_reminders(reminders))
+    assert [chat_id for chat_id, _ in app._bot.sent] == [1]
+    assert REMINDER_ERRORS.labels().value == errors + 1
+    assert "job2" in caplog.text and "chat 2" in caplog.text
+
+
+class Message:
+    def __init__(self, chat_id):
+        self.chat_id = chat_id
+        self.replies = []
+
+    async def reply_text(self, text, **kwargs):
+        self.replies.append(text)
+        return self
+
+    async def edit_text(self, text, **kwargs):
+        self.replies[-1] = text
+
+
+class FakeUpdate:
+    def __init__(self, chat_id):
+        self.effective_chat = type("Chat", (), {"id": chat_id})()
+        self.message = Message(chat_id)
+
+
+def test_watch_ids_are_not_reused(app, monkeypatch):
+    ids = iter(["aaaaaa", "aaaaaa", "bbbbbb"])
+    monkeypatch.setattr(uuid, "uuid4", lambda: type("UUID", (), {"hex": next(ids)})())
+
+    async def main():
+        for chat_id in (1, 2):
+            await app.set_watch_async(FakeUpdate(chat_id), None, args_list=["199", "27011", "07:30-08:30"])
+
+    asyncio.run(main())
+    assert [watch.watch_id for watch in app._watches.for_chat(1)] == ["aaaaaa"]
+    assert [watch.watch_id for watch in app._watches.for_chat(2)] == ["bbbbbb"]
+    assert len(app._watch_store) == 2
+
+
+def test_watch_of_unknown_stop_code_is_rejected(app):
+    update = FakeUpdate(1)
+    asyncio.run(app.set_watch_async(update, None, args_list=["199", "99999", "07:30-08:30"]))
+    assert len(app._watches) == 0
+    assert update.message.replies == ["No bus stop 99999 found."]
+
+
+def test_watches_of_blocked_chats_are_removed(app, caplog):
+    app._bot = Bot(blocked=[2])
+
+    async def get_arrivals(bus_stop_code, bus_services=None):
+        return None
+
+    app.get_arrivals = get_arrivals
+    watches = [Watch(f"w{chat_id}", chat_id, "199", "27011", EVERY_DAY, 0, 1439) for chat_id in (1, 2)]
+    for watch in watches:
+        app._watches.add(watch)
+    errors = WATCH_ERRORS.labels().value
+    with caplog.at_level(logging.WARNING):
+        asyncio.run(app.push_watches("27011", watches))
+    assert [chat_id for chat_id, _ in app._bot.sent] == [1]
+    assert WATCH_ERRORS.labels().value == errors + 1
+    assert "chat 2" in caplog.text
+    assert [watch.watch_id for watch in app._watches.for_chat(1)] == ["w1"]
+    assert app._watches.for_chat(2) == []
+
+
+def test_location_outside_the_country_has_no_nearby_stops(app):
+    assert app.nearby_bus_stops(13.75, 100.5) == []
+    reply = asyncio.run(app.get_nearby_arrival_info(13.75, 100.5))
+    assert reply.startswith("No bus stops nearby")
+
+
+def test_start_is_answered_from_the_cache_in_other_chats():
+    groq = FakeGroq()
+
+    async def main():
+        app = App(groq_api_key="x", bus_service_no="199", bus_stop_code="27011", groq_base_url=await groq.start())
+        try:
+            updates = [FakeUpdate(chat_id) for chat_id in (1, 2)]
+            for update in updates:
+                await app.start(update, None)
+        finally:
+            await app.shutdown()
+            await groq.stop()
+        return updates
+
+    updates = asyncio.run(main())
+    assert groq.requests == 1
+    assert updates[0].message.replies == updates[1].message.replies == [DEFAULT_REPLY]
+
+
+@pytest.mark.parametrize("mins", ["soon", "nan", "-5"])
+def test_set_reminder_rejects_bad_mins(app, mins):
+    update = FakeUpdate(1)
+    reminder_mins = list(app.get_reminder(1))
+    asyncio.run(app.set_reminder_async(update, None, args_list=[mins, "true"]))
+    assert app.get_reminder(1) == reminder_mins
+    assert update.message.replies[0].startswith("Please tell me how many mins")
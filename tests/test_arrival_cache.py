@@ -0,0 +1,90 @@
+import asyncio
+import pytest
+from arrival_cache import ArrivalCache
+
+
+class Upstream:
+    def __init__(self, delay: float = 0.01, fail: bool = False):
+        self.delay = delay
+        self.fail = fail
+        self.calls = []
+
+    async def __call__(self, bus_stop_code):
+        self.calls.append(bus_stop_code)
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("upstream down")
+        return {"BusStopCode": bus_stop_code, "call": len(self.calls)}
+
+
+def test_concurrent_misses_share_one_fetch():
+    upstream = Upstream()
+    cache = ArrivalCache(upstream, ttl=60.0)
+
+    async def main():
+        return await asyncio.gather(*[cache.get("27011") for _ in range(10)], cache.get("22009"))
+
+    responses = asyncio.run(main())
+    assert sorted(upstream.calls) == ["22009", "27011"]
+    assert all(response is responses[0] for response in responses[:10])
+    assert cache.stats() == {"hits": 0, "misses": 2, "coalesced": 9, "entries": 2, "in_flight": 0}
+
+
+def test_responses_expire_after_ttl():
+    upstream = Upstream(delay=0.0)
+    cache = ArrivalCache(upstream, ttl=0.05)
+
+    async def main():
+        first = await cache.get("27011")
+        assert await cache.get("27011") is first
+        await asyncio.sleep(0.06)
+        return first, await cache.get("27011")
+
+    first, second = asyncio.run(main())
+    assert second["call"] == 2 and first["call"] == 1
+    assert cache.hits == 1 and cache.misses == 2
+
+
+def test_failures_are_not_cached():
+    upstream = Upstream(fail=True)
+    cache = ArrivalCache(upstream, ttl=60.0)
+
+    async def main():
+        results = await asyncio.gather(*[cache.get("27011") for _ in range(3)], return_exceptions=True)
+        assert all(isinstance(result, RuntimeError) for result in results)
+        upstream.fail = False
+        return await cache.get("27011")
+
+    assert asyncio.run(main())["call"] == 2
+    assert len(upstream.calls) == 2
+
+
+def test_cancelled_caller_does_not_cancel_the_fetch():
+    upstream = Upstream(delay=0.05)
+    cache = ArrivalCache(upstream, ttl=60.0)
+
+    async def main():
+        impatient = asyncio.ensure_future(cache.get("27011"))
+        patient = asyncio.ensure_future(cache.get("27011"))
+        await asyncio.sleep(0.01)
+        impatient.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await impatient
+        return await patient
+
+    assert asyncio.run(main())["call"] == 1
+
+
+def test_bounded_by_max_entries():
+    cache = ArrivalCache(Upstream(delay=0.0), ttl=60.0, max_entries=3)
+
+    async def main():
+        for code in ["1", "2", "3", "4"]:
+            await cache.get(code)
+
+    asyncio.run(main())
+    assert len(cache) == 3
+    cache.invalidate("4")
+    assert len(cache) == 2
+    cache.invalidate()
+    assert len(cache) == 0
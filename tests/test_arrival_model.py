@@ -0,0 +1,67 @@
+from arrival_model import (
+    parse_bus_arrival,
+    format_service_arrival,
+    parse_timestamp,
+    format_time,
+    reminder_fire_times,
+    closest_estimates,
+)
+
+DATA = {
+    "BusStopCode": "27011",
+    "Services": [
+        {
+            "ServiceNo": "199",
+            "Operator": "SBST",
+            "NextBus": {"EstimatedArrival": "2024-09-20T08:01:02+08:00", "Load": "SEA", "Type": "DD", "Feature": "WAB", "Monitored": 1},
+            "NextBus2": {"EstimatedArrival": "2024-09-20T08:11:40+08:00", "Load": "SDA", "Type": "SD", "Feature": "", "Monitored": 0},
+            "NextBus3": {"EstimatedArrival": "", "Load": "", "Type": "", "Feature": "", "Monitored": 0},
+        },
+        {"ServiceNo": "179", "Operator": "SMRT", "NextBus": {}, "NextBus2": {}, "NextBus3": {}},
+    ],
+}
+
+
+def test_parse_every_service_of_the_stop():
+    arrivals = parse_bus_arrival(DATA)
+    assert list(arrivals) == ["199", "179"]
+    arrival = arrivals["199"]
+    assert (arrival.bus_stop_code, arrival.operator) == ("27011", "SBST")
+    assert [next_bus.est_arrival for next_bus in arrival.next_buses] == [1726790462, 1726791100]
+    first, second = arrival.next_buses
+    assert (first.load, first.bus_type, first.wheelchair, first.monitored) == ("SEA", "DD", True, True)
+    assert (second.wheelchair, second.monitored) == (False, False)
+    assert arrivals["179"].next_buses == ()
+
+
+def test_parse_only_the_wanted_services():
+    assert list(parse_bus_arrival(DATA, ["179", "243G"])) == ["179"]
+    assert parse_bus_arrival(DATA, []) == {}
+    assert parse_bus_arrival({}) == {}
+
+
+def test_format_in_singapore_time():
+    arrivals = parse_bus_arrival(DATA)
+    assert format_service_arrival(arrivals["199"]) == (
+        "Next bus 199 arriving at station 27011 at 08:01:02 (seats available, double deck, wheelchair accessible), "
+        "followed by 08:11:40"
+    )
+    assert format_service_arrival(arrivals["179"]) == "No estimated arrival for bus 179 at station 27011."
+
+
+def test_parse_timestamp_to_epoch_secs():
+    assert parse_timestamp("2024-09-20T08:01:02+08:00") == 1726790462
+    assert parse_timestamp("2024-09-20T00:01:02+00:00") == 1726790462
+    assert format_time(1726790462, "%Y-%m-%d %H:%M") == "2024-09-20 08:01"
+
+
+def test_reminder_fire_times_of_every_arrival():
+    fire_times = reminder_fire_times([1000.0, 2000.0], [5.0, 1.0, 0.5])
+    assert fire_times.shape == (2, 3)
+    assert fire_times.tolist() == [[700.0, 940.0, 970.0], [1700.0, 1940.0, 1970.0]]
+
+
+def test_closest_estimates():
+    closest, gaps = closest_estimates([1000, 1600, 5000], [1030, 1500, 1700, 4000])
+    assert closest.tolist() == [0, 1, 3]
+    assert gaps.tolist() == [30.0, 100.0, 1000.0]
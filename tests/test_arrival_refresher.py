@@ -0,0 +1,44 @@
+import time
+import asyncio
+from arrival_refresher import ArrivalRefresher
+
+
+class Reminder:
+    def __init__(self, job_id, fire_timestamp, bus_stop_code="27011", bus_service_no="199"):
+        self.job_id = job_id
+        self.chat_id = job_id
+        self.bus_service_no = bus_service_no
+        self.bus_stop_code = bus_stop_code
+        self.fire_timestamp = fire_timestamp
+
+
+async def no_arrivals(bus_stop_code, bus_service_nos):
+    return None
+
+
+def track_all(reminders):
+    async def main():
+        refresher = ArrivalRefresher(no_arrivals, lambda reminder: True)
+        for reminder in reminders:
+            refresher.track(reminder)
+        await refresher.stop()
+        return refresher
+
+    return asyncio.run(main())
+
+
+def test_track_only_brings_the_poll_forward():
+    now = time.time()
+    refresher = track_all([Reminder(1, now + 3600), Reminder(2, now + 100), Reminder(3, now + 3000)])
+    poll_at = refresher._next_poll[("27011", "199")]
+    # A quarter of the time left until the soonest reminder
+    assert now + 20 < poll_at < now + 30
+
+
+def test_track_many_reminders_of_one_pair_is_linear():
+    now = time.time()
+    start = time.perf_counter()
+    refresher = track_all([Reminder(i, now + 600 + i) for i in range(20000)])
+    assert time.perf_counter() - start < 2.0
+    assert len(refresher) == 20000
+    assert refresher.pairs() == [("27011", "199")]
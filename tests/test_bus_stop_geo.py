@@ -0,0 +1,55 @@
+import math
+import time
+import random
+import pytest
+from bus_stop_index import BusStopIndex
+from bus_stop_geo import BusStopGeoIndex
+
+
+@pytest.fixture(scope="module")
+def geo_index():
+    rng = random.Random(0)
+    count = 2000
+    latitudes = [rng.uniform(1.25, 1.45) for _ in range(count)]
+    longitudes = [rng.uniform(103.65, 104.0) for _ in range(count)]
+    # A stop without coordinates is left out
+    latitudes[0] = longitudes[0] = 0.0
+    codes = [f"{i:05d}" for i in range(count)]
+    return BusStopGeoIndex(BusStopIndex(codes, ["Road"] * count, codes, latitudes, longitudes))
+
+
+def brute_force(geo_index, latitude, longitude):
+    x, y = geo_index._project(latitude, longitude)
+    return sorted(
+        (math.hypot(geo_index._x[row] - x, geo_index._y[row] - y), geo_index.bus_stop_index.codes[row])
+        for row in geo_index._located
+    )
+
+
+def test_skips_stops_without_coordinates(geo_index):
+    assert len(geo_index) == 1999
+    assert "00000" not in [stop.code for stop in geo_index.nearest(0.0, 0.0, k=5)]
+
+
+def test_nearest_and_within_match_brute_force(geo_index):
+    rng = random.Random(1)
+    for _ in range(100):
+        latitude, longitude = rng.uniform(1.2, 1.5), rng.uniform(103.6, 104.05)
+        expected = brute_force(geo_index, latitude, longitude)
+        assert [stop.code for stop in geo_index.nearest(latitude, longitude, k=5)] == [code for _, code in expected[:5]]
+        assert [stop.code for stop in geo_index.nearest(latitude, longitude, k=5, max_distance=300.0)] == [
+            code for distance, code in expected[:5] if distance <= 300.0
+        ]
+        assert [stop.code for stop in geo_index.within(latitude, longitude, 500.0)] == [
+            code for distance, code in expected if distance <= 500.0
+        ]
+
+
+@pytest.mark.parametrize("latitude, longitude", [(13.75, 100.5), (51.5, -0.13), (0.0, 0.0)])
+def test_points_outside_the_country_are_fast(geo_index, latitude, longitude):
+    start = time.perf_counter()
+    assert geo_index.nearest(latitude, longitude, k=3, max_distance=3000.0) == []
+    nearest = geo_index.nearest(latitude, longitude, k=3)
+    assert time.perf_counter() - start < 0.5
+    assert [stop.code for stop in nearest] == [code for _, code in brute_force(geo_index, latitude, longitude)[:3]]
+    assert geo_index.within(latitude, longitude, 500.0) == []
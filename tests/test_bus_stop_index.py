@@ -0,0 +1,89 @@
+import os
+import bus_stop_index
+from bus_stop_index import BusStopIndex, get_bus_stop_index, load_bus_stop_index, snapshot_path_of
+
+CSV = (
+    "BusStopCode,RoadName,Description,Latitude,Longitude\n"
+    "27011,Nanyang Cres,Hall 11 Blk 55,1.35586334559449,103.68610938870162\n"
+    "22009,Jurong West Ctrl 3,Boon Lay Int,1.33932334709184,103.70545701843297\n"
+    "22019,Jurong West Ctrl 3,Boon Lay Int,1.339,103.705\n"
+    "bad line\n"
+)
+
+
+def write_csv(tmp_path, text=CSV):
+    file_path = str(tmp_path / "bus_stop.csv")
+    with open(file_path, "w") as f:
+        f.write(text)
+    return file_path
+
+
+def test_lookups(tmp_path):
+    index = BusStopIndex.from_csv(write_csv(tmp_path))
+    assert len(index) == 3
+    assert "27011" in index and "99999" not in index
+    assert index.get("27011") == ("27011", "Nanyang Cres", "Hall 11 Blk 55", 1.35586334559449, 103.68610938870162)
+    assert index.get("27011").name == "Nanyang Cres-Hall 11 Blk 55"
+    assert index.name_of("22009") == "Jurong West Ctrl 3-Boon Lay Int"
+    assert index.coordinates_of("22019") == (1.339, 103.705)
+    assert index.codes_for_name("jurong west ctrl 3 - boon lay int") == ("22009", "22019")
+    assert index.get("99999") is None and index.name_of("99999") is None
+    assert index.codes_for_name("nowhere") == ()
+    assert [bus_stop.code for bus_stop in index] == ["27011", "22009", "22019"]
+
+
+def test_snapshot_round_trip(tmp_path):
+    index = BusStopIndex.from_csv(write_csv(tmp_path))
+    snapshot_path = str(tmp_path / "bus_stop.bin")
+    index.write_snapshot(snapshot_path, (123, 456))
+
+    loaded = BusStopIndex.from_snapshot(snapshot_path, (123, 456))
+    assert list(loaded) == list(index)
+    assert loaded.codes_for_name("Jurong West Ctrl 3-Boon Lay Int") == ("22009", "22019")
+    assert BusStopIndex.from_snapshot(snapshot_path) is not None
+    # Built from another CSV
+    assert BusStopIndex.from_snapshot(snapshot_path, (123, 457)) is None
+
+
+def test_broken_snapshot_is_ignored(tmp_path):
+    snapshot_path = str(tmp_path / "bus_stop.bin")
+    assert BusStopIndex.from_snapshot(snapshot_path) is None
+    BusStopIndex.from_csv(write_csv(tmp_path)).write_snapshot(snapshot_path)
+    with open(snapshot_path, "r+b") as f:
+        f.truncate(os.path.getsize(snapshot_path) - 1)
+    assert BusStopIndex.from_snapshot(snapshot_path) is None
+    with open(snapshot_path, "r+b") as f:
+        f.write(b"XXXX")
+    assert BusStopIndex.from_snapshot(snapshot_path) is None
+
+
+def test_snapshot_is_rebuilt_when_the_csv_changes(tmp_path):
+    file_path = write_csv(tmp_path)
+    load_bus_stop_index(file_path)
+    assert os.path.exists(snapshot_path_of(file_path))
+
+    # Same size, newer mtime
+    write_csv(tmp_path, CSV.replace("Hall 11", "Hall 12"))
+    stat = os.stat(file_path)
+    os.utime(file_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert load_bus_stop_index(file_path).name_of("27011") == "Nanyang Cres-Hall 12 Blk 55"
+
+    # Same mtime, other size
+    mtime_ns = os.stat(file_path).st_mtime_ns
+    write_csv(tmp_path, CSV + "99999,Nowhere Rd,End,1.0,103.0\n")
+    os.utime(file_path, ns=(mtime_ns, mtime_ns))
+    assert "99999" in load_bus_stop_index(file_path)
+
+
+def test_shared_index_follows_the_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(bus_stop_index, "CHECK_INTERVAL", 0.0)
+    file_path = write_csv(tmp_path)
+    index = get_bus_stop_index(file_path)
+    assert get_bus_stop_index(file_path) is index
+
+    write_csv(tmp_path, CSV + "99999,Nowhere Rd,End,1.0,103.0\n")
+    reloaded = get_bus_stop_index(file_path)
+    assert reloaded is not index and "99999" in reloaded
+
+    os.remove(file_path)
+    assert get_bus_stop_index(file_path) is None
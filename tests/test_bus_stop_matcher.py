@@ -0,0 +1,73 @@
+import pytest
+from bus_stop_index import BusStopIndex
+from bus_stop_matcher import BusStopMatcher, canonical_tokens, MATCH_CONFIDENCE_THRESHOLD
+
+BUS_STOPS = [
+    ("22009", "Jurong West Ctrl 3", "Boon Lay Int"),
+    ("21439", "Boon Lay Pl", "Boon Lay CC"),
+    ("28359", "Boon Lay Way", "Blk 350"),
+    ("22489", "Jurong West Ctrl 1", "Blk 683A"),
+    ("22481", "Jurong West Ctrl 1", "Blk 691A CP"),
+    ("27199", "Nanyang Ave", "Hall 11"),
+    ("27011", "Nanyang Cres", "Hall 11 Blk 55"),
+    ("27031", "Nanyang Cres", "Hall 12"),
+    ("17179", "Clementi Ave 3", "Clementi Stn Exit A"),
+]
+
+
+@pytest.fixture(scope="module")
+def matcher():
+    codes, road_names, descriptions = zip(*BUS_STOPS)
+    index = BusStopIndex(codes, road_names, descriptions, [0.0] * len(codes), [0.0] * len(codes))
+    return BusStopMatcher(index)
+
+
+def test_canonical_tokens():
+    assert canonical_tokens("Opposite Boon Lay Interchange") == ["opp", "boon", "lay", "int"]
+
+
+@pytest.mark.parametrize(
+    "query, code",
+    [
+        ("Boon Lay Interchange", "22009"),
+        ("boon lay int", "22009"),
+        ("Blk 683A Jurong West Central 1", "22489"),
+        ("jurong west central 1 block 691a", "22481"),
+        ("hall 12", "27031"),
+        ("clementi mrt", "17179"),
+        # Typos only cost a little
+        ("nanyang crescent hal 12", "27031"),
+    ],
+)
+def test_best_match(matcher, query, code):
+    assert matcher.best_match(query).code == code
+
+
+def test_ranks_best_first(matcher):
+    matches = matcher.match("hall 11 blk 55", top_k=3)
+    assert [match.code for match in matches][:2] == ["27011", "27199"]
+    assert [match.score for match in matches] == sorted((match.score for match in matches), reverse=True)
+    assert matches[0].name == "Nanyang Cres-Hall 11 Blk 55"
+    assert matches[0].score >= MATCH_CONFIDENCE_THRESHOLD
+    assert all(0.0 <= match.score <= 1.0 for match in matches)
+
+
+def test_top_k(matcher):
+    assert len(matcher.match("boon lay", top_k=2)) == 2
+    assert len(matcher.match("boon lay", top_k=10)) <= len(BUS_STOPS)
+
+
+def test_bus_stop_code(matcher):
+    assert matcher.match("27011") == [("27011", "Nanyang Cres-Hall 11 Blk 55", 1.0)]
+    assert matcher.match("99999") == []
+
+
+@pytest.mark.parametrize("query", [None, "", "   ", "!!!"])
+def test_no_match(matcher, query):
+    assert matcher.match(query) == []
+    assert matcher.best_match(query) is None
+
+
+def test_unrelated_name_scores_low(matcher):
+    best = matcher.best_match("changi airport terminal 3")
+    assert best is None or best.score < MATCH_CONFIDENCE_THRESHOLD
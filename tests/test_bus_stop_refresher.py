@@ -0,0 +1,132 @@
+import csv
+import os
+import asyncio
+import pytest
+from bus_stop_index import BusStopIndex
+from bus_stop_refresher import BusStopRefresher, DatasetError, diff_bus_stops, fetch_pages, validate_bus_stops
+from bus_stop_matcher import get_bus_stop_matcher
+from bus_stop_geo import get_bus_stop_geo_index
+
+BUS_STOP_FILE = os.path.join(os.path.dirname(__file__), "..", "data", "bus_stop.csv")
+
+
+def load_records():
+    with open(BUS_STOP_FILE, newline="") as f:
+        return list(csv.DictReader(f))
+
+
+class Client:
+    def __init__(self, records):
+        self.records = records
+        self.skips = []
+
+    async def get(self, path, params=None):
+        skip = params["$skip"]
+        self.skips.append(skip)
+        return {"value": self.records[skip : skip + 500]}
+
+
+def index_of(rows):
+    codes, road_names, descriptions, latitudes, longitudes = zip(*rows)
+    return BusStopIndex(codes, road_names, descriptions, [float(x) for x in latitudes], [float(x) for x in longitudes])
+
+
+@pytest.mark.parametrize("count", [0, 1, 499, 500, 1234])
+def test_fetch_pages_in_order(count):
+    records = [{"BusStopCode": str(i)} for i in range(count)]
+    client = Client(records)
+    fetched = asyncio.run(fetch_pages(client, "BusStops", max_concurrency=3))
+    assert fetched == records
+    # Stops at the first short page, plus what was already in flight
+    assert len(client.skips) <= count // 500 + 3
+
+
+def test_validate_returns_csv_rows():
+    records = load_records()[:3]
+    rows = validate_bus_stops(records)
+    assert [row[0] for row in rows] == [record["BusStopCode"] for record in records]
+    assert rows[0][1:3] == [records[0]["RoadName"], records[0]["Description"]]
+    assert float(rows[0][3]) == float(records[0]["Latitude"])
+
+
+@pytest.mark.parametrize(
+    "change",
+    [
+        {"BusStopCode": "abc"},
+        {"BusStopCode": ""},
+        {"Latitude": "north"},
+    ],
+)
+def test_validate_rejects_malformed_records(change):
+    records = load_records()[:10]
+    records[5] = dict(records[5], **change)
+    with pytest.raises(DatasetError):
+        validate_bus_stops(records)
+
+
+def test_validate_rejects_duplicates_and_truncated_datasets():
+    records = load_records()[:10]
+    with pytest.raises(DatasetError):
+        validate_bus_stops(records + records[:1])
+    with pytest.raises(DatasetError):
+        validate_bus_stops([])
+    with pytest.raises(DatasetError):
+        validate_bus_stops(records, current_count=100)
+    assert len(validate_bus_stops(records, current_count=11)) == 10
+
+
+def test_diff():
+    rows = validate_bus_stops(load_records()[:5])
+    new_rows = [list(row) for row in rows[1:]] + [["99999", "Nowhere Rd", "End", "1.3", "103.8"]]
+    new_rows[0][2] = "Renamed"
+    diff = diff_bus_stops(index_of(rows), index_of(new_rows))
+    assert diff.added == ("99999",)
+    assert diff.removed == (rows[0][0],)
+    assert diff.changed == (rows[1][0],)
+    assert diff.total == 5
+
+    assert diff_bus_stops(index_of(rows), index_of(rows)) == ((), (), (), 5)
+    assert diff_bus_stops(None, index_of(rows)).added == tuple(sorted(row[0] for row in rows))
+
+
+@pytest.mark.parametrize("latitude, longitude", [("0", "0"), ("0.0", "103.8"), ("1.35", "-103.8"), ("40.7", "-74.0")])
+def test_validate_rejects_coordinates_outside_singapore(latitude, longitude):
+    records = load_records()[:10]
+    records[3] = dict(records[3], Latitude=latitude, Longitude=longitude)
+    with pytest.raises(DatasetError):
+        validate_bus_stops(records)
+
+
+def test_refresh_builds_matcher_and_grid_before_the_swap(tmp_path):
+    file_path = str(tmp_path / "bus_stop.csv")
+    records = load_records()
+    diff = asyncio.run(BusStopRefresher(Client(records), file_path).refresh())
+    assert diff.total == len(records)
+
+    # The first lookups take what the refresh built instead of building their own
+    from bus_stop_matcher import _prebuilt_matcher
+    from bus_stop_geo import _prebuilt_geo_index
+
+    assert get_bus_stop_matcher(file_path) is _prebuilt_matcher
+    assert get_bus_stop_geo_index(file_path) is _prebuilt_geo_index
+    assert get_bus_stop_matcher(file_path).best_match("hall 11") is not None
+
+
+def test_unchanged_dataset_is_not_rewritten(tmp_path):
+    file_path = str(tmp_path / "bus_stop.csv")
+    refresher = BusStopRefresher(Client(load_records()[:600]), file_path)
+    asyncio.run(refresher.refresh())
+    mtime_ns = os.stat(file_path).st_mtime_ns
+
+    diff = asyncio.run(refresher.refresh())
+    assert (diff.added, diff.removed, diff.changed, diff.total) == ((), (), (), 600)
+    assert os.stat(file_path).st_mtime_ns == mtime_ns
+
+
+def test_truncated_fetch_keeps_the_current_dataset(tmp_path):
+    file_path = str(tmp_path / "bus_stop.csv")
+    asyncio.run(BusStopRefresher(Client(load_records()[:1000]), file_path).refresh())
+    with pytest.raises(DatasetError):
+        asyncio.run(BusStopRefresher(Client(load_records()[:500]), file_path).refresh())
+    with open(file_path, newline="") as f:
+        assert len(list(csv.DictReader(f))) == 1000
@@ -0,0 +1,87 @@
+import pytest
+from intent_router import IntentRouter
+
+INTENTS = [
+    "BUS_ARRIVAL",
+    "SET_REMINDER",
+    "GET_REMINDER",
+    "SET_WATCH",
+    "GET_WATCHES",
+    "REMOVE_WATCH",
+    "GET_BUS_SERVICES_AT_STOP",
+    "GET_STOPS_BETWEEN",
+    "SHOW_BUS_ROUTE",
+    "GET_BUS_STOP_NAME_FROM_CODE",
+    "GET_BUS_STOP_CODE_FROM_NAME",
+    "SET_BUS_STOP_CODE_FROM_CODE",
+    "SET_BUS_STOP_CODE_FROM_NAME",
+    "SET_BUS_SERVICE_NO",
+    "GET_BUS_STOP_CODE",
+    "GET_BUS_SERVICE_NUMBER",
+]
+
+
+@pytest.fixture(scope="module")
+def router():
+    return IntentRouter({intent: {} for intent in INTENTS})
+
+
+@pytest.mark.parametrize(
+    "text, intent, args",
+    [
+        ("199", "BUS_ARRIVAL", ["199"]),
+        ("27011", "BUS_ARRIVAL", ["", "27011"]),
+        ("199 at 27011", "BUS_ARRIVAL", ["199", "27011"]),
+        ("when is 199 coming", "BUS_ARRIVAL", ["199"]),
+        ("when is 199 coming at 27011", "BUS_ARRIVAL", ["199", "27011"]),
+        ("When is the next 179 arriving at boon lay int?", "BUS_ARRIVAL", ["179", "boon lay int"]),
+        ("when will 199 arrive?", "BUS_ARRIVAL", ["199"]),
+        ("how long for 179a", "BUS_ARRIVAL", ["179a"]),
+        ("eta 199", "BUS_ARRIVAL", ["199"]),
+        ("next 199 at 27011", "BUS_ARRIVAL", ["199", "27011"]),
+        ("is 199 coming soon?", "BUS_ARRIVAL", ["199"]),
+        ("when is my bus coming", "BUS_ARRIVAL", []),
+        ("remind me 5 min before", "SET_REMINDER", ["5", "true"]),
+        ("also remind me 10 mins before", "SET_REMINDER", ["10", "false"]),
+        ("Remind me 3 minutes before the bus arrives.", "SET_REMINDER", ["3", "true"]),
+        ("set a reminder for 2 mins", "SET_REMINDER", ["2", "true"]),
+        ("add another reminder 7 min before", "SET_REMINDER", ["7", "false"]),
+        ("show me the route of 199", "SHOW_BUS_ROUTE", ["199"]),
+        ("199 route", "SHOW_BUS_ROUTE", ["199"]),
+        ("what is the name of 27011", "GET_BUS_STOP_NAME_FROM_CODE", ["27011"]),
+        ("notify me about 199 at 27011 every weekday 07:30-08:30", "SET_WATCH", ["199", "27011", "07:30-08:30", "weekday"]),
+        ("remove watch 3f2a1c", "REMOVE_WATCH", ["3f2a1c"]),
+    ],
+)
+def test_routes(router, text, intent, args):
+    assert router.route(text) == (intent, args)
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        # Numbers near arrival words that are not bus services
+        "i'm coming home at 6",
+        "next 2 buses",
+        "next 3 buses at 27011",
+        "I will be late, my bus 199 is not coming",
+        "when I was 12 the bus came every day",
+        "my friend is coming at 7",
+        "what time is it",
+        # Reminders that are not about the bus
+        "remind me to call mom in 10 minutes",
+        "i have a reminder for my meeting in 10 mins",
+        "remind me in 5 min",
+        "can you remind me 10 mins before my class",
+        # Route as an ordinary word
+        "what's the best route to NTU?",
+        "is there a route that avoids the PIE",
+        "I need 2 route options",
+        # Chit-chat
+        "hi there",
+        "tell me a joke",
+        "thanks!",
+    ],
+)
+def test_leaves_other_messages_to_the_llm(router, text):
+    assert router.route(text) == (None, None)
@@ -0,0 +1,26 @@
+import time
+from llm import ResponseCache
+
+
+def test_response_cache_trims_the_file_in_batches(tmp_path):
+    file_path = str(tmp_path / "llm_cache.db")
+    cache = ResponseCache(max_entries=10, file_path=file_path, max_disk_entries=500, trim_every=100)
+    start = time.perf_counter()
+    for i in range(2000):
+        cache.put(f"key{i}", f"reply {i}")
+    # put only queues the write
+    assert time.perf_counter() - start < 0.5
+    cache.flush()
+    with cache._lock:
+        rows = cache._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+    assert rows <= 500 + 100
+    # Memory misses fall back to the file, newest entries kept
+    assert cache.get("key1999") == "reply 1999"
+    assert cache.get("key0") is None
+    cache.close()
+
+    cache = ResponseCache(file_path=file_path)
+    assert cache.get("key1990") == "reply 1990"
+    cache.clear()
+    assert cache.get("key1990") is None
+    cache.close()
@@ -0,0 +1,31 @@
+import asyncio
+import pytest
+from aiohttp import web
+from lta_client import LtaClient, LtaError
+
+
+def test_non_json_body_raises_lta_error():
+    calls = []
+
+    async def html_page(request):
+        calls.append(request)
+        return web.Response(text="<html>Service Unavailable</html>", content_type="text/html")
+
+    async def main():
+        app = web.Application()
+        app.router.add_get("/v3/BusArrival", html_page)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = runner.addresses[0][1]
+        client = LtaClient(api_key="x", base_url=f"http://127.0.0.1:{port}", retries=2, backoff=0.0)
+        try:
+            with pytest.raises(LtaError):
+                await client.bus_arrival("27011")
+        finally:
+            await client.close()
+            await runner.cleanup()
+
+    asyncio.run(main())
+    assert len(calls) == 2
@@ -0,0 +1,73 @@
+import time
+import asyncio
+from outbox import Outbox, MessageStream
+
+
+class Bot:
+    def __init__(self):
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        self.sent.append((chat_id, text))
+
+
+def test_send_message_keeps_max_in_flight():
+    bot = Bot()
+
+    async def main():
+        outbox = Outbox(global_rate=1e9, chat_burst=1000, max_in_flight=4)
+        await asyncio.gather(*[outbox.send_message(bot, chat_id, "hi") for chat_id in range(50)])
+
+    asyncio.run(main())
+    assert len(bot.sent) == 50
+    assert bot.max_in_flight == 4
+
+
+class Message:
+    chat_id = 1
+
+    def __init__(self, bot):
+        self.bot = bot
+
+    async def edit_text(self, text, **kwargs):
+        await asyncio.sleep(0.05)
+        self.bot.edits.append(text)
+
+
+class Update:
+    def __init__(self, bot):
+        self.bot = bot
+        self.effective_chat = None
+        self.message = self
+
+    async def reply_text(self, text, **kwargs):
+        await asyncio.sleep(0.05)
+        self.bot.replies.append(text)
+        return Message(self.bot)
+
+
+def test_message_stream_update_does_not_wait_on_telegram():
+    bot = Bot()
+    bot.edits, bot.replies = [], []
+
+    async def main():
+        stream = MessageStream(Outbox(global_rate=1e9, chat_burst=1000), Update(bot), min_interval=0.02)
+        reply = ""
+        start = time.perf_counter()
+        for word in ["Hello", " there", ",", " how", " are", " you?"]:
+            reply += word
+            await stream.update(reply)
+            await asyncio.sleep(0.001)
+        assert time.perf_counter() - start < 0.04
+        assert stream.started
+        await stream.finish(reply)
+
+    asyncio.run(main())
+    assert bot.replies == ["Hello"]
+    assert bot.edits[-1] == "Hello there, how are you?"
@@ -0,0 +1,49 @@
+import os
+import asyncio
+
+from profiler import HandlerProfiler
+
+
+def test_stop_writes_results_off_the_loop(tmp_path):
+    async def handler():
+        await asyncio.sleep(0.01)
+        return 42
+
+    async def main():
+        profiler = HandlerProfiler(str(tmp_path))
+        wrapped = profiler.wrap("handler", handler)
+        profiler.start(60.0)
+        assert await wrapped() == 42
+        result_dir = profiler.stop()
+        assert not profiler.active
+        # The results are written by a worker thread, once the loop gets to run it
+        assert not os.path.exists(os.path.join(result_dir, "summary.txt"))
+        assert not os.path.exists(os.path.join(result_dir, "handler.allocations.txt"))
+        await profiler.wait_written()
+        return result_dir
+
+    result_dir = asyncio.run(main())
+    assert {"summary.txt", "handler.prof", "handler.txt", "handler.allocations.txt", "allocations.snapshot"} <= set(
+        os.listdir(result_dir)
+    )
+
+
+def test_call_finishing_after_stop_is_not_recorded(tmp_path):
+    async def handler(event):
+        await event.wait()
+
+    async def main():
+        profiler = HandlerProfiler(str(tmp_path))
+        wrapped = profiler.wrap("handler", handler)
+        profiler.start(60.0)
+        event = asyncio.Event()
+        task = asyncio.create_task(wrapped(event))
+        await asyncio.sleep(0)
+        result_dir = profiler.stop()
+        event.set()
+        await task
+        await profiler.wait_written()
+        return result_dir
+
+    result_dir = asyncio.run(main())
+    assert "handler.prof" not in os.listdir(result_dir)
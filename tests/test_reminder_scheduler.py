@@ -0,0 +1,126 @@
+import time
+import random
+import asyncio
+from reminder_scheduler import ReminderScheduler
+
+
+async def noop(batch):
+    pass
+
+
+def test_pops_due_jobs_in_fire_order():
+    async def main():
+        scheduler = ReminderScheduler(noop, tick=0.0)
+        rng = random.Random(0)
+        fire_times = [rng.uniform(1000.0, 2000.0) for _ in range(200)]
+        for i, fire_at in enumerate(fire_times):
+            scheduler.schedule(i, fire_at, fire_at)
+        await scheduler.stop()
+        return scheduler, fire_times
+
+    scheduler, fire_times = asyncio.run(main())
+    assert scheduler._pop_due(1500.0) == sorted(t for t in fire_times if t <= 1500.0)
+    assert scheduler._pop_due(2000.0) == sorted(t for t in fire_times if t > 1500.0)
+    assert len(scheduler) == 0
+
+
+def test_cancel_and_reschedule():
+    async def main():
+        scheduler = ReminderScheduler(noop, tick=0.0)
+        scheduler.schedule("a", 1000.0, "a", chat_id=1)
+        scheduler.schedule("b", 2000.0, "b", chat_id=1)
+        scheduler.schedule("c", 3000.0, "c", chat_id=2)
+        assert scheduler.cancel("a")
+        assert not scheduler.cancel("a")
+        assert scheduler.reschedule("c", 500.0)
+        assert not scheduler.reschedule("missing", 500.0)
+        await scheduler.stop()
+        return scheduler
+
+    scheduler = asyncio.run(main())
+    assert "a" not in scheduler
+    assert scheduler.fire_at("c") == 500.0
+    assert scheduler._pop_due(5000.0) == ["c", "b"]
+
+
+def test_schedule_replaces_the_same_job():
+    async def main():
+        scheduler = ReminderScheduler(noop, tick=0.0)
+        scheduler.schedule("a", 1000.0, "old", chat_id=1)
+        scheduler.schedule("a", 2000.0, "new", chat_id=2)
+        await scheduler.stop()
+        return scheduler
+
+    scheduler = asyncio.run(main())
+    assert len(scheduler) == 1
+    assert scheduler.cancel_chat(1) == 0
+    assert scheduler._pop_due(5000.0) == ["new"]
+
+
+def test_cancel_chat():
+    async def main():
+        scheduler = ReminderScheduler(noop, tick=0.0)
+        scheduler.schedule_many([(i, 1000.0 + i, i, i % 3) for i in range(30)])
+        await scheduler.stop()
+        return scheduler
+
+    scheduler = asyncio.run(main())
+    assert scheduler.cancel_chat(0) == 10
+    assert scheduler.cancel_chat(0) == 0
+    assert sorted(scheduler.job_ids()) == [i for i in range(30) if i % 3 != 0]
+    assert scheduler._pop_due(5000.0) == [i for i in range(30) if i % 3 != 0]
+
+
+def test_compacts_dead_entries():
+    async def main():
+        scheduler = ReminderScheduler(noop, tick=0.0)
+        scheduler.schedule_many([(i, 1000.0 + i, i, None) for i in range(3000)])
+        for i in range(2000):
+            scheduler.cancel(i)
+        await scheduler.stop()
+        return scheduler
+
+    scheduler = asyncio.run(main())
+    assert len(scheduler._heap) < 3000
+    assert scheduler._pop_due(10000.0) == list(range(2000, 3000))
+
+
+def test_fires_jobs_due_together_in_one_batch():
+    batches = []
+
+    async def callback(batch):
+        batches.append(sorted(batch))
+
+    async def main():
+        scheduler = ReminderScheduler(callback, tick=0.05)
+        now = time.time()
+        scheduler.schedule_many([(i, now + 0.1 + i * 0.001, i, None) for i in range(5)])
+        scheduler.schedule("late", now + 0.3, "late")
+        await asyncio.sleep(0.5)
+        await scheduler.stop()
+        return scheduler
+
+    scheduler = asyncio.run(main())
+    assert batches == [[0, 1, 2, 3, 4], ["late"]]
+    assert scheduler.fired == 6
+
+
+def test_earlier_job_wakes_the_loop():
+    fired = []
+
+    async def callback(batch):
+        fired.extend((payload, time.time()) for payload in batch)
+
+    async def main():
+        scheduler = ReminderScheduler(callback)
+        now = time.time()
+        scheduler.schedule("later", now + 10.0, "later")
+        await asyncio.sleep(0.01)
+        scheduler.schedule("sooner", now + 0.1, "sooner")
+        await asyncio.sleep(0.3)
+        await scheduler.stop()
+        return now
+
+    now = asyncio.run(main())
+    assert [payload for payload, _ in fired] == ["sooner"]
+    assert fired[0][1] - now < 0.25
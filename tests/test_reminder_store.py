@@ -0,0 +1,66 @@
+from arrival_refresher import TrackedReminder
+from reminder_store import ReminderStore
+
+
+def reminder(job_id, chat_id=1, mins_left=5.0, est_arrival=10000.0):
+    return TrackedReminder(job_id, chat_id, "199", "27011", mins_left, est_arrival)
+
+
+def test_load_pending_soonest_first():
+    store = ReminderStore()
+    store.add_many([reminder("a", est_arrival=3000.0), reminder("b", est_arrival=2000.0)])
+    # Arrives after b but fires first, at 1600
+    store.add(reminder("c", mins_left=10.0, est_arrival=2200.0))
+    pending = store.load_pending()
+    assert [r.job_id for r in pending] == ["c", "b", "a"]
+    assert (pending[0].chat_id, pending[0].bus_service_no, pending[0].bus_stop_code) == (1, "199", "27011")
+    assert (pending[0].mins_left, pending[0].est_arrival) == (10.0, 2200.0)
+    store.close()
+
+
+def test_add_replaces_the_same_job():
+    store = ReminderStore()
+    store.add(reminder("a", est_arrival=1000.0))
+    store.add(reminder("a", est_arrival=2000.0))
+    assert len(store) == 1
+    assert store.load_pending()[0].est_arrival == 2000.0
+    store.close()
+
+
+def test_update_moves_the_fire_time():
+    store = ReminderStore()
+    store.add_many([reminder("a", est_arrival=1000.0), reminder("b", est_arrival=2000.0)])
+    moved = reminder("a", est_arrival=3000.0)
+    store.update(moved)
+    assert [(r.job_id, r.est_arrival) for r in store.load_pending()] == [("b", 2000.0), ("a", 3000.0)]
+    store.close()
+
+
+def test_remove():
+    store = ReminderStore()
+    store.add_many([reminder("a", chat_id=1), reminder("b", chat_id=1), reminder("c", chat_id=2)])
+    store.remove("a")
+    store.remove("missing")
+    assert sorted(r.job_id for r in store.load_pending()) == ["b", "c"]
+    store.remove_chat(1)
+    assert [r.job_id for r in store.load_pending()] == ["c"]
+    store.close()
+
+
+def test_remove_arrived():
+    store = ReminderStore()
+    store.add_many([reminder("a", est_arrival=1000.0), reminder("b", est_arrival=2000.0)])
+    assert store.remove_arrived(before=1500.0) == 1
+    assert [r.job_id for r in store.load_pending()] == ["b"]
+    store.close()
+
+
+def test_survives_a_restart(tmp_path):
+    file_path = str(tmp_path / "reminders.db")
+    store = ReminderStore(file_path)
+    store.add_many([reminder("a", chat_id=7), reminder("b", chat_id=8, est_arrival=20000.0)])
+    store.close()
+
+    store = ReminderStore(file_path)
+    assert [(r.job_id, r.chat_id) for r in store.load_pending()] == [("a", 7), ("b", 8)]
+    store.close()
@@ -0,0 +1,84 @@
+import os
+import zlib
+import struct
+import route_image
+from route_image import RouteImageCache, render_route_png
+from outbox import FileIdCache
+
+ROUTES = [
+    [(1.3553, 103.6861), (1.3447, 103.6872), (1.3393, 103.7055)],
+    [(1.3393, 103.7055), (1.3553, 103.6861)],
+]
+
+
+def decode_png(png):
+    # Returns (width, height, rows of RGB bytes) of an 8-bit RGB PNG
+    assert png[:8] == b"\x89PNG\r\n\x1a\n"
+    chunks = {}
+    pos = 8
+    while pos < len(png):
+        (length,) = struct.unpack(">I", png[pos : pos + 4])
+        tag, data = png[pos + 4 : pos + 8], png[pos + 8 : pos + 8 + length]
+        assert struct.unpack(">I", png[pos + 8 + length : pos + 12 + length])[0] == zlib.crc32(tag + data)
+        chunks[tag] = data
+        pos += 12 + length
+    width, height, depth, colour_type = struct.unpack(">IIBB", chunks[b"IHDR"][:10])
+    assert (depth, colour_type) == (8, 2) and b"IEND" in chunks
+    raw = zlib.decompress(chunks[b"IDAT"])
+    assert len(raw) == height * (1 + 3 * width)
+    return width, height, [raw[y * (1 + 3 * width) + 1 : (y + 1) * (1 + 3 * width)] for y in range(height)]
+
+
+def test_render_route_png():
+    width, height, rows = decode_png(render_route_png(ROUTES, width=200, height=100))
+    assert (width, height) == (200, 100)
+    pixels = {bytes(row[i : i + 3]) for row in rows for i in range(0, len(row), 3)}
+    assert bytes(route_image.BACKGROUND) in pixels
+    assert bytes(route_image.ROUTE_COLOURS[0]) in pixels
+    assert bytes(route_image.ROUTE_COLOURS[1]) in pixels
+    assert bytes(route_image.START_COLOUR) in pixels
+
+
+def test_render_without_stops():
+    _, _, rows = decode_png(render_route_png([], width=10, height=10))
+    assert all(row == bytes(route_image.BACKGROUND) * 10 for row in rows)
+    decode_png(render_route_png([[(1.35, 103.8)]], width=10, height=10))
+
+
+def test_cache_renders_a_route_once(tmp_path):
+    cache = RouteImageCache(str(tmp_path))
+    file_path = cache.get("199", ROUTES)
+    assert cache.get("199", ROUTES) == file_path
+    assert cache.rendered == 1
+    with open(file_path, "rb") as f:
+        assert f.read() == render_route_png(ROUTES)
+
+    # Another cache over the same directory reuses the file
+    assert RouteImageCache(str(tmp_path)).get("199", ROUTES) == file_path
+    assert os.listdir(tmp_path) == [os.path.basename(file_path)]
+
+
+def test_cache_renders_changed_routes_anew(tmp_path, monkeypatch):
+    cache = RouteImageCache(str(tmp_path))
+    file_path = cache.get("199", ROUTES)
+    moved = [ROUTES[0][:-1] + [(1.3394, 103.7055)], ROUTES[1]]
+    assert cache.get("199", moved) != file_path
+    assert cache.get("179", ROUTES) != file_path
+
+    monkeypatch.setattr(route_image, "RENDER_VERSION", route_image.RENDER_VERSION + 1)
+    assert cache.get("199", ROUTES) != file_path
+    assert cache.rendered == 4
+
+
+def test_file_ids_survive_a_restart(tmp_path):
+    image_path = RouteImageCache(str(tmp_path)).get("199", ROUTES)
+    key = FileIdCache.key_of(image_path)
+    file_ids = FileIdCache(str(tmp_path / "file_ids.db"))
+    file_ids.put(key, "file-1")
+    file_ids.close()
+
+    file_ids = FileIdCache(str(tmp_path / "file_ids.db"))
+    assert file_ids.get(key) == "file-1"
+    file_ids.remove(key)
+    assert file_ids.get(key) is None
+    file_ids.close()
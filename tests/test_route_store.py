@@ -0,0 +1,80 @@
+import time
+import asyncio
+import pytest
+from lta_client import LtaClient
+from route_store import RouteStore, RouteRefresher, get_route_store
+from fake_datamall import FakeDataMall
+
+ROUTES = {
+    ("199", 1): ["27011", "27199", "22009"],
+    ("199", 2): ["22009", "27199", "27011"],
+    ("179A", 1): ["27011", "27211"],
+    ("10", 1): ["27199", "27011", "27199", "22009"],
+}
+
+
+@pytest.fixture
+def store():
+    return RouteStore.from_routes(ROUTES, {("199", 1): [0.0, 0.5, 1.5]})
+
+
+def test_lookups(store):
+    assert store.services() == ["10", "179A", "199"]
+    assert store.route("199", 2) == ("22009", "27199", "27011")
+    assert store.route("199", 3) == ()
+    assert list(store.distances("199")) == [0.0, 0.5, 1.5]
+    assert store.services_at("27011") == ("10", "179A", "199")
+    assert store.services_at("99999") == () and store.services_at("abc") == ()
+    assert store.serves("179a", "27211") and not store.serves("199", "27211")
+    assert "179a" in store and "243G" not in store
+
+
+def test_stops_between_takes_the_shortest_stretch(store):
+    assert store.stops_between("199", "27011", "22009") == ("27011", "27199", "22009")
+    assert store.stops_between("199", "22009", "27011") == ("22009", "27199", "27011")
+    assert store.stops_between("10", "27199", "22009") == ("27199", "22009")
+    assert store.stops_between("179A", "27211", "27011") == ()
+
+
+def test_file_round_trip(store, tmp_path):
+    store.source, store.fetched_at = "http://datamall", 1700000000.0
+    file_path = str(tmp_path / "bus_routes.bin")
+    store.write(file_path)
+    read = RouteStore.read(file_path)
+    assert read.services() == store.services()
+    assert all(read.route(*key) == store.route(*key) for key in ROUTES)
+    assert read.services_at("27199") == store.services_at("27199")
+    assert (read.source, read.fetched_at) == ("http://datamall", 1700000000.0)
+
+    with open(file_path, "r+b") as f:
+        f.truncate(100)
+    assert RouteStore.read(file_path) is None
+    assert RouteStore.read(str(tmp_path / "missing.bin")) is None
+
+
+def test_routes_are_refetched_when_stale_or_of_another_datamall(tmp_path):
+    file_path = str(tmp_path / "bus_routes.bin")
+    fake = FakeDataMall(route_count=5)
+
+    async def main():
+        client = LtaClient(base_url=await fake.start())
+        refresher = RouteRefresher(client, file_path, max_age=3600.0)
+        try:
+            # Nothing fetched yet, only the hand-made routes next to the file, if any
+            stale = [refresher.is_stale()]
+            store = await refresher.refresh()
+            stale.append(refresher.is_stale())
+            store.fetched_at = time.time() - 7200.0
+            stale.append(refresher.is_stale())
+            store.fetched_at = time.time()
+            stale.append(RouteRefresher(LtaClient(base_url="http://other"), file_path).is_stale())
+        finally:
+            await client.close()
+            await fake.stop()
+        return store, stale
+
+    store, stale = asyncio.run(main())
+    assert stale == [True, False, True, True]
+    assert get_route_store(file_path) is store
+    assert "904" in store
+    assert RouteStore.read(file_path).source == store.source
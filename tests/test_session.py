@@ -0,0 +1,52 @@
+import time
+from session import Session, SessionStore, SqliteSessionBackend
+
+
+def test_evict_expired_drops_idle_sessions():
+    store = SessionStore("199", "27011", [5.0], ttl=100)
+    for chat_id in range(3):
+        store.get(chat_id)
+    store.get(0).last_seen = time.time() - 200
+    store._sessions.move_to_end(0, last=False)
+    assert store.evict_expired() == 1
+    assert 0 not in store and len(store) == 2
+
+
+def test_close_keeps_last_seen_and_est_arrivals(tmp_path):
+    file_path = str(tmp_path / "sessions.db")
+    store = SessionStore("199", "27011", [5.0], backend=SqliteSessionBackend(file_path))
+    session = store.get(1)
+    session.est_arrivals = (int(time.time()) + 600,)
+    store.close()
+
+    store = SessionStore("199", "27011", [5.0], backend=SqliteSessionBackend(file_path))
+    restored = store.get(1)
+    assert restored.est_arrivals == session.est_arrivals
+    store.close()
+
+
+def test_sweep_keeps_rows_of_sessions_still_in_use(tmp_path):
+    backend = SqliteSessionBackend(str(tmp_path / "sessions.db"))
+    store = SessionStore("199", "27011", [5.0], backend=backend, ttl=100)
+    store.get(1).bus_service_no = "179"
+    # Saved long ago, read ever since without being modified
+    backend.save(Session(1, "179", "27011", [5.0], last_seen=time.time() - 200))
+    assert store.evict_expired() == 0
+    backend.flush()
+    assert backend.load(1).bus_service_no == "179"
+    store.close()
+
+
+def test_saves_are_committed_by_the_writer_thread(tmp_path):
+    backend = SqliteSessionBackend(str(tmp_path / "sessions.db"))
+    store = SessionStore("199", "27011", [5.0], backend=backend, max_sessions=10)
+    for chat_id in range(100):
+        session = store.get(chat_id)
+        session.bus_service_no = str(chat_id)
+        store.save(session)
+    # Evicted and queued, loaded back with the queued writes
+    assert 0 not in store
+    assert store.get(0).bus_service_no == "0"
+    store.remove(5)
+    assert backend.load(5) is None
+    store.close()
@@ -0,0 +1,43 @@
+import time
+import asyncio
+import pytest
+from watch_table import Watch, WatchTable, EVERY_DAY
+from watch_scheduler import WatchScheduler
+
+
+@pytest.mark.parametrize("bucket_mins", [0, -5, 7])
+def test_bucket_mins_must_divide_an_hour(bucket_mins):
+    with pytest.raises(ValueError):
+        WatchScheduler(WatchTable(), None, bucket_mins=bucket_mins)
+
+
+def test_bucket_is_pushed_once_when_woken_early():
+    scheduler = WatchScheduler(WatchTable(), None, bucket_mins=1)
+    buckets = []
+
+    async def run_bucket(timestamp):
+        buckets.append(timestamp)
+
+    async def main():
+        # As if the sleep ended just before the boundary, every time
+        boundary = time.time() + 0.05
+        scheduler.next_bucket = lambda now=None: boundary
+        scheduler.run_bucket = run_bucket
+        scheduler.start()
+        await asyncio.sleep(0.2)
+        await scheduler.stop()
+        return boundary
+
+    boundary = asyncio.run(main())
+    assert buckets == [boundary]
+
+
+def test_due_groups_by_stop():
+    table = WatchTable(capacity=1)
+    table.add(Watch("a", 1, "199", "27011", EVERY_DAY, 0, 23 * 60 + 59))
+    table.add(Watch("b", 2, "179", "27011", EVERY_DAY, 0, 23 * 60 + 59))
+    table.add(Watch("c", 2, "179", "22009", EVERY_DAY, 0, 0))
+    due = table.due(time.time())
+    assert [watch.watch_id for watch in due["27011"]] == ["a", "b"]
+    assert table.remove_chat(2)[0].watch_id == "b"
+    assert len(table) == 1
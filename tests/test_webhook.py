@@ -0,0 +1,103 @@
+import asyncio
+import aiohttp
+from telegram import Chat, Message, Update
+from telegram.ext import Application
+from webhook import SECRET_TOKEN_HEADER, ChatOrderedUpdateProcessor, WebhookServer
+from fake_telegram import BOT_TOKEN, FakeTelegramApi, make_update as fake_update
+
+
+def make_update(update_id, chat_id):
+    chat = Chat(chat_id, "private")
+    return Update(update_id, message=Message(update_id, None, chat, text="hi"))
+
+
+def test_busy_chat_does_not_stall_other_chats():
+    done = []
+
+    async def handle(update, delay):
+        await asyncio.sleep(delay)
+        done.append(update.effective_chat.id)
+
+    async def main():
+        processor = ChatOrderedUpdateProcessor(4)
+        # Chat 1 sends far more updates than there are slots, chat 2 one right after
+        tasks = [
+            asyncio.create_task(processor.process_update(update, handle(update, 0.01)))
+            for update in [make_update(i, 1) for i in range(40)]
+        ]
+        await asyncio.sleep(0)
+        other = make_update(100, 2)
+        tasks.append(asyncio.create_task(processor.process_update(other, handle(other, 0.0))))
+        await asyncio.gather(*tasks)
+
+    asyncio.run(main())
+    # Not behind chat 1's backlog
+    assert done.index(2) <= 1
+
+
+def test_updates_of_one_chat_stay_in_order():
+    done = []
+
+    async def handle(update, delay):
+        await asyncio.sleep(delay)
+        done.append(update.update_id)
+
+    async def main():
+        processor = ChatOrderedUpdateProcessor(4)
+        await asyncio.gather(
+            *[processor.process_update(make_update(i, 1), handle(make_update(i, 1), 0.01 * (5 - i))) for i in range(5)]
+        )
+
+    asyncio.run(main())
+    assert done == [0, 1, 2, 3, 4]
+
+
+def test_server_rejects_bad_secrets_and_malformed_bodies():
+    api = FakeTelegramApi()
+    secret = {SECRET_TOKEN_HEADER: "s3"}
+
+    async def main():
+        application = (
+            Application.builder().token(BOT_TOKEN).base_url(await api.start() + "/bot").updater(None).build()
+        )
+        server = WebhookServer(application, "127.0.0.1", 0, secret_token="s3")
+        statuses = []
+        async with application:
+            url = f"http://127.0.0.1:{await server.start()}"
+            async with aiohttp.ClientSession() as session:
+                async with session.get(url + "/healthz") as response:
+                    statuses.append(("healthz stopped", response.status))
+                await application.start()
+                async with session.post(url + "/telegram", json=fake_update(1, 5)) as response:
+                    statuses.append(("no secret", response.status))
+                async with session.post(url + "/telegram", json=fake_update(2, 5), headers={SECRET_TOKEN_HEADER: "x"}) as response:
+                    statuses.append(("wrong secret", response.status))
+                for body in ["x{", "[]", '"x"', "{}", '{"update_id": 3, "message": []}']:
+                    async with session.post(url + "/telegram", data=body, headers=secret) as response:
+                        statuses.append((body, response.status))
+                async with session.post(url + "/telegram", json=fake_update(4, 5), headers=secret) as response:
+                    statuses.append(("ok", response.status))
+                async with session.get(url + "/healthz") as response:
+                    statuses.append(("healthz", response.status))
+                    health = await response.json()
+                await server.stop()
+                await application.stop()
+        await api.stop()
+        return statuses, health
+
+    statuses, health = asyncio.run(main())
+    assert dict(statuses) == {
+        "healthz stopped": 503,
+        "no secret": 403,
+        "wrong secret": 403,
+        "x{": 400,
+        "[]": 400,
+        '"x"': 400,
+        "{}": 400,
+        '{"update_id": 3, "message": []}': 400,
+        "ok": 200,
+        "healthz": 200,
+    }
+    assert health["status"] == "ok"
+    assert health["received"] == 1
+    assert health["rejected"] == 7